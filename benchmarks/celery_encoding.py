@@ -0,0 +1,91 @@
+"""
+Compara el costo de codificar un mensaje de Celery con la implementación
+anterior (dos `json.dumps` y diccionarios nuevos en cada mensaje) contra la
+plantilla precalculada de `fast_agave.tasks.sqs_celery_client`.
+
+python -m benchmarks.celery_encoding
+"""
+import json
+import timeit
+from base64 import b64encode
+from typing import Dict, Iterable, List, Tuple
+from uuid import uuid4
+
+from fast_agave.tasks.sqs_celery_client import _build_celery_message
+
+NUMBER = 20_000
+
+
+def _b64_encode(value: str) -> str:
+    encoded = b64encode(bytes(value, 'utf-8'))
+    return encoded.decode('utf-8')
+
+
+def legacy_build_celery_message(
+    task_name: str, args_: Iterable, kwargs_: Dict
+) -> str:
+    task_id = str(uuid4())
+    message = dict(
+        properties=dict(
+            correlation_id=task_id,
+            content_type='application/json',
+            content_encoding='utf-8',
+            body_encoding='base64',
+            delivery_info=dict(exchange='', routing_key='celery'),
+        ),
+        headers=dict(
+            lang='py',
+            task=task_name,
+            id=task_id,
+            root_id=task_id,
+            parent_id=None,
+            group=None,
+        ),
+        body=_b64_encode(
+            json.dumps(
+                (
+                    args_,
+                    kwargs_,
+                    dict(
+                        callbacks=None, errbacks=None, chain=None, chord=None
+                    ),
+                )
+            )
+        ),
+    )
+    message['content-encoding'] = 'utf-8'
+    message['content-type'] = 'application/json'
+    return _b64_encode(json.dumps(message))
+
+
+CASES: List[Tuple[str, Tuple, Dict]] = [
+    ('sin argumentos', (), {}),
+    ('args cortos', (10, 'foo'), dict(hola='mundo')),
+    (
+        'kwargs grandes',
+        (),
+        dict(items=[dict(id=f'TR{i:04}', amount=i * 100) for i in range(50)]),
+    ),
+]
+
+
+def bench(func, args: Tuple, kwargs: Dict) -> float:
+    seconds = timeit.timeit(
+        lambda: func('some.task', args, kwargs), number=NUMBER
+    )
+    return seconds / NUMBER * 1_000_000
+
+
+def main() -> None:
+    print(f'{"case":<16} {"anterior":>12} {"plantilla":>12} {"x":>6}')
+    for name, args, kwargs in CASES:
+        before = bench(legacy_build_celery_message, args, kwargs)
+        after = bench(_build_celery_message, args, kwargs)
+        print(
+            f'{name:<16} {before:>9.1f} us {after:>9.1f} us '
+            f'{before / after:>5.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Mide la latencia (p50/p99) y el throughput de las rutas del blueprint REST
+usando la app de `examples` con mongomock: el stack de middlewares, retrieve,
+páginas de distintos tamaños, count, create y las respuestas de error.
+
+python -m benchmarks.rest_api
+python -m benchmarks.rest_api --save benchmarks/baseline.json
+python -m benchmarks.rest_api --compare benchmarks/baseline.json
+
+Los baselines dependen de la máquina, así que deben generarse y compararse
+en el mismo equipo.
+"""
+import argparse
+import datetime as dt
+import json
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi.testclient import TestClient
+
+from examples.app import app
+from examples.config import TEST_DEFAULT_PLATFORM_ID, TEST_DEFAULT_USER_ID
+from examples.models import Account
+
+NUMBER = 500
+WARMUP = 20
+ACCOUNTS = 1_000
+
+Request = Callable[[TestClient], Any]
+Result = Dict[str, float]
+
+
+def seed() -> str:
+    Account.objects.delete()
+    accounts = [
+        Account(
+            name=f'Account {i}',
+            user_id=TEST_DEFAULT_USER_ID,
+            platform_id=TEST_DEFAULT_PLATFORM_ID,
+            created_at=dt.datetime(2020, 1, 1) + dt.timedelta(minutes=i),
+        )
+        for i in range(ACCOUNTS)
+    ]
+    for account in accounts:
+        account.save()
+    return accounts[0].id
+
+
+def cases(account_id: str) -> List[Tuple[str, int, Request]]:
+    return [
+        ('middlewares', 200, lambda c: c.get('/')),
+        ('retrieve', 200, lambda c: c.get(f'/accounts/{account_id}')),
+        ('query 10', 200, lambda c: c.get('/accounts?page_size=10')),
+        ('query 50', 200, lambda c: c.get('/accounts?page_size=50')),
+        ('query 100', 200, lambda c: c.get('/accounts?page_size=100')),
+        ('count', 200, lambda c: c.get('/accounts?count=1')),
+        (
+            'create',
+            201,
+            lambda c: c.post('/accounts', json=dict(name='Frida Kahlo')),
+        ),
+        ('not found', 404, lambda c: c.get('/accounts/AC_unknown')),
+        ('invalid query', 422, lambda c: c.get('/accounts?wrong=1')),
+    ]
+
+
+def bench(client: TestClient, request: Request, status_code: int) -> Result:
+    for _ in range(WARMUP):
+        request(client)
+    latencies = []
+    for _ in range(NUMBER):
+        started_at = time.perf_counter()
+        response = request(client)
+        latencies.append(time.perf_counter() - started_at)
+        assert response.status_code == status_code, response.text
+    # 99 cuantiles: el índice 49 es p50 y el 98 es p99
+    quantiles = statistics.quantiles(latencies, n=100)
+    return dict(
+        rps=len(latencies) / sum(latencies),
+        p50=quantiles[49] * 1000,
+        p99=quantiles[98] * 1000,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--save', help='guarda los resultados en un JSON')
+    parser.add_argument('--compare', help='JSON con el baseline')
+    args = parser.parse_args(argv)
+
+    baseline: Dict[str, Result] = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    # Sin `with` para no arrancar los consumidores de SQS del ejemplo
+    client = TestClient(app)
+    account_id = seed()
+    results: Dict[str, Result] = {}
+    print(f'{"case":<14} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8}')
+    for name, status_code, request in cases(account_id):
+        result = results[name] = bench(client, request, status_code)
+        line = (
+            f'{name:<14} {result["rps"]:>8.0f} {result["p50"]:>8.2f} '
+            f'{result["p99"]:>8.2f}'
+        )
+        if name in baseline:
+            change = result['p50'] / baseline[name]['p50'] - 1
+            line += f' {change:>+7.1%} p50'
+        print(line)
+    Account.objects.delete()
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
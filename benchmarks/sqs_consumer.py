@@ -0,0 +1,192 @@
+"""
+Mide el throughput del consumidor de `fast_agave.tasks.sqs_tasks` contra un
+servidor local de moto. Para cada combinación de `max_concurrent_tasks`,
+latencia del handler y tamaño del payload llena un queue con `--messages`
+mensajes y reporta mensajes por segundo, llamadas a la API de SQS por
+mensaje y el tiempo hasta vaciar el queue.
+
+python -m benchmarks.sqs_consumer
+python -m benchmarks.sqs_consumer --messages 2000 --concurrency 10,50
+
+Sin `--endpoint-url` se arranca `moto_server` en un puerto libre. Las cifras
+absolutas reflejan la velocidad de moto; sirven para comparar versiones del
+consumidor en la misma máquina.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import time
+import urllib.request
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional
+from uuid import uuid4
+
+from fast_agave.tasks.batch import SQS_BATCH_SIZE
+from fast_agave.tasks.client_registry import sqs_client
+from fast_agave.tasks.producer import SQS_MAX_BATCH_BYTES
+from fast_agave.tasks.sqs_tasks import task
+
+REGION = 'us-east-1'
+
+
+def parse_list(value: str, type_=float) -> List:
+    return [type_(item) for item in value.split(',')]
+
+
+@contextmanager
+def moto_server() -> Iterator[str]:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    endpoint_url = f'http://127.0.0.1:{port}'
+    server = subprocess.Popen(
+        ['moto_server', 'sqs', '-p', str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(endpoint_url)
+                break
+            except OSError:
+                time.sleep(0.1)
+        yield endpoint_url
+    finally:
+        server.kill()
+        server.wait()
+
+
+async def fill_queue(sqs, queue_url: str, messages: int, payload: int) -> None:
+    body = json.dumps(dict(data='x' * payload))
+    # Cada `send_message_batch` lleva a lo más 10 mensajes y 256 KB
+    per_batch = max(
+        min(SQS_BATCH_SIZE, SQS_MAX_BATCH_BYTES // len(body.encode())), 1
+    )
+    batches = [
+        [
+            dict(Id=str(i), MessageBody=body)
+            for i in range(min(per_batch, messages - start))
+        ]
+        for start in range(0, messages, per_batch)
+    ]
+    for start in range(0, len(batches), 20):
+        await asyncio.gather(
+            *(
+                sqs.send_message_batch(QueueUrl=queue_url, Entries=entries)
+                for entries in batches[start : start + 20]
+            )
+        )
+
+
+async def run(
+    endpoint_url: str,
+    messages: int,
+    concurrency: int,
+    latency: float,
+    payload: int,
+    max_number_of_messages: int,
+) -> Dict[str, float]:
+    # El consumidor usa el mismo cliente compartido, así que los handlers
+    # registrados aquí cuentan también sus llamadas
+    async with sqs_client(REGION, endpoint_url) as sqs:
+        queue = await sqs.create_queue(QueueName=f'bench-{uuid4().hex}')
+        queue_url = queue['QueueUrl']
+        await fill_queue(sqs, queue_url, messages, payload)
+
+        calls: Counter = Counter()
+
+        def count_call(model, **_) -> None:
+            calls[model.name] += 1
+
+        sqs.meta.events.register('before-call.sqs', count_call)
+        processed = 0
+        done = asyncio.Event()
+
+        @task(
+            queue_url,
+            REGION,
+            wait_time_seconds=1,
+            visibility_timeout=300,
+            max_concurrent_tasks=concurrency,
+            endpoint_url=endpoint_url,
+            max_number_of_messages=max_number_of_messages,
+        )
+        async def handler(data: Dict) -> None:
+            nonlocal processed
+            if latency:
+                await asyncio.sleep(latency)
+            processed += 1
+            if processed >= messages:
+                done.set()
+
+        started_at = time.perf_counter()
+        consumer = asyncio.create_task(handler())
+        await done.wait()
+        # Al cancelarse, el consumidor espera a los tasks en vuelo, así que
+        # el tiempo incluye el borrado del último mensaje y el apagado
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        elapsed = time.perf_counter() - started_at
+        sqs.meta.events.unregister('before-call.sqs', count_call)
+        await sqs.delete_queue(QueueUrl=queue_url)
+
+    return dict(
+        rate=messages / elapsed,
+        calls=sum(calls.values()) / messages,
+        receives=calls['ReceiveMessage'] / messages,
+        drain=elapsed,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--concurrency', default='1,10,50')
+    parser.add_argument('--latency', default='0,0.01', help='segundos')
+    parser.add_argument('--payload', default='100,10000', help='bytes')
+    parser.add_argument('--max-number-of-messages', type=int, default=10)
+    parser.add_argument('--endpoint-url')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+    combinations = itertools.product(
+        parse_list(args.concurrency, int),
+        parse_list(args.latency),
+        parse_list(args.payload, int),
+    )
+    server = (
+        nullcontext(args.endpoint_url) if args.endpoint_url else moto_server()
+    )
+    with server as endpoint_url:
+        print(
+            f'{"concurrency":>11} {"latency":>8} {"payload":>8} '
+            f'{"msg/s":>8} {"calls/msg":>9} {"recv/msg":>8} {"drain s":>8}'
+        )
+        for concurrency, latency, payload in combinations:
+            result = asyncio.run(
+                run(
+                    endpoint_url,
+                    args.messages,
+                    concurrency,
+                    latency,
+                    payload,
+                    args.max_number_of_messages,
+                )
+            )
+            print(
+                f'{concurrency:>11} {latency:>8} {payload:>8} '
+                f'{result["rate"]:>8.0f} {result["calls"]:>9.2f} '
+                f'{result["receives"]:>8.2f} {result["drain"]:>8.2f}'
+            )
+
+
+if __name__ == '__main__':
+    main()
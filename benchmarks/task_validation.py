@@ -0,0 +1,86 @@
+"""
+Compara el costo de validar el body de un mensaje con `validate_arguments`
+de pydantic (implementación anterior) contra los parsers precompilados de
+`fast_agave.tasks.parsers`.
+
+python -m benchmarks.task_validation
+"""
+import timeit
+from typing import Callable, Dict, List, Literal, Tuple, Union
+
+from pydantic import BaseModel, validate_arguments
+
+from fast_agave.tasks.parsers import validated_task
+
+NUMBER = 20_000
+
+
+class User(BaseModel):
+    type: Literal['user']
+    id: str
+    name: str
+
+
+class Company(BaseModel):
+    type: Literal['company']
+    id: str
+    legal_name: str
+    rfc: str
+
+
+class Card(BaseModel):
+    type: Literal['card']
+    id: str
+    number: str
+
+
+async def dict_task(data: Dict) -> None:
+    ...
+
+
+async def model_task(data: User) -> None:
+    ...
+
+
+async def union_task(data: Union[User, Card, Company]) -> None:
+    ...
+
+
+CASES: List[Tuple[str, Callable, Dict]] = [
+    ('Dict', dict_task, dict(id='US01', name='Frida')),
+    ('Model', model_task, dict(type='user', id='US01', name='Frida')),
+    (
+        'Union[User, Card, Company]',
+        union_task,
+        dict(type='company', id='CO01', legal_name='Agave', rfc='AGA'),
+    ),
+]
+
+
+def run(func: Callable, body: Dict) -> None:
+    # Los tasks no esperan nada, así que basta un `send` para completarlos
+    # sin medir también el costo del event loop
+    try:
+        func(body).send(None)
+    except StopIteration:
+        pass
+
+
+def bench(func: Callable, body: Dict) -> float:
+    seconds = timeit.timeit(lambda: run(func, body), number=NUMBER)
+    return seconds / NUMBER * 1_000_000
+
+
+def main() -> None:
+    print(f'{"case":<28} {"validate_arguments":>20} {"parser":>10} {"x":>6}')
+    for name, func, body in CASES:
+        before = bench(validate_arguments(func), body)
+        after = bench(validated_task(func), body)
+        print(
+            f'{name:<28} {before:>17.1f} us {after:>7.1f} us '
+            f'{before / after:>5.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 import asyncio
-from typing import Dict
+from typing import Dict, List
 
 import mongomock as mongomock
 from mongoengine import connect
@@ -15,6 +15,7 @@ connect(
     mongo_client_class=mongomock.MongoClient,
 )
 app = FastAPI(title='example')
+consumers: List[asyncio.Task] = []
 app.include_router(resources)
 
 app.add_middleware(AuthedMiddleware)
@@ -30,5 +31,14 @@ async def iam_healty() -> Dict:
 async def on_startup() -> None:  # pragma: no cover
     # Inicializa el task que recibe mensajes
     # provenientes de SQS
-    asyncio.create_task(dummy_task())
-    asyncio.create_task(task_validator())
+    consumers.append(asyncio.create_task(dummy_task()))
+    consumers.append(asyncio.create_task(task_validator()))
+
+
+@app.on_event('shutdown')
+async def on_shutdown() -> None:  # pragma: no cover
+    # Al cancelar los consumidores se liberan los mensajes pendientes y se
+    # espera a que terminen los tasks en ejecución
+    for consumer in consumers:
+        consumer.cancel()
+    await asyncio.gather(*consumers, return_exceptions=True)
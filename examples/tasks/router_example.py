@@ -0,0 +1,35 @@
+from pydantic import BaseModel
+
+from fast_agave.tasks.router import TaskRouter
+from fast_agave.tasks.sqs_tasks import task
+
+# Esta URL es solo un mock de la queue.
+# Debes reemplazarla con la URL de tu queue
+QUEUE_URL = 'http://127.0.0.1:4000/123456789012/events.fifo'
+
+router = TaskRouter(discriminator='type')
+
+
+class UserCreated(BaseModel):
+    user_id: str
+
+
+class CardBlocked(BaseModel):
+    card_id: str
+    reason: str
+
+
+@router.handler('user.created')
+async def user_created(event: UserCreated) -> None:
+    print(event.user_id)
+
+
+@router.handler('card.blocked')
+async def card_blocked(event: CardBlocked) -> None:
+    print(event.card_id, event.reason)
+
+
+# Un solo consumidor para todos los tipos de mensaje del queue
+events_task = task(queue_url=QUEUE_URL, region_name='us-east-1')(
+    router.dispatch
+)
@@ -0,0 +1,32 @@
+import argparse
+import logging
+from typing import List, Optional
+
+from .tasks.worker import Supervisor, load_tasks
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='fast-agave')
+    commands = parser.add_subparsers(dest='command', required=True)
+    worker = commands.add_parser(
+        'worker', help='Ejecuta tasks de SQS sin el servidor web'
+    )
+    worker.add_argument(
+        'target', help='Tasks a ejecutar, p. ej. app.tasks:task_a,task_b'
+    )
+    worker.add_argument(
+        '--processes', type=int, default=1, help='Número de procesos'
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s'
+    )
+    if args.processes < 1:
+        parser.error('--processes must be at least 1')
+    try:
+        # Se importan antes de iniciar los procesos para fallar de inmediato
+        load_tasks(args.target)
+    except (ImportError, ValueError) as exc:
+        parser.error(str(exc))
+    Supervisor(args.target, args.processes).run()
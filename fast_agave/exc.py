@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Optional
 
 
 @dataclass
@@ -61,3 +61,17 @@ class ServiceUnavailableError(FastAgaveError):
 @dataclass
 class RetryTask(Exception):
     countdown: Optional[int] = None
+
+
+@dataclass
+class NoTaskHandlerError(Exception):
+    body: Any
+
+
+@dataclass
+class SendMessageError(Exception):
+    """Un mensaje que SQS rechazó dentro de un `send_message_batch`"""
+
+    code: str
+    message: str
+    sender_fault: bool
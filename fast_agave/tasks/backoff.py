@@ -0,0 +1,91 @@
+import asyncio
+import random
+from dataclasses import dataclass
+from itertools import count
+from typing import Awaitable, Callable, FrozenSet, TypeVar, Union
+
+from botocore.exceptions import ClientError
+from botocore.exceptions import ConnectionError as BotoConnectionError
+from botocore.exceptions import HTTPClientError
+
+T = TypeVar('T')
+
+
+@dataclass(frozen=True)
+class BackoffPolicy:
+    """
+    Backoff exponencial con "full jitter":
+    https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+
+    El jitter evita que todos los workers reintenten al mismo tiempo cuando
+    SQS o la red se degradan.
+    """
+
+    base: float = 1
+    cap: float = 30
+    jitter: bool = True
+
+    def delay(self, attempt: int) -> float:
+        # Se limita el exponente para no calcular potencias enormes cuando
+        # el número de intentos crece indefinidamente
+        delay = min(self.cap, self.base * 2 ** min(attempt, 32))
+        return random.uniform(0, delay) if self.jitter else delay
+
+
+# Errores de SQS que indican una falla temporal del servicio
+RETRYABLE_ERROR_CODES = frozenset(
+    {
+        'InternalError',
+        'InternalFailure',
+        'RequestThrottled',
+        'ServiceUnavailable',
+        'ThrottlingException',
+        'KMS.ThrottlingException',
+    }
+)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Reintentos al enviar mensajes. Se reintentan los errores de conexión y
+    las respuestas de SQS con un código en `retryable_codes`, hasta
+    completar `max_attempts` intentos en total. Con
+    `BackoffPolicy(jitter=False)` las esperas son deterministas.
+    """
+
+    max_attempts: int = 3
+    backoff: BackoffPolicy = BackoffPolicy(base=0.05, cap=2)
+    retryable_codes: FrozenSet[str] = RETRYABLE_ERROR_CODES
+
+    def is_retryable(self, error: Union[Exception, str]) -> bool:
+        if isinstance(error, str):
+            return error in self.retryable_codes
+        if isinstance(error, ClientError):
+            return error.response['Error']['Code'] in self.retryable_codes
+        # aiobotocore lanza las excepciones de botocore: los errores al
+        # conectar (`EndpointConnectionError`, `ConnectTimeoutError`)
+        # heredan de `botocore.exceptions.ConnectionError` y los errores de
+        # la conexión ya abierta (`ReadTimeoutError`) de `HTTPClientError`
+        return isinstance(
+            error,
+            (
+                BotoConnectionError,
+                HTTPClientError,
+                ConnectionError,
+                asyncio.TimeoutError,
+            ),
+        )
+
+    async def run(self, func: Callable[[], Awaitable[T]]) -> T:
+        """Ejecuta `func` reintentando los errores temporales"""
+        for attempt in count():
+            try:
+                return await func()
+            except Exception as exc:
+                if attempt + 1 >= self.max_attempts or not self.is_retryable(
+                    exc
+                ):
+                    raise
+                await asyncio.sleep(self.backoff.delay(attempt))
+        raise RuntimeError('unreachable')  # pragma: no cover
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Collection,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+)
+
+from pydantic import ValidationError
+
+from ..exc import RetryTask
+from .backoff import RetryPolicy
+from .dead_letter import DeadLetterSink, FailureReason, send_dead_letter
+from .metrics import TaskMetrics, TaskOutcome
+from .parsers import Parser
+
+logger = logging.getLogger(__name__)
+
+# Límite de entradas de SQS para las operaciones en batch
+SQS_BATCH_SIZE = 10
+
+
+@dataclass
+class BatchResult:
+    """
+    Lo que regresa un task en modo batch. `retry` son los índices (en la
+    lista que recibió el task) de los mensajes que deben reintentarse; los
+    demás se consideran exitosos y se borran del queue.
+    """
+
+    retry: Collection[int] = ()
+    countdown: Optional[int] = None
+
+
+async def _send_batch(
+    operation: Callable[..., Awaitable[Dict]],
+    queue_url: str,
+    entries: List[Dict],
+    retry_policy: RetryPolicy,
+) -> None:
+    """
+    Envía las entradas en grupos de 10 y reintenta las que SQS rechaza por
+    un error de su lado. Las que no se logran procesar solo se registran en
+    el log: el mensaje volverá a recibirse al terminar su visibility timeout
+    """
+    for start in range(0, len(entries), SQS_BATCH_SIZE):
+        pending = {
+            str(i): entry
+            for i, entry in enumerate(entries[start : start + SQS_BATCH_SIZE])
+        }
+        for attempt in range(retry_policy.max_attempts):
+            if attempt:
+                await asyncio.sleep(retry_policy.backoff.delay(attempt - 1))
+            response = await operation(
+                QueueUrl=queue_url,
+                Entries=[dict(Id=id_, **e) for id_, e in pending.items()],
+            )
+            retry = {}
+            for failure in response.get('Failed', []):
+                last_attempt = attempt + 1 >= retry_policy.max_attempts
+                if not failure['SenderFault'] and not last_attempt:
+                    retry[failure['Id']] = pending[failure['Id']]
+                    continue
+                logger.warning(
+                    'Batch entry failed on %s: %s %s',
+                    queue_url,
+                    failure['Code'],
+                    failure.get('Message', ''),
+                )
+            pending = retry
+            if not pending:
+                break
+
+
+async def delete_messages(
+    sqs,
+    queue_url: str,
+    receipt_handles: Iterable[str],
+    retry_policy: RetryPolicy = RetryPolicy(),
+) -> None:
+    await _send_batch(
+        sqs.delete_message_batch,
+        queue_url,
+        [dict(ReceiptHandle=handle) for handle in receipt_handles],
+        retry_policy,
+    )
+
+
+async def change_messages_visibility(
+    sqs,
+    queue_url: str,
+    receipt_handles: Iterable[str],
+    visibility_timeout: int,
+    retry_policy: RetryPolicy = RetryPolicy(),
+) -> None:
+    await _send_batch(
+        sqs.change_message_visibility_batch,
+        queue_url,
+        [
+            dict(ReceiptHandle=handle, VisibilityTimeout=visibility_timeout)
+            for handle in receipt_handles
+        ],
+        retry_policy,
+    )
+
+
+def receive_count(message: Dict) -> int:
+    return int(message['Attributes']['ApproximateReceiveCount'])
+
+
+async def run_batch_task(
+    task_func: Callable,
+    parse: Parser,
+    messages: List[Dict],
+    bodies: List[Any],
+    sqs,
+    queue_url: str,
+    max_retries: int,
+    metrics: Optional[TaskMetrics] = None,
+    dead_letter_sink: Optional[DeadLetterSink] = None,
+) -> None:
+    """
+    Ejecuta `task_func` con la lista de mensajes válidos. Los mensajes que no
+    pasan la validación se tratan como errores sin llamar al task. Los
+    borrados y cambios de visibilidad se hacen con las operaciones en batch
+    de SQS.
+
+    Si el task se cancela no se borra ningún mensaje para que el apagado
+    del consumidor pueda liberarlos.
+    """
+    to_delete: List[Dict] = []
+
+    async def dead_letter(index: int, reason: FailureReason) -> None:
+        message = messages[index]
+        # Si el mensaje no pudo guardarse no se borra para no perderlo
+        if dead_letter_sink:
+            try:
+                await send_dead_letter(
+                    dead_letter_sink,
+                    queue_url,
+                    message,
+                    receive_count(message),
+                    reason,
+                    bodies[index],
+                )
+            except Exception:
+                return
+        to_delete.append(message)
+
+    def record(outcome: TaskOutcome, seconds: float, times: int = 1) -> None:
+        if metrics:
+            for _ in range(times):
+                metrics.record_task(outcome, seconds)
+
+    now = time.time()
+    items: List[Any] = []
+    # Índices en `messages` de los mensajes que pasaron la validación
+    valid: List[int] = []
+    for index, (message, body) in enumerate(zip(messages, bodies)):
+        if metrics and 'SentTimestamp' in message['Attributes']:
+            sent_timestamp = int(message['Attributes']['SentTimestamp'])
+            metrics.record_lag(max(now - sent_timestamp / 1000, 0))
+        try:
+            items.append(parse(body))
+        except ValidationError:
+            record(TaskOutcome.error, 0)
+            await dead_letter(index, FailureReason.error)
+        else:
+            valid.append(index)
+
+    started_at = time.monotonic()
+    result: Optional[BatchResult] = None
+    try:
+        if items:
+            result = await task_func(items)
+    except RetryTask as retry:
+        result = BatchResult(range(len(valid)), retry.countdown)
+    except Exception:
+        record(TaskOutcome.error, time.monotonic() - started_at, len(valid))
+        for index in valid:
+            await dead_letter(index, FailureReason.error)
+        await delete_messages(
+            sqs, queue_url, (m['ReceiptHandle'] for m in to_delete)
+        )
+        raise
+    elapsed = time.monotonic() - started_at
+
+    retry_indexes = set(result.retry) if result else set()
+    to_retry: List[Dict] = []
+    for i, index in enumerate(valid):
+        message = messages[index]
+        if i not in retry_indexes:
+            record(TaskOutcome.ok, elapsed)
+            to_delete.append(message)
+        elif receive_count(message) >= max_retries + 1:
+            record(TaskOutcome.error, elapsed)
+            await dead_letter(index, FailureReason.max_retries)
+        else:
+            record(TaskOutcome.retry, elapsed)
+            to_retry.append(message)
+
+    await delete_messages(
+        sqs, queue_url, (m['ReceiptHandle'] for m in to_delete)
+    )
+    if result and result.countdown and result.countdown > 0:
+        await change_messages_visibility(
+            sqs,
+            queue_url,
+            (m['ReceiptHandle'] for m in to_retry),
+            result.countdown,
+        )
@@ -0,0 +1,95 @@
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Deque, Optional
+
+
+class CircuitState(str, Enum):
+    closed = 'closed'
+    open = 'open'
+    half_open = 'half_open'
+
+
+@dataclass
+class CircuitBreaker:
+    """
+    Se abre cuando la proporción de errores en los últimos `window` tasks
+    (con al menos `min_calls` resultados) llega a `failure_rate`. Mientras
+    está abierto el consumidor deja de recibir mensajes. Después de
+    `reset_timeout` segundos pasa a medio abierto y deja ejecutar hasta
+    `half_open_calls` tasks de prueba: si todos terminan bien se cierra y
+    si alguno falla se abre de nuevo.
+    """
+
+    failure_rate: float = 0.5
+    window: int = 20
+    min_calls: int = 10
+    reset_timeout: float = 30
+    half_open_calls: int = 1
+    _results: Deque[bool] = field(init=False)
+    _opened_at: Optional[float] = field(default=None, init=False)
+    _probes: int = field(default=0, init=False)
+    _successes: int = field(default=0, init=False)
+
+    def __post_init__(self) -> None:
+        if not 0 < self.failure_rate <= 1:
+            raise ValueError('failure_rate must be between 0 and 1')
+        self._results = deque(maxlen=self.window)
+
+    @property
+    def state(self) -> CircuitState:
+        if self._opened_at is None:
+            return CircuitState.closed
+        if self.retry_after > 0:
+            return CircuitState.open
+        return CircuitState.half_open
+
+    @property
+    def retry_after(self) -> float:
+        """Segundos que faltan para pasar a medio abierto"""
+        if self._opened_at is None:
+            return 0
+        return max(self._opened_at + self.reset_timeout - time.monotonic(), 0)
+
+    def allow(self) -> bool:
+        """Indica si puede ejecutarse un task nuevo"""
+        state = self.state
+        if state is CircuitState.closed:
+            return True
+        if state is CircuitState.half_open:
+            if self._probes < self.half_open_calls:
+                self._probes += 1
+                return True
+        return False
+
+    def record(self, healthy: bool) -> bool:
+        """Registra el resultado de un task y regresa `True` si se abrió"""
+        state = self.state
+        if state is CircuitState.open:
+            # Tasks que empezaron antes de que se abriera
+            return False
+        if state is CircuitState.half_open:
+            if not healthy:
+                self._open()
+                return True
+            self._successes += 1
+            if self._successes >= self.half_open_calls:
+                self._opened_at = None
+                self._results.clear()
+            return False
+
+        self._results.append(healthy)
+        failures = self._results.count(False)
+        if (
+            len(self._results) >= self.min_calls
+            and failures / len(self._results) >= self.failure_rate
+        ):
+            self._open()
+            return True
+        return False
+
+    def _open(self) -> None:
+        self._opened_at = time.monotonic()
+        self._probes = self._successes = 0
+        self._results.clear()
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import os
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, Protocol, TypeVar
+from uuid import uuid4
+
+from aiobotocore.session import get_session
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Única llave del JSON que reemplaza al body original
+POINTER_KEY = '__fast_agave_claim_check__'
+
+
+class BlobStore(Protocol):
+    async def put(self, key: str, data: bytes) -> None:
+        """Guarda `data` bajo `key`"""
+
+    async def get(self, key: str) -> bytes:
+        """Regresa los datos guardados bajo `key`"""
+
+    async def delete(self, key: str) -> None:
+        """Elimina `key`. No debe fallar si ya no existe"""
+
+
+async def _run_in_executor(func: Callable[..., T], *args: Any) -> T:
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+@dataclass
+class LocalBlobStore:
+    """
+    Guarda cada blob como un archivo en `directory`. Pensado para pruebas y
+    desarrollo local; el I/O se hace en el executor del event loop.
+    """
+
+    directory: str
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _write(self, key: str, data: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(key), 'wb') as blob:
+            blob.write(data)
+
+    def _read(self, key: str) -> bytes:
+        with open(self._path(key), 'rb') as blob:
+            return blob.read()
+
+    def _remove(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    async def put(self, key: str, data: bytes) -> None:
+        await _run_in_executor(self._write, key, data)
+
+    async def get(self, key: str) -> bytes:
+        return await _run_in_executor(self._read, key)
+
+    async def delete(self, key: str) -> None:
+        await _run_in_executor(self._remove, key)
+
+
+@dataclass
+class S3BlobStore:
+    """
+    Guarda los blobs en `bucket` con el prefijo `prefix`. El cliente de S3 se
+    crea con la primera operación y se cierra con `close`.
+    """
+
+    bucket: str
+    region_name: str
+    endpoint_url: Optional[str] = None
+    prefix: str = 'fast-agave/'
+    _client: Any = field(default=None, init=False)
+    _context: Any = field(default=None, init=False)
+    _lock: asyncio.Lock = field(default_factory=asyncio.Lock, init=False)
+
+    async def _open(self) -> Any:
+        async with self._lock:
+            if self._client is None:
+                context = get_session().create_client(
+                    's3', self.region_name, endpoint_url=self.endpoint_url
+                )
+                self._client = await context.__aenter__()
+                self._context = context
+        return self._client
+
+    async def close(self) -> None:
+        async with self._lock:
+            if self._context is not None:
+                await self._context.__aexit__(None, None, None)
+            self._client = self._context = None
+
+    async def put(self, key: str, data: bytes) -> None:
+        s3 = await self._open()
+        await s3.put_object(
+            Bucket=self.bucket, Key=self.prefix + key, Body=data
+        )
+
+    async def get(self, key: str) -> bytes:
+        s3 = await self._open()
+        response = await s3.get_object(
+            Bucket=self.bucket, Key=self.prefix + key
+        )
+        async with response['Body'] as stream:
+            return await stream.read()
+
+    async def delete(self, key: str) -> None:
+        s3 = await self._open()
+        await s3.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+
+@dataclass(frozen=True)
+class ClaimCheck:
+    """
+    Los bodies de más de `threshold` bytes se comprimen con zlib, se guardan
+    en `store` y el mensaje solo lleva un apuntador con la llave del blob.
+    El consumidor (`task(claim_check=...)`) recupera el body original y
+    borra el blob cuando borra el mensaje del queue.
+    """
+
+    store: BlobStore
+    threshold: int = 64 * 1024
+    compression_level: int = 6
+
+    async def offload(self, body: str) -> str:
+        """Regresa el body que debe enviarse a SQS"""
+        key = await self.put(body)
+        return self.pointer(key) if key else body
+
+    async def put(self, body: str) -> Optional[str]:
+        """
+        Guarda `body` si pasa de `threshold` bytes y regresa la llave del
+        blob, o `None` si el body cabe en el mensaje
+        """
+        data = body.encode('utf-8')
+        if len(data) <= self.threshold:
+            return None
+        key = uuid4().hex
+        await self.store.put(key, zlib.compress(data, self.compression_level))
+        return key
+
+    @staticmethod
+    def pointer(key: str) -> str:
+        """Body del mensaje que apunta al blob `key`"""
+        return json.dumps({POINTER_KEY: key})
+
+    @staticmethod
+    def blob_key(body: Any) -> Optional[str]:
+        """Llave del blob si `body` (ya decodificado) es un apuntador"""
+        if isinstance(body, dict) and len(body) == 1 and POINTER_KEY in body:
+            return body[POINTER_KEY]
+        return None
+
+    async def fetch(self, key: str) -> bytes:
+        """Body original, sin decodificar, guardado bajo `key`"""
+        return zlib.decompress(await self.store.get(key))
+
+    async def release(self, key: str) -> None:
+        # Un blob que no se pudo borrar solo ocupa espacio, así que el error
+        # no debe afectar al task
+        try:
+            await self.store.delete(key)
+        except Exception:
+            logger.exception('Could not delete blob %s', key)
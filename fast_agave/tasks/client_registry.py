@@ -0,0 +1,129 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+from types_aiobotocore_sqs import SQSClient
+
+SQS_MAX_POOL_CONNECTIONS = int(os.getenv('SQS_MAX_POOL_CONNECTIONS', '50'))
+
+ClientKey = Tuple[asyncio.AbstractEventLoop, str, Optional[str]]
+
+
+@dataclass
+class SharedClient:
+    region_name: str
+    endpoint_url: Optional[str]
+    max_pool_connections: int
+    references: int = 0
+    _client: Optional[SQSClient] = field(default=None, init=False)
+    _context: Optional[object] = field(default=None, init=False)
+    _lock: asyncio.Lock = field(default_factory=asyncio.Lock, init=False)
+
+    async def open(self) -> SQSClient:
+        # El lock evita que dos consumidores que arrancan al mismo tiempo
+        # creen cada uno su propio pool de conexiones
+        async with self._lock:
+            if self._client is None:
+                context = get_session().create_client(
+                    'sqs',
+                    self.region_name,
+                    endpoint_url=self.endpoint_url,
+                    config=AioConfig(
+                        max_pool_connections=self.max_pool_connections
+                    ),
+                )
+                self._client = await context.__aenter__()
+                self._context = context
+        return self._client
+
+    async def close(self) -> None:
+        async with self._lock:
+            if self._context is not None:
+                await self._context.__aexit__(None, None, None)  # type: ignore
+            self._client = self._context = None
+
+
+# Un cliente por event loop, región y endpoint. El event loop forma parte de
+# la llave porque las conexiones de aiohttp no pueden compartirse entre loops
+_clients: Dict[ClientKey, SharedClient] = {}
+
+
+def _key(region_name: str, endpoint_url: Optional[str]) -> ClientKey:
+    return asyncio.get_running_loop(), region_name, endpoint_url
+
+
+async def acquire_sqs_client(
+    region_name: str,
+    endpoint_url: Optional[str] = None,
+    max_pool_connections: int = SQS_MAX_POOL_CONNECTIONS,
+) -> SQSClient:
+    """
+    Obtiene el cliente de SQS compartido por todo el proceso. Cada llamada
+    debe acompañarse de `release_sqs_client` para que el cliente se cierre
+    cuando deje de usarse. `max_pool_connections` solo aplica cuando el
+    cliente se crea por primera vez.
+    """
+    key = _key(region_name, endpoint_url)
+    shared = _clients.get(key)
+    if shared is None:
+        shared = _clients[key] = SharedClient(
+            region_name, endpoint_url, max_pool_connections
+        )
+    shared.references += 1
+    try:
+        return await shared.open()
+    except BaseException:
+        await release_sqs_client(region_name, endpoint_url)
+        raise
+
+
+async def release_sqs_client(
+    region_name: str,
+    endpoint_url: Optional[str] = None,
+    client: Optional[SQSClient] = None,
+) -> None:
+    """
+    Con `client` (el que regresó `acquire_sqs_client`) solo se libera si
+    sigue siendo el cliente registrado. Así, un cliente que ya se cerró con
+    `close_sqs_clients` no descuenta una referencia del que lo reemplazó.
+    """
+    key = _key(region_name, endpoint_url)
+    shared = _clients.get(key)
+    if shared is None or (client is not None and shared._client is not client):
+        return
+    shared.references -= 1
+    if shared.references <= 0:
+        del _clients[key]
+        await shared.close()
+
+
+async def close_sqs_clients() -> None:
+    """
+    Cierra todos los clientes del event loop actual sin importar cuántas
+    referencias tengan. Pensado para llamarse una sola vez al apagar el
+    proceso.
+    """
+    loop = asyncio.get_running_loop()
+    for key in [key for key in _clients if key[0] is loop]:
+        shared = _clients.pop(key)
+        shared.references = 0
+        await shared.close()
+
+
+@asynccontextmanager
+async def sqs_client(
+    region_name: str,
+    endpoint_url: Optional[str] = None,
+    max_pool_connections: int = SQS_MAX_POOL_CONNECTIONS,
+) -> AsyncIterator[SQSClient]:
+    client = await acquire_sqs_client(
+        region_name, endpoint_url, max_pool_connections
+    )
+    try:
+        yield client
+    finally:
+        await release_sqs_client(region_name, endpoint_url, client)
@@ -0,0 +1,115 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Optional
+
+
+@dataclass
+class AdaptiveConcurrency:
+    """
+    Ajusta el límite de tasks concurrentes con AIMD: cada vez que terminan
+    `limit` tasks se revisa esa ventana. Si la latencia promedio no supera
+    `latency_target` y la proporción de errores no supera `max_error_rate`
+    el límite sube en uno; si no, se multiplica por `decrease_factor`.
+    El límite siempre queda entre `min_limit` y `max_limit`.
+
+    `limit` es el límite actual y puede consultarse en cualquier momento.
+    """
+
+    min_limit: int = 1
+    max_limit: int = 50
+    latency_target: float = 1
+    max_error_rate: float = 0.1
+    decrease_factor: float = 0.5
+    initial_limit: Optional[int] = None
+    limit: int = field(init=False)
+    _completed: int = field(default=0, init=False)
+    _errors: int = field(default=0, init=False)
+    _latency: float = field(default=0, init=False)
+
+    def __post_init__(self) -> None:
+        if not 1 <= self.min_limit <= self.max_limit:
+            raise ValueError('min_limit must be between 1 and max_limit')
+        if not 0 < self.decrease_factor < 1:
+            raise ValueError('decrease_factor must be between 0 and 1')
+        self.limit = self._bounded(self.initial_limit or self.min_limit)
+
+    def _bounded(self, limit: int) -> int:
+        return max(self.min_limit, min(self.max_limit, limit))
+
+    def record(self, seconds: float, healthy: bool) -> None:
+        self._completed += 1
+        self._latency += seconds
+        if not healthy:
+            self._errors += 1
+        if self._completed < self.limit:
+            return
+
+        degraded = (
+            self._latency / self._completed > self.latency_target
+            or self._errors / self._completed > self.max_error_rate
+        )
+        if degraded:
+            self.limit = self._bounded(int(self.limit * self.decrease_factor))
+        else:
+            self.limit = self._bounded(self.limit + 1)
+        self._completed = self._errors = 0
+        self._latency = 0
+
+
+@dataclass
+class ConcurrencyLimiter:
+    """
+    Semáforo cuyo límite puede cambiar mientras hay tasks en ejecución. Si el
+    límite baja, los tasks en ejecución terminan normalmente y los nuevos
+    esperan hasta que `in_flight` quede por debajo del nuevo límite.
+    """
+
+    max_concurrent_tasks: int
+    adaptive: Optional[AdaptiveConcurrency] = None
+    in_flight: int = field(default=0, init=False)
+    _waiters: Deque[asyncio.Future] = field(default_factory=deque, init=False)
+
+    @property
+    def limit(self) -> int:
+        if self.adaptive:
+            return self.adaptive.limit
+        return self.max_concurrent_tasks
+
+    def locked(self) -> bool:
+        return self.in_flight >= self.limit
+
+    async def acquire(self) -> None:
+        if not self._waiters and not self.locked():
+            self.in_flight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # El lugar ya se había asignado a este task
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def record(self, seconds: float, healthy: bool) -> None:
+        """
+        Registra la duración y el resultado de un task para ajustar el
+        límite en modo adaptativo. Debe llamarse antes de `release`
+        """
+        if self.adaptive:
+            self.adaptive.record(seconds, healthy)
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        # Los lugares libres se asignan en orden de llegada
+        while self._waiters and not self.locked():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
@@ -0,0 +1,108 @@
+import asyncio
+import datetime as dt
+import json
+import traceback
+from dataclasses import asdict, dataclass, field
+from enum import Enum
+from typing import Any, Dict, List, Optional, Protocol
+
+from .client_registry import sqs_client
+
+
+class FailureReason(str, Enum):
+    invalid_json = 'invalid_json'
+    error = 'error'
+    max_retries = 'max_retries'
+    timeout = 'timeout'
+    claim_check = 'claim_check'
+
+
+@dataclass
+class DeadLetter:
+    queue_url: str
+    message_id: Optional[str]
+    body: str
+    reason: FailureReason
+    receive_count: int
+    traceback: Optional[str] = None
+    failed_at: dt.datetime = field(default_factory=dt.datetime.utcnow)
+
+    def json(self) -> str:
+        return json.dumps(asdict(self), default=str)
+
+
+class DeadLetterSink(Protocol):
+    async def send(self, dead_letter: DeadLetter) -> None:
+        ...  # pragma: no cover
+
+
+@dataclass
+class InMemorySink:
+    dead_letters: List[DeadLetter] = field(default_factory=list)
+
+    async def send(self, dead_letter: DeadLetter) -> None:
+        self.dead_letters.append(dead_letter)
+
+
+@dataclass
+class FileSink:
+    """
+    Agrega cada mensaje fallido como una línea JSON al final de `path`. La
+    escritura se hace en el executor del event loop.
+    """
+
+    path: str
+
+    def _append(self, line: str) -> None:
+        with open(self.path, 'a') as f:
+            f.write(line)
+
+    async def send(self, dead_letter: DeadLetter) -> None:
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._append, dead_letter.json() + '\n'
+        )
+
+
+@dataclass
+class QueueSink:
+    """Envía los mensajes fallidos a otro queue de SQS"""
+
+    queue_url: str
+    region_name: str
+    endpoint_url: Optional[str] = None
+
+    async def send(self, dead_letter: DeadLetter) -> None:
+        params: Dict = dict(
+            QueueUrl=self.queue_url, MessageBody=dead_letter.json()
+        )
+        if self.queue_url.endswith('.fifo'):
+            params['MessageGroupId'] = dead_letter.message_id or 'dead-letter'
+        async with sqs_client(self.region_name, self.endpoint_url) as sqs:
+            await sqs.send_message(**params)
+
+
+async def send_dead_letter(
+    sink: DeadLetterSink,
+    queue_url: str,
+    message: Dict,
+    receive_count: int,
+    reason: FailureReason,
+    body: Any = None,
+) -> None:
+    """
+    Debe llamarse dentro del bloque `except` que atrapó el error para
+    guardar también el traceback. Si el consumidor ya descartó el body
+    original del mensaje se guarda `body` (el body decodificado) serializado
+    de nuevo a JSON.
+    """
+    trace = traceback.format_exc()
+    await sink.send(
+        DeadLetter(
+            queue_url=queue_url,
+            message_id=message.get('MessageId'),
+            body=message['Body'] if 'Body' in message else json.dumps(body),
+            reason=reason,
+            receive_count=receive_count,
+            traceback=trace if trace != 'NoneType: None\n' else None,
+        )
+    )
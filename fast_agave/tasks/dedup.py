@@ -0,0 +1,55 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Protocol
+
+
+class DedupStore(Protocol):
+    async def add(self, key: str) -> bool:
+        """
+        Registra `key` y regresa `True` si no existía. Si ya existe regresa
+        `False` y el mensaje se considera duplicado
+        """
+
+    async def discard(self, key: str) -> None:
+        """
+        Elimina `key` para que el mensaje pueda volver a procesarse, p. ej.
+        cuando el task pidió un reintento
+        """
+
+
+@dataclass
+class InMemoryDedupStore:
+    """
+    Store en memoria con expiración (`ttl` segundos) y a lo más `max_size`
+    llaves. Al llenarse se descartan primero las llaves más antiguas.
+    """
+
+    ttl: float = 3600
+    max_size: int = 10_000
+    _expirations: 'OrderedDict[str, float]' = field(
+        default_factory=OrderedDict, init=False
+    )
+
+    def __len__(self) -> int:
+        return len(self._expirations)
+
+    async def add(self, key: str) -> bool:
+        now = time.monotonic()
+        # Como el ttl es el mismo para todas las llaves, el orden de
+        # inserción es también el orden de expiración
+        while self._expirations:
+            oldest, expires_at = next(iter(self._expirations.items()))
+            if expires_at > now:
+                break
+            del self._expirations[oldest]
+
+        if key in self._expirations:
+            return False
+        self._expirations[key] = now + self.ttl
+        if len(self._expirations) > self.max_size:
+            self._expirations.popitem(last=False)
+        return True
+
+    async def discard(self, key: str) -> None:
+        self._expirations.pop(key, None)
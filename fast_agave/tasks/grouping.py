@@ -0,0 +1,84 @@
+import hashlib
+import json
+import zlib
+from typing import Callable, Dict, Optional, Union
+from uuid import uuid4
+
+from starlette_context import context
+
+Payload = Union[str, Dict]
+# Calcula el `MessageGroupId` de un mensaje a partir de su payload
+GroupIdStrategy = Callable[[Payload], str]
+# Calcula el `MessageDeduplicationId` a partir del body ya serializado
+DeduplicationIdStrategy = Callable[[str], str]
+
+
+def random_group_id(data: Payload) -> str:
+    """
+    Un grupo nuevo por mensaje: máximo paralelismo y ningún orden entre
+    mensajes. Es el comportamiento por omisión de `SqsClient`
+    """
+    return str(uuid4())
+
+
+def field_group_id(field: str) -> GroupIdStrategy:
+    """
+    Agrupa por el valor de `field` en el payload, de modo que los mensajes
+    con el mismo valor se procesan en orden. Los mensajes sin el campo (o
+    que no son un diccionario) usan un grupo nuevo
+    """
+
+    def group_id(data: Payload) -> str:
+        if isinstance(data, dict) and data.get(field) is not None:
+            return str(data[field])
+        return random_group_id(data)
+
+    return group_id
+
+
+def tenant_group_id(field: str = 'platform_id') -> GroupIdStrategy:
+    """
+    Agrupa por tenant. Dentro de un request se usa el `platform_id` del
+    contexto; fuera de uno, el valor de `field` en el payload
+    """
+    from_payload = field_group_id(field)
+
+    def group_id(data: Payload) -> str:
+        if context.exists() and context.get('platform_id'):
+            return str(context['platform_id'])
+        return from_payload(data)
+
+    return group_id
+
+
+def hashed_group_id(
+    buckets: int, key: Optional[GroupIdStrategy] = None
+) -> GroupIdStrategy:
+    """
+    Reparte los mensajes en `buckets` grupos fijos según el hash de
+    `key(data)` (o del payload completo), lo que limita el paralelismo del
+    queue FIFO a `buckets` mensajes a la vez. Con `key` los mensajes con la
+    misma llave caen siempre en el mismo grupo y conservan su orden
+    """
+    if buckets < 1:
+        raise ValueError('buckets must be at least 1')
+
+    def group_id(data: Payload) -> str:
+        if key:
+            value = key(data)
+        elif isinstance(data, str):
+            value = data
+        else:
+            value = json.dumps(data, sort_keys=True)
+        return str(zlib.crc32(value.encode('utf-8')) % buckets)
+
+    return group_id
+
+
+def content_deduplication_id(body: str) -> str:
+    """
+    SHA-256 del body, igual que `ContentBasedDeduplication` de SQS. Si un
+    envío se reintenta dentro de los 5 minutos de deduplicación, SQS acepta
+    la llamada sin encolar el mensaje otra vez
+    """
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
@@ -0,0 +1,138 @@
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Dict, List, Optional, Protocol, Tuple
+
+# Límites (en segundos) de las cubetas del histograma. Cubren desde
+# milisegundos hasta la duración máxima del visibility timeout de SQS
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    300,
+    900,
+    3600,
+    43200,
+)
+
+
+class TaskOutcome(str, Enum):
+    ok = 'ok'
+    retry = 'retry'
+    error = 'error'
+    dropped = 'dropped'
+    duplicate = 'duplicate'
+    timeout = 'timeout'
+
+
+class TaskMetrics(Protocol):
+    """
+    Interfaz que recibe `task(metrics=...)` para instrumentar el consumidor.
+    Los métodos se llaman dentro del event loop, deben ser rápidos y no
+    bloquear.
+    """
+
+    def record_batch(self, size: int) -> None:
+        """Número de mensajes obtenidos en cada `receive_message`"""
+
+    def record_lag(self, seconds: float) -> None:
+        """Tiempo desde que el mensaje se envió hasta que inicia el task"""
+
+    def record_task(self, outcome: TaskOutcome, seconds: float) -> None:
+        """Duración y resultado de cada ejecución del task"""
+
+    def record_in_flight(self, count: int) -> None:
+        """Mensajes recibidos que aún no terminan de procesarse"""
+
+    def record_concurrency_limit(self, limit: int) -> None:
+        """Límite de tasks concurrentes en modo adaptativo"""
+
+
+@dataclass
+class Histogram:
+    buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    counts: List[int] = field(init=False)
+    count: int = 0
+    total: float = 0
+    max: float = 0
+
+    def __post_init__(self) -> None:
+        # La última cubeta guarda los valores mayores al último límite
+        self.counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0
+
+    def percentile(self, p: float) -> float:
+        """
+        Aproximación del percentil `p` (0-100) usando el límite superior de
+        la cubeta donde cae. Para la última cubeta se usa el valor máximo.
+        """
+        if not self.count:
+            return 0
+        rank = p / 100 * self.count
+        accumulated = 0
+        for i, bucket_count in enumerate(self.counts):
+            accumulated += bucket_count
+            if accumulated >= rank and bucket_count:
+                if i < len(self.buckets):
+                    return min(self.buckets[i], self.max)
+                break
+        return self.max
+
+
+@dataclass
+class InMemoryMetrics:
+    """
+    Implementación en proceso de `TaskMetrics`. Útil para pruebas o para
+    exportar periódicamente los valores a otro sistema de monitoreo.
+    """
+
+    lag: Histogram = field(default_factory=Histogram)
+    duration: Histogram = field(default_factory=Histogram)
+    batch_size: Histogram = field(
+        default_factory=lambda: Histogram(buckets=(0, 1, 2, 5, 10))
+    )
+    outcomes: Dict[TaskOutcome, int] = field(
+        default_factory=lambda: {outcome: 0 for outcome in TaskOutcome}
+    )
+    in_flight: int = 0
+    max_in_flight: int = 0
+    concurrency_limit: Optional[int] = None
+
+    def record_batch(self, size: int) -> None:
+        self.batch_size.observe(size)
+
+    def record_lag(self, seconds: float) -> None:
+        self.lag.observe(seconds)
+
+    def record_task(self, outcome: TaskOutcome, seconds: float) -> None:
+        self.outcomes[outcome] += 1
+        if outcome not in (TaskOutcome.dropped, TaskOutcome.duplicate):
+            self.duration.observe(seconds)
+
+    def record_in_flight(self, count: int) -> None:
+        self.in_flight = count
+        if count > self.max_in_flight:
+            self.max_in_flight = count
+
+    def record_concurrency_limit(self, limit: int) -> None:
+        self.concurrency_limit = limit
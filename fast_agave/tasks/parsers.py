@@ -0,0 +1,130 @@
+import inspect
+from collections import abc
+from functools import wraps
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Literal,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+    get_args,
+    get_origin,
+    get_type_hints,
+)
+
+from pydantic import BaseModel, create_model
+
+Parser = Callable[[Any], Any]
+
+
+def identity(body: Any) -> Any:
+    return body
+
+
+def task_argument_type(task_func: Callable) -> Any:
+    """
+    Tipo del primer parámetro del task, que es el que recibe el mensaje.
+    Si no tiene anotación se regresa `Any`
+    """
+    params = list(inspect.signature(task_func).parameters)
+    if not params:
+        return Any
+    return get_type_hints(task_func).get(params[0], Any)
+
+
+def batch_item_type(task_func: Callable) -> Any:
+    """
+    Tipo de cada elemento de la lista que recibe un task en modo batch,
+    p. ej. `User` para `async def task(users: List[User])`
+    """
+    annotation = task_argument_type(task_func)
+    if get_origin(annotation) in (list, abc.Sequence, abc.Iterable):
+        return next(iter(get_args(annotation)), Any)
+    return Any
+
+
+def build_parser(annotation: Any) -> Parser:
+    """
+    Construye una sola vez la función que valida el body del mensaje contra
+    `annotation`. Equivale a lo que hace `validate_arguments` de pydantic
+    pero sin armar y validar el modelo de la firma completa en cada llamada.
+    """
+    if annotation is Any:
+        return identity
+    if inspect.isclass(annotation) and issubclass(annotation, BaseModel):
+        return annotation.parse_obj
+
+    root_model = create_model(
+        'TaskArgument', __root__=(annotation, ...)  # type: ignore
+    )
+
+    def parse(body: Any) -> Any:
+        return root_model(__root__=body).__root__  # type: ignore
+
+    if get_origin(annotation) is Union:
+        discriminated = _discriminated_parser(get_args(annotation), parse)
+        if discriminated:
+            return discriminated
+    return parse
+
+
+def _discriminated_parser(
+    members: Tuple[Any, ...], fallback: Parser
+) -> Optional[Parser]:
+    """
+    Si todos los modelos del `Union` tienen un campo `Literal` con valores
+    distintos entre sí, se usa ese campo para elegir directamente el modelo
+    en lugar de probar cada uno en orden. Cuando el valor no corresponde a
+    ningún modelo se usa `fallback` para conservar el error de validación
+    de pydantic.
+    """
+    if not all(
+        inspect.isclass(m) and issubclass(m, BaseModel) for m in members
+    ):
+        return None
+
+    for name in members[0].__fields__:
+        models = _literal_values(members, name)
+        if models is not None:
+            break
+    else:
+        return None
+
+    def parse(body: Any) -> Any:
+        try:
+            model = models[body[name]]  # type: ignore
+        except (KeyError, TypeError):
+            return fallback(body)
+        return model.parse_obj(body)
+
+    return parse
+
+
+def _literal_values(
+    members: Tuple[Type[BaseModel], ...], name: str
+) -> Optional[Dict[Any, Type[BaseModel]]]:
+    models: Dict[Any, Type[BaseModel]] = {}
+    for model in members:
+        field = model.__fields__.get(name)
+        if field is None or get_origin(field.outer_type_) is not Literal:
+            return None
+        for value in get_args(field.outer_type_):
+            if value in models:
+                return None
+            models[value] = model
+    return models
+
+
+def validated_task(task_func: Callable) -> Callable:
+    parse = build_parser(task_argument_type(task_func))
+    if parse is identity:
+        return task_func
+
+    @wraps(task_func)
+    async def wrapper(body: Any) -> Any:
+        return await task_func(parse(body))
+
+    return wrapper
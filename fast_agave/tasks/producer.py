@@ -0,0 +1,140 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from types_aiobotocore_sqs import SQSClient
+
+from ..exc import SendMessageError
+from .backoff import RetryPolicy
+from .batch import SQS_BATCH_SIZE
+
+# Tamaño máximo de la suma de los bodies de un `send_message_batch`
+SQS_MAX_BATCH_BYTES = 256 * 1024
+
+Entry = Tuple[Dict, asyncio.Future]
+
+
+@dataclass
+class BatchProducer:
+    """
+    Junta los mensajes que se envían en un intervalo de `linger` segundos y
+    los envía con `send_message_batch`. Un batch se envía antes si llega a
+    10 mensajes o si el siguiente mensaje haría que pase de 256 KB.
+
+    Los errores temporales, tanto de la llamada completa como de entradas
+    individuales, se reintentan según `retry_policy`; en cada reintento solo
+    se envían las entradas que faltan. Las entradas que SQS rechaza por un
+    error en el mensaje (`SenderFault`) o con un código que no es temporal
+    fallan de inmediato con `SendMessageError`.
+    """
+
+    sqs: SQSClient
+    queue_url: str
+    linger: float = 0.01
+    retry_policy: RetryPolicy = RetryPolicy()
+    _entries: List[Entry] = field(default_factory=list, init=False)
+    _size: int = field(default=0, init=False)
+    _timer: Optional[asyncio.TimerHandle] = field(default=None, init=False)
+    _batches: Set[asyncio.Task] = field(default_factory=set, init=False)
+
+    async def send(self, message: Dict) -> None:
+        """
+        `message` tiene los mismos parámetros que `send_message` excepto
+        `QueueUrl`. Regresa cuando SQS confirma el mensaje
+        """
+        await self._add(message)
+
+    async def send_many(
+        self, messages: Iterable[Dict], return_exceptions: bool = False
+    ) -> List[Optional[BaseException]]:
+        """
+        Envía todos los mensajes sin esperar `linger` para el último batch
+        y regresa cuando SQS los confirma. Si alguno falla se lanza el primer
+        error después de que terminan los demás. Con `return_exceptions`
+        no se lanza nada y se regresa el error (o `None`) de cada mensaje
+        """
+        futures = [self._add(message) for message in messages]
+        self._send_batch()
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+        return results
+
+    def _add(self, message: Dict) -> asyncio.Future:
+        size = len(message['MessageBody'].encode('utf-8'))
+        if self._entries and self._size + size > SQS_MAX_BATCH_BYTES:
+            self._send_batch()
+
+        future = asyncio.get_running_loop().create_future()
+        self._entries.append((message, future))
+        self._size += size
+        if len(self._entries) >= SQS_BATCH_SIZE:
+            self._send_batch()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.linger, self._send_batch
+            )
+        return future
+
+    async def flush(self) -> None:
+        """Envía los mensajes pendientes y espera a todos los batches"""
+        self._send_batch()
+        await asyncio.gather(*self._batches, return_exceptions=True)
+
+    def _send_batch(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self._entries:
+            return
+        entries, self._entries, self._size = self._entries, [], 0
+        batch = asyncio.create_task(self._send(entries))
+        self._batches.add(batch)
+        batch.add_done_callback(self._batches.discard)
+
+    async def _send(self, entries: List[Entry]) -> None:
+        pending = {str(i): entry for i, entry in enumerate(entries)}
+        errors: Dict[str, Exception] = {}
+        for attempt in range(self.retry_policy.max_attempts):
+            if attempt:
+                await asyncio.sleep(
+                    self.retry_policy.backoff.delay(attempt - 1)
+                )
+            try:
+                response = await self.sqs.send_message_batch(
+                    QueueUrl=self.queue_url,
+                    Entries=[
+                        dict(Id=id_, **message)  # type: ignore
+                        for id_, (message, _) in pending.items()
+                    ],
+                )
+            except Exception as exc:
+                errors = dict.fromkeys(pending, exc)
+                if self.retry_policy.is_retryable(exc):
+                    continue
+                break
+
+            for success in response.get('Successful', []):
+                _, future = pending.pop(success['Id'])
+                if not future.done():
+                    future.set_result(None)
+            for failure in response.get('Failed', []):
+                error = errors[failure['Id']] = SendMessageError(
+                    failure['Code'],
+                    failure.get('Message', ''),
+                    failure['SenderFault'],
+                )
+                if failure['SenderFault'] or not (
+                    self.retry_policy.is_retryable(failure['Code'])
+                ):
+                    _, future = pending.pop(failure['Id'])
+                    if not future.done():
+                        future.set_exception(error)
+            if not pending:
+                return
+
+        for id_, (_, future) in pending.items():
+            if not future.done():
+                future.set_exception(errors[id_])
@@ -0,0 +1,54 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class TokenBucket:
+    """
+    Token bucket que se llena a `rate` tokens por segundo hasta `capacity`.
+    Por default `capacity` es `rate` (mínimo 1), es decir, permite ráfagas
+    de hasta un segundo de mensajes.
+
+    Una misma instancia puede compartirse entre varios `task()` que llamen a
+    la misma API externa.
+    """
+
+    rate: float
+    capacity: Optional[float] = None
+    _tokens: float = field(init=False)
+    _updated_at: float = field(init=False)
+
+    def __post_init__(self) -> None:
+        if self.rate <= 0:
+            raise ValueError('rate must be greater than 0')
+        if self.capacity is None:
+            self.capacity = max(self.rate, 1)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+
+    @property
+    def tokens(self) -> float:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity,  # type: ignore
+            self._tokens + (now - self._updated_at) * self.rate,
+        )
+        self._updated_at = now
+        return self._tokens
+
+    async def take(self, max_tokens: int = 1) -> int:
+        """
+        Espera a que haya al menos un token y toma hasta `max_tokens`.
+        Regresa el número de tokens tomados
+        """
+        while (tokens := self.tokens) < 1:
+            await asyncio.sleep((1 - tokens) / self.rate)
+        taken = min(max_tokens, int(tokens))
+        self._tokens -= taken
+        return taken
+
+    def put(self, tokens: int) -> None:
+        """Regresa tokens que se tomaron pero no se usaron"""
+        self._tokens = min(self.capacity, self._tokens + tokens)  # type: ignore
@@ -0,0 +1,66 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+
+@dataclass
+class TaskRegistry:
+    """
+    Tasks en vuelo de un consumidor junto con los receipt handles de sus
+    mensajes. Cada consumidor tiene el suyo, así que al apagarse solo espera
+    a sus propios tasks. Agregar y eliminar un task es O(1): al terminar se
+    elimina solo con un done callback.
+
+    Para inspeccionar o esperar los tasks de un consumidor se pasa un
+    registro propio a `start_task(registry=...)`.
+    """
+
+    _tasks: Dict[asyncio.Task, List[str]] = field(
+        default_factory=dict, init=False
+    )
+    _started: Set[asyncio.Task] = field(default_factory=set, init=False)
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def __iter__(self) -> Iterator[asyncio.Task]:
+        return iter(list(self._tasks))
+
+    def __contains__(self, task: object) -> bool:
+        return task in self._tasks
+
+    def add(self, task: asyncio.Task, receipt_handles: List[str]) -> None:
+        self._tasks[task] = receipt_handles
+        task.add_done_callback(self._discard)
+
+    def _discard(self, task: asyncio.Task) -> None:
+        self._tasks.pop(task, None)
+        self._started.discard(task)
+
+    def mark_started(self, task: asyncio.Task) -> None:
+        """El task ya tiene lugar en el control de concurrencia"""
+        if task in self._tasks:
+            self._started.add(task)
+
+    @property
+    def running(self) -> List[asyncio.Task]:
+        return list(self._started)
+
+    @property
+    def unstarted(self) -> List[asyncio.Task]:
+        return [t for t in self._tasks if t not in self._started]
+
+    def receipt_handles(self, tasks: Iterable[asyncio.Task]) -> List[str]:
+        return [
+            handle for task in tasks for handle in self._tasks.get(task, [])
+        ]
+
+    async def wait(self, timeout: Optional[float] = None) -> Set[asyncio.Task]:
+        """
+        Espera a los tasks registrados en este momento, sin cancelarlos ni
+        propagar sus errores, y regresa los que no terminaron a tiempo
+        """
+        if not self._tasks:
+            return set()
+        _, pending = await asyncio.wait(list(self._tasks), timeout=timeout)
+        return pending
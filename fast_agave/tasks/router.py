@@ -0,0 +1,79 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from pydantic import ValidationError
+
+from ..exc import NoTaskHandlerError
+from .parsers import Parser, build_parser, task_argument_type
+
+
+@dataclass
+class TaskHandler:
+    func: Callable
+    parse: Parser
+
+    @classmethod
+    def from_func(cls, func: Callable) -> 'TaskHandler':
+        return cls(func, build_parser(task_argument_type(func)))
+
+    async def __call__(self, body: Any) -> None:
+        await self.func(self.parse(body))
+
+
+@dataclass
+class TaskRouter:
+    """
+    Permite consumir un solo queue con varios handlers:
+
+    router = TaskRouter(discriminator='type')
+
+    @router.handler('user.created')
+    async def user_created(data: User): ...
+
+    @router.handler()
+    async def company(data: Company): ...
+
+    consumer = task(queue_url=QUEUE_URL)(router.dispatch)
+
+    Si el mensaje tiene el campo `discriminator` y existe un handler
+    registrado con ese valor se usa ese handler. En otro caso se prueban en
+    orden de registro los handlers sin valor y se ejecuta el primero cuya
+    anotación valide el mensaje, igual que un `Union` de pydantic.
+    """
+
+    discriminator: Optional[str] = None
+    routes: Dict[Any, TaskHandler] = field(default_factory=dict)
+    handlers: List[TaskHandler] = field(default_factory=list)
+
+    def handler(self, value: Any = None) -> Callable[[Callable], Callable]:
+        def register(func: Callable) -> Callable:
+            task_handler = TaskHandler.from_func(func)
+            if value is None:
+                self.handlers.append(task_handler)
+            elif self.discriminator is None:
+                raise ValueError('TaskRouter requires a discriminator field')
+            else:
+                self.routes[value] = task_handler
+            return func
+
+        return register
+
+    async def dispatch(self, body: Any) -> None:
+        if self.discriminator and isinstance(body, dict):
+            try:
+                task_handler = self.routes[body[self.discriminator]]
+            except (KeyError, TypeError):
+                pass
+            else:
+                await task_handler(body)
+                return
+
+        for task_handler in self.handlers:
+            try:
+                data = task_handler.parse(body)
+            except ValidationError:
+                continue
+            await task_handler.func(data)
+            return
+
+        raise NoTaskHandlerError(body)
@@ -0,0 +1,65 @@
+import asyncio
+from collections import Counter
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Optional
+
+
+@dataclass
+class MessageGroupScheduler:
+    """
+    Permite a lo más un task en ejecución por `MessageGroupId`.
+
+    Cada grupo tiene su propio `asyncio.Lock`, cuyos waiters se atienden en
+    orden de llegada, así que los mensajes de un grupo se ejecutan en el
+    orden en que se recibieron. Mientras un mensaje espera a su grupo no
+    ocupa lugar en el semáforo de concurrencia, de modo que los demás grupos
+    siguen avanzando y cada grupo compite por el semáforo con a lo más un
+    mensaje a la vez.
+
+    Un grupo bloqueado (`block`) indica que uno de sus mensajes no se borró
+    y volverá a recibirse, así que los mensajes del grupo que ya se
+    recibieron no deben ejecutarse antes que él. El bloqueo dura hasta que
+    ese mismo mensaje se borra o se recibe de nuevo (`unblock`).
+    """
+
+    _locks: Dict[str, asyncio.Lock] = field(default_factory=dict)
+    _waiting: Dict[str, int] = field(default_factory=Counter)
+    # `MessageId` del mensaje que bloquea cada grupo
+    _blocked: Dict[str, str] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, group_id: Optional[str]) -> AsyncIterator[None]:
+        if group_id is None:
+            yield
+            return
+
+        lock = self._locks.get(group_id)
+        if lock is None:
+            lock = self._locks[group_id] = asyncio.Lock()
+        self._waiting[group_id] += 1
+        try:
+            async with lock:
+                yield
+        finally:
+            # Se eliminan los grupos sin mensajes pendientes para no
+            # acumular un lock por cada `MessageGroupId` recibido
+            self._waiting[group_id] -= 1
+            if not self._waiting[group_id]:
+                del self._waiting[group_id]
+                del self._locks[group_id]
+
+    def block(self, group_id: Optional[str], message_id: str) -> None:
+        if group_id is not None:
+            self._blocked[group_id] = message_id
+
+    def unblock(self, group_id: Optional[str], message_id: str) -> None:
+        """Desbloquea el grupo solo si lo bloqueó `message_id`"""
+        if group_id is not None and self._blocked.get(group_id) == message_id:
+            del self._blocked[group_id]
+
+    def blocked(self, group_id: Optional[str]) -> bool:
+        return group_id in self._blocked
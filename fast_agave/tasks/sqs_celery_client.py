@@ -1,22 +1,45 @@
 import asyncio
 import json
-from base64 import b64encode
+from base64 import b64decode, b64encode
 from dataclasses import dataclass
-from typing import Dict, Iterable, Optional
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
 from uuid import uuid4
 
+from fast_agave.tasks.claim_check import POINTER_KEY, ClaimCheck
 from fast_agave.tasks.sqs_client import SqsClient
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
 
-def _build_celery_message(
-    task_name: str, args_: Iterable, kwargs_: Dict
-) -> str:
-    task_id = str(uuid4())
-    # la definición de esta plantila se encuentra en:
-    # docs.celeryproject.org/en/stable/internals/protocol.html#definition
+
+def _dumps(value: Any) -> bytes:
+    # El resultado no debe depender de que orjson esté instalado: lo que
+    # orjson no serializa igual que `json` (llaves que no son str, enteros
+    # grandes, datetimes, dataclasses) se serializa con `json`
+    if orjson:
+        try:
+            return orjson.dumps(
+                value,
+                option=orjson.OPT_PASSTHROUGH_DATETIME
+                | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except TypeError:
+            pass
+    return json.dumps(value).encode('utf-8')
+
+
+def _build_template() -> str:
+    """
+    Serializa una sola vez la parte constante del mensaje y deja
+    placeholders para los valores de cada task. El formato se construye
+    desde la misma plantilla del protocolo para no duplicarla:
+    docs.celeryproject.org/en/stable/internals/protocol.html#definition
+    """
     message = dict(
         properties=dict(
-            correlation_id=task_id,
+            correlation_id='__task_id__',
             content_type='application/json',
             content_encoding='utf-8',
             body_encoding='base64',
@@ -24,38 +47,95 @@ def _build_celery_message(
         ),
         headers=dict(
             lang='py',
-            task=task_name,
-            id=task_id,
-            root_id=task_id,
+            task='__task_name__',
+            id='__task_id__',
+            root_id='__task_id__',
             parent_id=None,
             group=None,
         ),
-        body=_b64_encode(
-            json.dumps(
-                (
-                    args_,
-                    kwargs_,
-                    dict(
-                        callbacks=None, errbacks=None, chain=None, chord=None
-                    ),
-                )
-            )
-        ),
+        body='__body__',
     )
     message['content-encoding'] = 'utf-8'
     message['content-type'] = 'application/json'
+    template = json.dumps(message).replace('%', '%%')
+    for name in ('task_id', 'task_name', 'body'):
+        template = template.replace(f'"__{name}__"', f'%({name})s')
+    return template
 
-    encoded = _b64_encode(json.dumps(message))
-    return encoded
 
+_MESSAGE_TEMPLATE = _build_template()
+_BODY_EMBED = b',{"callbacks":null,"errbacks":null,"chain":null,"chord":null}]'
 
-def _b64_encode(value: str) -> str:
-    encoded = b64encode(bytes(value, 'utf-8'))
-    return encoded.decode('utf-8')
+
+def _build_celery_message(
+    task_name: str, args_: Iterable, kwargs_: Dict
+) -> str:
+    # `(args, kwargs, embed)` se serializa en un solo paso: se reemplaza el
+    # `]` final de `[args, kwargs]` por el `embed` constante
+    body = _dumps((args_, kwargs_))[:-1] + _BODY_EMBED
+    message = _MESSAGE_TEMPLATE % dict(
+        task_id=f'"{uuid4()}"',
+        task_name=json.dumps(task_name),
+        body=f'"{b64encode(body).decode()}"',
+    )
+    return b64encode(message.encode('utf-8')).decode()
+
+
+def _parse_celery_message(message: str) -> Tuple[str, List, Dict]:
+    """Nombre, args y kwargs de un mensaje de `_build_celery_message`"""
+    envelope = json.loads(b64decode(message))
+    args_, kwargs_, _ = json.loads(b64decode(envelope['body']))
+    return envelope['headers']['task'], args_, kwargs_
+
+
+async def resolve_task_arguments(
+    claim_check: ClaimCheck, args: Iterable, kwargs: Dict
+) -> Tuple[Iterable, Dict]:
+    """
+    Para los workers de Celery: si el task recibió el apuntador de un claim
+    check regresa los argumentos guardados en el blob; si no, los mismos
+    `args` y `kwargs`. El worker borra el blob con `claim_check.release` al
+    terminar el task.
+    """
+    key = ClaimCheck.blob_key(kwargs)
+    if args or not key:
+        return args, kwargs
+    args_, kwargs_ = json.loads(await claim_check.fetch(key))
+    return args_, kwargs_
+
+
+class CeleryTask(NamedTuple):
+    name: str
+    args: Iterable = ()
+    kwargs: Optional[Dict] = None
 
 
 @dataclass
 class SqsCeleryClient(SqsClient):
+    """
+    Con `claim_check` se guardan los argumentos del task (no el mensaje,
+    que Celery no sabría leer) cuando pasan de `claim_check.threshold`
+    bytes, y el task recibe solo el kwarg `POINTER_KEY` con la llave del
+    blob. El worker recupera los argumentos con `resolve_task_arguments`.
+    """
+
+    async def _prepare_message(
+        self, data: Any, message_group_id: Optional[str]
+    ) -> Tuple[Dict, Optional[str]]:
+        blob_key = None
+        # Los argumentos siempre son más cortos que el mensaje en base64,
+        # así que solo se decodifican los mensajes que pasan del umbral
+        if (
+            self.claim_check
+            and isinstance(data, str)
+            and len(data) > self.claim_check.threshold
+        ):
+            name, args_, kwargs_ = _parse_celery_message(data)
+            blob_key = await self.claim_check.put(json.dumps([args_, kwargs_]))
+            if blob_key:
+                data = _build_celery_message(name, (), {POINTER_KEY: blob_key})
+        return self._build_message(data, message_group_id), blob_key
+
     async def send_task(
         self,
         name: str,
@@ -70,6 +150,16 @@ class SqsCeleryClient(SqsClient):
         name: str,
         args: Optional[Iterable] = None,
         kwargs: Optional[Dict] = None,
-    ) -> asyncio.Task:
+    ) -> asyncio.Future:
         celery_message = _build_celery_message(name, args or (), kwargs or {})
         return super().send_message_async(celery_message)
+
+    async def send_tasks(self, tasks: Iterable[CeleryTask]) -> None:
+        """
+        Codifica todos los tasks y los envía con `send_message_batch` en
+        batches de hasta 10 mensajes
+        """
+        await self.send_messages(
+            _build_celery_message(name, args or (), kwargs or {})
+            for name, args, kwargs in tasks
+        )
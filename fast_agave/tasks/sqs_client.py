@@ -1,23 +1,108 @@
 import asyncio
 import json
+import warnings
 from dataclasses import dataclass, field
-from typing import Dict, Optional, Union
-from uuid import uuid4
+from enum import Enum
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 
-from aiobotocore.session import get_session
 from types_aiobotocore_sqs import SQSClient
 
+from .backoff import RetryPolicy
+from .claim_check import ClaimCheck
+from .client_registry import (
+    SQS_MAX_POOL_CONNECTIONS,
+    acquire_sqs_client,
+    release_sqs_client,
+)
+from .grouping import DeduplicationIdStrategy, GroupIdStrategy, random_group_id
+from .producer import BatchProducer
+
+
+class OverflowPolicy(str, Enum):
+    wait = 'wait'
+    drop = 'drop'
+    error = 'error'
+
 
 @dataclass
 class SqsClient:
+    """
+    Con `batch_messages` los mensajes se agrupan y se envían con
+    `send_message_batch` (ver `BatchProducer`). `send_message` sigue
+    regresando hasta que SQS confirma el mensaje, pero los mensajes que se
+    envían al mismo tiempo comparten una sola llamada.
+
+    Los mensajes en segundo plano (`send_message_async`) pasan por una cola
+    de a lo más `max_pending_messages` mensajes que envían `sender_workers`
+    workers. Si la cola está llena se aplica `overflow_policy`:
+
+    - `error` (por omisión): se lanza `asyncio.QueueFull`.
+    - `drop`: el mensaje se descarta y se cuenta en `dropped_messages`.
+    - `wait`: `enqueue_message` espera a que haya lugar;
+      `send_message_async` no puede esperar y lanza `asyncio.QueueFull`.
+
+    Los errores temporales al enviar se reintentan según `retry_policy`,
+    también para las entradas que fallan dentro de un batch. Los errores que
+    quedan se pasan a `on_send_error`. `close` espera a que se envíen todos
+    los mensajes pendientes.
+
+    Con `claim_check` los bodies que pasan de `claim_check.threshold` bytes
+    se guardan comprimidos en `claim_check.store` y el mensaje solo lleva
+    un apuntador, que `task(claim_check=...)` resuelve al recibirlo. Si el
+    mensaje no se puede enviar su blob se borra.
+
+    `group_id` calcula el `MessageGroupId` de los mensajes que no lo
+    especifican. Por omisión cada mensaje tiene su propio grupo; para
+    conservar el orden o acotar el paralelismo del queue FIFO se puede
+    agrupar por un campo, por tenant o en un número fijo de grupos (ver
+    `fast_agave.tasks.grouping`). Con `deduplication_id` (p. ej.
+    `content_deduplication_id`) cada mensaje lleva un
+    `MessageDeduplicationId`, de modo que los reintentos de un envío que sí
+    llegó no lo duplican. Con claim check se calcula sobre el body original.
+    """
+
     queue_url: str
     region_name: str
+    endpoint_url: Optional[str] = None
+    max_pool_connections: int = SQS_MAX_POOL_CONNECTIONS
+    batch_messages: bool = False
+    batch_linger: float = 0.01
+    max_pending_messages: int = 1000
+    sender_workers: int = 10
+    overflow_policy: OverflowPolicy = OverflowPolicy.error
+    on_send_error: Optional[
+        Callable[[Union[str, Dict], Exception], None]
+    ] = None
+    retry_policy: RetryPolicy = RetryPolicy()
+    claim_check: Optional[ClaimCheck] = None
+    group_id: GroupIdStrategy = random_group_id
+    deduplication_id: Optional[DeduplicationIdStrategy] = None
+    dropped_messages: int = field(default=0, init=False)
     _sqs: SQSClient = field(init=False)
-    _background_tasks: set = field(init=False)
+    _producer: Optional[BatchProducer] = field(default=None, init=False)
+    _queue: asyncio.Queue = field(init=False)
+    _workers: List[asyncio.Task] = field(default_factory=list, init=False)
+    # Futures de los mensajes en segundo plano que no se han enviado
+    _pending: Set[asyncio.Future] = field(default_factory=set, init=False)
+    # Indica si este cliente tiene una referencia al cliente compartido
+    _acquired: bool = field(default=False, init=False)
 
     @property
-    def background_tasks(self) -> set:
-        return self._background_tasks
+    def pending_messages(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def background_tasks(self) -> Set[asyncio.Future]:
+        """
+        Obsoleto: usar `flush` para esperar a los mensajes en segundo plano.
+        Regresa los futures de los mensajes que aún no se envían
+        """
+        warnings.warn(
+            'background_tasks is deprecated, use flush()',
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        return set(self._pending)
 
     async def __aenter__(self):
         await self.start()
@@ -27,31 +112,194 @@ class SqsClient:
         await self.close()
 
     async def start(self):
-        session = get_session()
-        context = session.create_client('sqs', self.region_name)
-        self._background_tasks = set()
-        self._sqs = await context.__aenter__()
+        self._sqs = await acquire_sqs_client(
+            self.region_name, self.endpoint_url, self.max_pool_connections
+        )
+        self._acquired = True
+        if self.batch_messages:
+            self._producer = BatchProducer(
+                self._sqs,
+                self.queue_url,
+                self.batch_linger,
+                retry_policy=self.retry_policy,
+            )
+        self._queue = asyncio.Queue(self.max_pending_messages)
+        self._workers = [
+            asyncio.create_task(self._sender())
+            for _ in range(self.sender_workers)
+        ]
+
+    async def flush(self) -> None:
+        """Espera a que se envíen los mensajes en segundo plano"""
+        await self._queue.join()
 
     async def close(self):
-        await self._sqs.__aexit__(None, None, None)
+        # Cerrar dos veces no debe liberar la referencia de otro cliente
+        if not self._acquired:
+            return
+        self._acquired = False
+        await self.flush()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        if self._producer:
+            await self._producer.flush()
+        await release_sqs_client(
+            self.region_name, self.endpoint_url, self._sqs
+        )
+
+    def _build_message(
+        self, data: Union[str, Dict], message_group_id: Optional[str]
+    ) -> Dict:
+        body = data if type(data) is str else json.dumps(data)
+        message = dict(
+            MessageBody=body,
+            MessageGroupId=message_group_id or self.group_id(data),
+        )
+        if self.deduplication_id:
+            message['MessageDeduplicationId'] = self.deduplication_id(body)
+        return message
+
+    async def _prepare_message(
+        self, data: Union[str, Dict], message_group_id: Optional[str]
+    ) -> Tuple[Dict, Optional[str]]:
+        """Regresa el mensaje y la llave de su blob si se usó claim check"""
+        message = self._build_message(data, message_group_id)
+        blob_key = None
+        if self.claim_check:
+            blob_key = await self.claim_check.put(message['MessageBody'])
+            if blob_key:
+                message['MessageBody'] = self.claim_check.pointer(blob_key)
+        return message, blob_key
+
+    async def _release_blobs(self, blob_keys: Iterable[Optional[str]]) -> None:
+        if self.claim_check:
+            await asyncio.gather(
+                *(self.claim_check.release(key) for key in blob_keys if key)
+            )
 
     async def send_message(
         self,
         data: Union[str, Dict],
         message_group_id: Optional[str] = None,
     ) -> None:
-        await self._sqs.send_message(
-            QueueUrl=self.queue_url,
-            MessageBody=data if type(data) is str else json.dumps(data),
-            MessageGroupId=message_group_id or str(uuid4()),
+        message, blob_key = await self._prepare_message(data, message_group_id)
+        try:
+            if self._producer:
+                await self._producer.send(message)
+            else:
+                await self.retry_policy.run(
+                    lambda: self._sqs.send_message(
+                        QueueUrl=self.queue_url, **message  # type: ignore
+                    )
+                )
+        except Exception:
+            await self._release_blobs([blob_key])
+            raise
+
+    async def send_messages(
+        self,
+        messages: Iterable[Union[str, Dict]],
+        message_group_id: Optional[str] = None,
+    ) -> None:
+        """Envía varios mensajes con `send_message_batch`"""
+        producer = self._producer or BatchProducer(
+            self._sqs, self.queue_url, retry_policy=self.retry_policy
+        )
+        if not self.claim_check:
+            await producer.send_many(
+                self._build_message(data, message_group_id)
+                for data in messages
+            )
+            return
+
+        results = await asyncio.gather(
+            *(
+                self._prepare_message(data, message_group_id)
+                for data in messages
+            ),
+            return_exceptions=True,
         )
+        prepared = [r for r in results if not isinstance(r, BaseException)]
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            # No se envía nada, así que se borran los blobs que sí se
+            # guardaron
+            await self._release_blobs(key for _, key in prepared)
+            raise errors[0]
+
+        sent = await producer.send_many(
+            (message for message, _ in prepared), return_exceptions=True
+        )
+        await self._release_blobs(
+            key for (_, key), error in zip(prepared, sent) if error is not None
+        )
+        for error in sent:
+            if error is not None:
+                raise error
 
     def send_message_async(
         self,
         data: Union[str, Dict],
         message_group_id: Optional[str] = None,
-    ) -> asyncio.Task:
-        task = asyncio.create_task(self.send_message(data, message_group_id))
-        self._background_tasks.add(task)
-        task.add_done_callback(self._background_tasks.discard)
-        return task
+    ) -> asyncio.Future:
+        """
+        Encola el mensaje sin esperar y regresa un `asyncio.Future` (antes
+        un `asyncio.Task`) que se resuelve cuando se envía. Con la cola
+        llena lanza `asyncio.QueueFull`, salvo con `OverflowPolicy.drop`, en
+        cuyo caso el future regresa cancelado. Como no puede esperar, con
+        `OverflowPolicy.wait` también lanza `asyncio.QueueFull`; para esperar
+        a que haya lugar se usa `enqueue_message`.
+        """
+        future = asyncio.get_running_loop().create_future()
+        # El grupo se calcula aquí porque los workers no tienen el contexto
+        # del request (ver `tenant_group_id`)
+        message_group_id = message_group_id or self.group_id(data)
+        try:
+            self._queue.put_nowait((data, message_group_id, future))
+        except asyncio.QueueFull:
+            if self.overflow_policy is not OverflowPolicy.drop:
+                raise
+            self.dropped_messages += 1
+            future.cancel()
+        else:
+            self._track(future)
+        return future
+
+    async def enqueue_message(
+        self,
+        data: Union[str, Dict],
+        message_group_id: Optional[str] = None,
+    ) -> asyncio.Future:
+        """Igual que `send_message_async` pero aplica `OverflowPolicy.wait`"""
+        if self.overflow_policy is not OverflowPolicy.wait:
+            return self.send_message_async(data, message_group_id)
+        future = asyncio.get_running_loop().create_future()
+        message_group_id = message_group_id or self.group_id(data)
+        await self._queue.put((data, message_group_id, future))
+        self._track(future)
+        return future
+
+    def _track(self, future: asyncio.Future) -> None:
+        self._pending.add(future)
+        future.add_done_callback(self._pending.discard)
+
+    async def _sender(self) -> None:
+        while True:
+            data, message_group_id, future = await self._queue.get()
+            try:
+                await self.send_message(data, message_group_id)
+            except Exception as exc:
+                if not future.done():
+                    future.set_exception(exc)
+                if self.on_send_error:
+                    self.on_send_error(data, exc)
+                    # El error ya se atendió, así que no se reporta como
+                    # excepción no recuperada si nadie espera el future
+                    if not future.cancelled():
+                        future.exception()
+            else:
+                if not future.done():
+                    future.set_result(None)
+            finally:
+                self._queue.task_done()
@@ -1,20 +1,65 @@
 import asyncio
 import json
+import logging
 import os
-from functools import wraps
+import time
+from functools import partial, wraps
 from itertools import count
 from json import JSONDecodeError
-from typing import AsyncGenerator, Callable, Coroutine
-
-from aiobotocore.httpsession import HTTPClientError
-from aiobotocore.session import get_session
-from pydantic import validate_arguments
+from typing import (
+    Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Coroutine,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Union,
+)
 
 from ..exc import RetryTask
+from .backoff import BackoffPolicy, RetryPolicy
+from .batch import SQS_BATCH_SIZE, change_messages_visibility, run_batch_task
+from .circuit_breaker import CircuitBreaker, CircuitState
+from .claim_check import ClaimCheck
+from .client_registry import SQS_MAX_POOL_CONNECTIONS, sqs_client
+from .concurrency import AdaptiveConcurrency, ConcurrencyLimiter
+from .dead_letter import DeadLetterSink, FailureReason, send_dead_letter
+from .dedup import DedupStore, InMemoryDedupStore
+from .metrics import TaskMetrics, TaskOutcome
+from .parsers import batch_item_type, build_parser, validated_task
+from .rate_limit import TokenBucket
+from .registry import TaskRegistry
+from .scheduler import MessageGroupScheduler
+
+logger = logging.getLogger(__name__)
 
 AWS_DEFAULT_REGION = os.getenv('AWS_DEFAULT_REGION', '')
 
-BACKGROUND_TASKS = set()
+
+class _DeadlineExceeded(Exception):
+    """El task tardó más que su `timeout`"""
+
+
+async def _run_with_timeout(
+    task_func: Callable, body: dict, timeout: Optional[float]
+) -> None:
+    if timeout is None:
+        await task_func(body)
+        return
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    try:
+        await asyncio.wait_for(task_func(body), timeout)
+    except asyncio.TimeoutError:
+        # Un `TimeoutError` del propio handler antes del plazo se trata
+        # como cualquier otro error
+        if loop.time() < deadline:
+            raise
+        raise _DeadlineExceeded
 
 
 async def run_task(
@@ -25,24 +70,84 @@ async def run_task(
     receipt_handle: str,
     message_receive_count: int,
     max_retries: int,
-) -> None:
+    metrics: Optional[TaskMetrics] = None,
+    sent_timestamp: Optional[float] = None,
+    dead_letter: Optional[Callable[[FailureReason], Awaitable]] = None,
+    dedup_store: Optional[DedupStore] = None,
+    dedup_key: Optional[str] = None,
+    timeout: Optional[float] = None,
+    timeout_backoff: Optional[BackoffPolicy] = None,
+    on_delete: Optional[Callable[[], Awaitable]] = None,
+) -> Optional[TaskOutcome]:
+    if metrics and sent_timestamp:
+        metrics.record_lag(max(time.time() - sent_timestamp, 0))
+    started_at = time.monotonic()
+    outcome: Optional[TaskOutcome] = TaskOutcome.ok
     delete_message = True
     try:
-        await task_func(body)
+        await _run_with_timeout(task_func, body, timeout)
+    except _DeadlineExceeded:
+        # `wait_for` ya canceló el task. El mensaje se libera de inmediato
+        # (o después del backoff) en lugar de esperar a que termine el
+        # `visibility_timeout`
+        delete_message = message_receive_count >= max_retries + 1
+        outcome = TaskOutcome.timeout
+        if delete_message and dead_letter:
+            delete_message = False
+            await dead_letter(FailureReason.timeout)
+            delete_message = True
+        if not delete_message:
+            await sqs.change_message_visibility(
+                QueueUrl=queue_url,
+                ReceiptHandle=receipt_handle,
+                VisibilityTimeout=int(
+                    timeout_backoff.delay(message_receive_count - 1)
+                )
+                if timeout_backoff
+                else 0,
+            )
+    except asyncio.CancelledError:
+        # El task fue cancelado durante el apagado del worker. El mensaje
+        # no se borra para que pueda liberarse y procesarse de nuevo
+        delete_message = False
+        outcome = None
+        raise
     except RetryTask as retry:
         delete_message = message_receive_count >= max_retries + 1
+        outcome = TaskOutcome.error if delete_message else TaskOutcome.retry
+        if delete_message and dead_letter:
+            # Si no se puede guardar el mensaje fallido no se borra
+            delete_message = False
+            await dead_letter(FailureReason.max_retries)
+            delete_message = True
         if not delete_message and retry.countdown and retry.countdown > 0:
             await sqs.change_message_visibility(
                 QueueUrl=queue_url,
                 ReceiptHandle=receipt_handle,
                 VisibilityTimeout=retry.countdown,
             )
+    except Exception:
+        outcome = TaskOutcome.error
+        if dead_letter:
+            delete_message = False
+            await dead_letter(FailureReason.error)
+            delete_message = True
+        raise
     finally:
+        if metrics and outcome:
+            metrics.record_task(outcome, time.monotonic() - started_at)
+        if dedup_store is not None and dedup_key and not delete_message:
+            # El mensaje se volverá a recibir, así que no debe tratarse
+            # como duplicado
+            await dedup_store.discard(dedup_key)
         if delete_message:
             await sqs.delete_message(
                 QueueUrl=queue_url,
                 ReceiptHandle=receipt_handle,
             )
+            if on_delete:
+                await on_delete()
+    return outcome
 
 
 async def message_consumer(
@@ -51,32 +156,107 @@ async def message_consumer(
     visibility_timeout: int,
     can_read: asyncio.Event,
     sqs,
+    metrics: Optional[TaskMetrics] = None,
+    receive_backoff: BackoffPolicy = BackoffPolicy(),
+    idle_backoff: Optional[BackoffPolicy] = None,
+    max_number_of_messages: int = 1,
+    rate_limiter: Optional[TokenBucket] = None,
 ) -> AsyncGenerator:
+    # Errores y recepciones vacías consecutivas. Se reinician en cuanto
+    # `receive_message` responde correctamente o devuelve mensajes
+    errors = empty_polls = 0
     for _ in count():
         await can_read.wait()
+        # Con rate limit solo se piden tantos mensajes como tokens haya, de
+        # modo que los mensajes esperan en SQS y no dentro del proceso
+        # mientras corre su visibility timeout
+        max_messages = (
+            await rate_limiter.take(max_number_of_messages)
+            if rate_limiter
+            else max_number_of_messages
+        )
         try:
             response = await sqs.receive_message(
                 QueueUrl=queue_url,
                 WaitTimeSeconds=wait_time_seconds,
                 VisibilityTimeout=visibility_timeout,
-                AttributeNames=['ApproximateReceiveCount'],
+                MaxNumberOfMessages=max_messages,
+                AttributeNames=[
+                    'ApproximateReceiveCount',
+                    'SentTimestamp',
+                    'MessageGroupId',
+                ],
             )
-            messages = response['Messages']
-        except KeyError:
+        except Exception as exc:
+            # Los errores temporales (conexión, throttling, `InternalError`)
+            # se reintentan con backoff; cualquier otro detiene al consumidor
+            if not RetryPolicy().is_retryable(exc):
+                raise
+            if rate_limiter:
+                rate_limiter.put(max_messages)
+            await asyncio.sleep(receive_backoff.delay(errors))
+            errors += 1
             continue
-        except HTTPClientError:
-            await asyncio.sleep(1)
+        errors = 0
+        messages = response.get('Messages', [])
+        if rate_limiter:
+            rate_limiter.put(max_messages - len(messages))
+        if not messages:
+            if metrics:
+                metrics.record_batch(0)
+            if idle_backoff:
+                await asyncio.sleep(idle_backoff.delay(empty_polls))
+                empty_polls += 1
             continue
+        empty_polls = 0
+        if metrics:
+            metrics.record_batch(len(messages))
         for message in messages:
             yield message
 
 
-async def get_running_fast_agave_tasks():
-    return [
-        t
-        for t in asyncio.all_tasks()
-        if t.get_name().startswith('fast-agave-task')
-    ]
+async def release_messages(
+    sqs, queue_url: str, receipt_handles: Iterable[str]
+) -> None:
+    """
+    Regresa los mensajes al queue con `VisibilityTimeout=0` para que otro
+    worker pueda recibirlos de inmediato
+    """
+    await change_messages_visibility(sqs, queue_url, receipt_handles, 0)
+
+
+async def drain_tasks(
+    registry: TaskRegistry,
+    sqs,
+    queue_url: str,
+    drain_timeout: float,
+) -> None:
+    """
+    Apagado ordenado del consumidor:
+
+    1. Los mensajes recibidos que aún no empiezan a ejecutarse se cancelan
+    y se liberan en una sola llamada en batch.
+    2. Se espera a los tasks en ejecución hasta `drain_timeout` segundos.
+    Al terminar, cada task borra (o reintenta) su mensaje normalmente.
+    3. Los tasks que no terminaron a tiempo se cancelan y sus mensajes
+    también se liberan.
+    """
+    await cancel_and_release(registry, registry.unstarted, sqs, queue_url)
+    pending = await registry.wait(drain_timeout)
+    await cancel_and_release(registry, pending, sqs, queue_url)
+
+
+async def cancel_and_release(
+    registry: TaskRegistry, tasks: Iterable[asyncio.Task], sqs, queue_url: str
+) -> None:
+    tasks = list(tasks)
+    # Los receipt handles se obtienen antes de cancelar porque al terminar
+    # los tasks se eliminan del registro
+    receipt_handles = registry.receipt_handles(tasks)
+    for bg_task in tasks:
+        bg_task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await release_messages(sqs, queue_url, receipt_handles)
 
 
 def task(
@@ -86,46 +266,535 @@ def task(
     visibility_timeout: int = 3600,
     max_retries: int = 1,
     max_concurrent_tasks: int = 5,
+    drain_timeout: float = 20,
+    metrics: Optional[TaskMetrics] = None,
+    endpoint_url: Optional[str] = None,
+    max_pool_connections: int = SQS_MAX_POOL_CONNECTIONS,
+    receive_backoff: BackoffPolicy = BackoffPolicy(),
+    idle_backoff: Optional[BackoffPolicy] = None,
+    dead_letter_sink: Optional[DeadLetterSink] = None,
+    dedup_store: Optional[DedupStore] = None,
+    dedup_key: Optional[Callable[[Any], str]] = None,
+    max_number_of_messages: int = 1,
+    fifo_scheduling: bool = False,
+    rate_limit: Union[float, TokenBucket, None] = None,
+    batch_size: Optional[int] = None,
+    batch_window: float = 1,
+    adaptive_concurrency: Optional[AdaptiveConcurrency] = None,
+    timeout: Optional[float] = None,
+    timeout_backoff: Optional[BackoffPolicy] = None,
+    circuit_breaker: Optional[CircuitBreaker] = None,
+    max_inflight_bytes: Optional[int] = None,
+    claim_check: Optional[ClaimCheck] = None,
 ):
+    """
+    Si el task que ejecuta `start_task` se cancela (p. ej. al recibir SIGTERM
+    y apagar el event loop) el consumidor deja de recibir mensajes, libera
+    los mensajes que no han empezado a ejecutarse y espera a los tasks en
+    ejecución hasta `drain_timeout` segundos antes de propagar la
+    cancelación.
+
+    `metrics` recibe una implementación de `TaskMetrics` (p. ej.
+    `InMemoryMetrics`) para medir el lag del queue, la duración y resultado
+    de cada task, el tamaño de los batches y los mensajes en vuelo.
+
+    El cliente de SQS se comparte con los demás consumidores y productores
+    del proceso que usen la misma región y `endpoint_url`.
+
+    Los errores temporales al recibir mensajes (los que
+    `RetryPolicy.is_retryable` acepta: conexión, throttling, `InternalError`)
+    se reintentan con `receive_backoff`. Con `idle_backoff` el consumidor espera cada vez más
+    entre recepciones vacías consecutivas, útil para queues con poco tráfico.
+
+    Con `dead_letter_sink` los mensajes que no son JSON válido, los que
+    terminan en una excepción y los que agotan sus reintentos se envían al
+    sink con la razón del error, el número de recepciones y el traceback.
+    Después se borran del queue para que no vuelvan a recibirse.
+
+    Con `dedup_store` (o solo `dedup_key`, que usa `InMemoryDedupStore`) los
+    mensajes repetidos se borran sin ejecutar el task. La llave es el
+    `MessageId` o el resultado de `dedup_key(body)`. Si el task pide un
+    reintento o se cancela (aunque no haya empezado) la llave se libera para
+    que pueda procesarse de nuevo. Un repetido que llega mientras el
+    original sigue en ejecución no se borra: se deja en el queue hasta que
+    termine su `visibility_timeout`. Si `dedup_key` falla el mensaje se
+    ejecuta sin deduplicar.
+
+    `max_number_of_messages` (1 a 10) es el número de mensajes que se piden
+    en cada `receive_message`. En queues FIFO un mismo batch puede traer
+    varios mensajes del mismo grupo; con `fifo_scheduling` se ejecuta a lo
+    más un mensaje por `MessageGroupId` a la vez, en orden, mientras que los
+    grupos distintos se ejecutan en paralelo. Si un mensaje no se borra
+    (p. ej. pide un reintento), los mensajes siguientes de su grupo
+    regresan al queue con visibilidad 0 sin ejecutarse hasta que ese
+    mensaje se vuelve a recibir.
+
+    `rate_limit` limita los mensajes por segundo que se reciben y ejecutan.
+    Puede ser un número o un `TokenBucket` compartido entre varios tasks.
+
+    Con `batch_size` el task recibe una lista con hasta `batch_size`
+    mensajes validados. El batch se envía al llenarse o `batch_window`
+    segundos después de recibir su primer mensaje. El task puede regresar un
+    `BatchResult` con los índices de los mensajes que deben reintentarse;
+    los demás se borran con `delete_message_batch`.
+
+    Con `adaptive_concurrency` se ignora `max_concurrent_tasks` y el número
+    de tasks concurrentes se ajusta solo según la latencia y los errores de
+    los tasks (ver `AdaptiveConcurrency`). Un reintento cuenta como error.
+    El límite actual está en `adaptive_concurrency.limit`.
+
+    Con `timeout` se cancela el task que tarda más de `timeout` segundos.
+    El mensaje se libera con visibilidad 0 para reintentarse de inmediato o,
+    con `timeout_backoff`, después de `timeout_backoff.delay(recepciones -
+    1)` segundos. Un `TimeoutError` que lanza el propio task antes del plazo
+    se trata como cualquier otro error. Al agotar `max_retries` se borra (y se envía a
+    `dead_letter_sink`) como cualquier otro error.
+
+    Con `circuit_breaker` el consumidor deja de recibir mensajes cuando la
+    proporción de tasks con error o reintento supera el umbral. Al abrirse,
+    los mensajes recibidos que aún no empiezan se regresan al queue con
+    visibilidad 0. Pasado `reset_timeout` se ejecutan tasks de prueba para
+    decidir si se cierra de nuevo. El estado actual está en
+    `circuit_breaker.state`.
+
+    Cada ejecución de `start_task` lleva sus tasks en vuelo en un
+    `TaskRegistry`. Para inspeccionarlos o esperarlos se le pasa uno propio:
+    `start_task(registry=registry)`.
+
+    Con `max_inflight_bytes` se deja de recibir mensajes mientras la suma
+    del tamaño de los bodies en vuelo llegue a ese límite. Como se revisa
+    antes de cada `receive_message`, un batch recibido puede excederlo por a
+    lo más `max_number_of_messages` mensajes.
+
+    Con `claim_check` los mensajes que son un apuntador a un blob (ver
+    `ClaimCheck` y `SqsClient(claim_check=...)`) se reemplazan por el body
+    guardado antes de validarlo, y el blob se borra al borrar el mensaje.
+    Para `max_inflight_bytes` cuenta el tamaño del body recuperado. Si el
+    blob no puede leerse el mensaje se deja en el queue para reintentarse
+    al terminar su `visibility_timeout`; al agotar `max_retries` se borra
+    (y se envía a `dead_letter_sink`), p. ej. un duplicado cuyo blob ya se
+    borró al procesar el original.
+    """
+    if batch_size and (
+        fifo_scheduling or dedup_store or dedup_key or timeout or claim_check
+    ):
+        raise ValueError(
+            'batch_size can not be combined with fifo_scheduling, dedup, '
+            'timeout or claim_check'
+        )
+    if batch_size:
+        max_number_of_messages = max(
+            max_number_of_messages, min(batch_size, SQS_BATCH_SIZE)
+        )
+
+    if dedup_key and dedup_store is None:
+        dedup_store = InMemoryDedupStore()
+    rate_limiter = (
+        TokenBucket(rate_limit)
+        if isinstance(rate_limit, (int, float))
+        else rate_limit
+    )
+
     def task_builder(task_func: Callable):
+        # El parser del mensaje se construye una sola vez al decorar
+        task_with_validators = validated_task(task_func)
+        parse_batch_item = build_parser(batch_item_type(task_func))
+
         @wraps(task_func)
-        async def start_task(*args, **kwargs) -> None:
+        async def start_task(
+            *args, registry: Optional[TaskRegistry] = None, **kwargs
+        ) -> None:
+            # Tasks en vuelo de este consumidor
+            in_flight = registry if registry is not None else TaskRegistry()
             can_read = asyncio.Event()
-            concurrency_semaphore = asyncio.Semaphore(max_concurrent_tasks)
+            limiter = ConcurrencyLimiter(
+                max_concurrent_tasks, adaptive_concurrency
+            )
             can_read.set()
+            message_groups = MessageGroupScheduler()
+            # Mensajes que esperan completar un batch en modo batch
+            batch: List[Dict] = []
+            batch_bodies: List[Any] = []
+            batch_bytes = 0
+            batch_timer: Optional[asyncio.TimerHandle] = None
+            # Tamaño de los bodies de los mensajes en vuelo
+            inflight_bytes = 0
+            # Llaves de dedup de los mensajes en vuelo
+            inflight_keys: Set[str] = set()
 
-            async def concurrency_controller(coro: Coroutine) -> None:
-                async with concurrency_semaphore:
-                    if concurrency_semaphore.locked():
-                        can_read.clear()
+            def record_in_flight(_: asyncio.Task) -> None:
+                if metrics:
+                    metrics.record_in_flight(len(in_flight))
 
-                    try:
-                        await coro
-                    finally:
-                        can_read.set()
+            def resume_reading() -> None:
+                if (
+                    not limiter.locked()
+                    and (
+                        circuit_breaker is None
+                        or circuit_breaker.state is CircuitState.closed
+                    )
+                    and (
+                        max_inflight_bytes is None
+                        or inflight_bytes < max_inflight_bytes
+                    )
+                ):
+                    can_read.set()
 
-            session = get_session()
+            def track_bytes(size: int) -> None:
+                nonlocal inflight_bytes
+                inflight_bytes += size
+                if max_inflight_bytes and inflight_bytes >= max_inflight_bytes:
+                    can_read.clear()
 
-            task_with_validators = validate_arguments(task_func)
+            def release_bytes(size: int, _: asyncio.Task) -> None:
+                nonlocal inflight_bytes
+                inflight_bytes -= size
+                resume_reading()
 
-            async with session.create_client('sqs', region_name) as sqs:
-                async for message in message_consumer(
-                    queue_url,
-                    wait_time_seconds,
-                    visibility_timeout,
-                    can_read,
-                    sqs,
-                ):
-                    try:
-                        body = json.loads(message['Body'])
-                    except JSONDecodeError:
-                        continue
+            async def group_message_deleted(
+                group_id: str,
+                message_id: str,
+                on_delete: Optional[Callable[[], Awaitable]],
+            ) -> None:
+                message_groups.unblock(group_id, message_id)
+                if on_delete:
+                    await on_delete()
 
-                    message_receive_count = int(
-                        message['Attributes']['ApproximateReceiveCount']
+            async def discard_message(
+                message: Dict,
+                receive_count: int,
+                reason: FailureReason,
+                body: Any = None,
+            ) -> None:
+                # Debe llamarse dentro del `except` que atrapó el error (ver
+                # `send_dead_letter`). Si el sink o el borrado fallan el
+                # mensaje se queda en el queue y se intenta de nuevo al
+                # terminar su `visibility_timeout`
+                try:
+                    if dead_letter_sink:
+                        await send_dead_letter(
+                            dead_letter_sink,
+                            queue_url,
+                            message,
+                            receive_count,
+                            reason,
+                            body,
+                        )
+                    await sqs.delete_message(
+                        QueueUrl=queue_url,
+                        ReceiptHandle=message['ReceiptHandle'],
+                    )
+                except Exception:
+                    logger.exception(
+                        'Could not dead-letter message %s',
+                        message.get('MessageId'),
                     )
-                    bg_task = asyncio.create_task(
-                        concurrency_controller(
+
+            def release_key(key: str, _: asyncio.Task) -> None:
+                inflight_keys.discard(key)
+
+            def pause_reading() -> None:
+                can_read.clear()
+                if circuit_breaker:
+                    # Al pasar a medio abierto se reciben los mensajes de
+                    # prueba. En medio abierto se vuelve a leer cuando los
+                    # tasks de prueba terminan, o después de `reset_timeout`
+                    # si alguno nunca registra su resultado
+                    asyncio.get_running_loop().call_later(
+                        circuit_breaker.retry_after
+                        or circuit_breaker.reset_timeout,
+                        can_read.set,
+                    )
+
+            async def refuse(message: Dict) -> bool:
+                # El permiso se pide justo antes de ejecutar el mensaje para
+                # que los mensajes descartados no gasten un task de prueba
+                if circuit_breaker is None or circuit_breaker.allow():
+                    return False
+                await release_messages(
+                    sqs, queue_url, [message['ReceiptHandle']]
+                )
+                pause_reading()
+                return True
+
+            async def record_result(started_at: float, healthy: bool) -> None:
+                limiter.record(time.monotonic() - started_at, healthy)
+                if metrics and adaptive_concurrency:
+                    metrics.record_concurrency_limit(limiter.limit)
+                if circuit_breaker and circuit_breaker.record(healthy):
+                    # El circuito se abrió: los mensajes que no han empezado
+                    # regresan al queue para no gastar sus reintentos
+                    pause_reading()
+                    await cancel_and_release(
+                        in_flight, in_flight.unstarted, sqs, queue_url
+                    )
+
+            async def concurrency_controller(
+                coro: Coroutine,
+                receipt_handles: List[str],
+                group_id: Optional[str] = None,
+                on_cancel: Optional[Callable[[], Awaitable]] = None,
+                message_id: str = '',
+            ) -> None:
+                started = False
+                try:
+                    async with message_groups.hold(group_id):
+                        if message_groups.blocked(group_id):
+                            # Un mensaje anterior del grupo no se borró y se
+                            # recibirá de nuevo, así que este mensaje regresa
+                            # al queue para no ejecutarse antes que él
+                            if on_cancel:
+                                await on_cancel()
+                            await release_messages(
+                                sqs, queue_url, receipt_handles
+                            )
+                            return
+                        await limiter.acquire()
+                        in_flight.mark_started(
+                            asyncio.current_task()  # type: ignore
+                        )
+                        if limiter.locked():
+                            can_read.clear()
+
+                        started = True
+                        # Se desbloquea al borrar el mensaje o al recibirlo
+                        # de nuevo
+                        message_groups.block(group_id, message_id)
+                        started_at = time.monotonic()
+                        try:
+                            outcome = await coro
+                        except asyncio.CancelledError:
+                            raise
+                        except Exception:
+                            await record_result(started_at, False)
+                            raise
+                        else:
+                            await record_result(
+                                started_at, outcome in (None, TaskOutcome.ok)
+                            )
+                        finally:
+                            limiter.release()
+                            # Si el límite adaptativo bajó puede seguir lleno
+                            resume_reading()
+                except asyncio.CancelledError:
+                    # `coro` no alcanzó a ejecutarse, así que su limpieza
+                    # se hace aquí
+                    if not started and on_cancel:
+                        await on_cancel()
+                    raise
+                finally:
+                    # Si el task se canceló antes de empezar `coro` nunca se
+                    # ejecutó. Cerrarla evita el warning de corutina sin
+                    # await; si ya terminó `close` no hace nada
+                    coro.close()
+
+            def dispatch(
+                coro: Coroutine,
+                receipt_handles: List[str],
+                size: int,
+                group_id: Optional[str] = None,
+                on_cancel: Optional[Callable[[], Awaitable]] = None,
+                message_id: str = '',
+            ) -> asyncio.Task:
+                bg_task = asyncio.create_task(
+                    concurrency_controller(
+                        coro, receipt_handles, group_id, on_cancel, message_id
+                    ),
+                    name='fast-agave-task',
+                )
+                in_flight.add(bg_task, receipt_handles)
+                bg_task.add_done_callback(record_in_flight)
+                bg_task.add_done_callback(partial(release_bytes, size))
+                record_in_flight(bg_task)
+                return bg_task
+
+            def flush_batch() -> None:
+                nonlocal batch, batch_bodies, batch_bytes, batch_timer
+                if batch_timer:
+                    batch_timer.cancel()
+                    batch_timer = None
+                if not batch:
+                    return
+                messages, bodies, size = batch, batch_bodies, batch_bytes
+                batch, batch_bodies, batch_bytes = [], [], 0
+                dispatch(
+                    run_batch_task(
+                        task_func,
+                        parse_batch_item,
+                        messages,
+                        bodies,
+                        sqs,
+                        queue_url,
+                        max_retries,
+                        metrics,
+                        dead_letter_sink,
+                    ),
+                    [m['ReceiptHandle'] for m in messages],
+                    size,
+                )
+
+            async with sqs_client(
+                region_name, endpoint_url, max_pool_connections
+            ) as sqs:
+                try:
+                    async for message in message_consumer(
+                        queue_url,
+                        wait_time_seconds,
+                        visibility_timeout,
+                        can_read,
+                        sqs,
+                        metrics,
+                        receive_backoff,
+                        idle_backoff,
+                        max_number_of_messages,
+                        rate_limiter,
+                    ):
+                        attributes = message['Attributes']
+                        message_receive_count = int(
+                            attributes['ApproximateReceiveCount']
+                        )
+                        try:
+                            body = json.loads(message['Body'])
+                        except JSONDecodeError:
+                            if metrics:
+                                metrics.record_task(TaskOutcome.dropped, 0)
+                            if dead_letter_sink:
+                                await discard_message(
+                                    message,
+                                    message_receive_count,
+                                    FailureReason.invalid_json,
+                                )
+                            continue
+
+                        # Solo se conserva el body decodificado. Si el
+                        # mensaje llega a `dead_letter_sink` se vuelve a
+                        # serializar
+                        size = len(message.pop('Body').encode('utf-8'))
+                        on_delete = None
+                        blob_key = (
+                            claim_check.blob_key(body) if claim_check else None
+                        )
+                        if claim_check and blob_key:
+                            try:
+                                data = await claim_check.fetch(blob_key)
+                                body = json.loads(data)
+                            except Exception:
+                                logger.exception(
+                                    'Could not load blob %s', blob_key
+                                )
+                                if metrics:
+                                    metrics.record_task(TaskOutcome.error, 0)
+                                # Un duplicado cuyo original ya se borró no
+                                # encontrará su blob, así que también agota
+                                # sus reintentos
+                                if message_receive_count >= max_retries + 1:
+                                    await discard_message(
+                                        message,
+                                        message_receive_count,
+                                        FailureReason.claim_check,
+                                        body,
+                                    )
+                                continue
+                            size = len(data)
+                            on_delete = partial(claim_check.release, blob_key)
+
+                        if batch_size:
+                            # Todo el batch es un solo task, así que solo su
+                            # primer mensaje pide permiso
+                            if not batch and await refuse(message):
+                                continue
+                            track_bytes(size)
+                            batch.append(message)
+                            batch_bodies.append(body)
+                            batch_bytes += size
+                            if len(batch) >= batch_size:
+                                flush_batch()
+                            elif batch_timer is None:
+                                # El batch se envía al llenarse o cuando
+                                # pasa `batch_window` desde su primer mensaje
+                                batch_timer = (
+                                    asyncio.get_running_loop().call_later(
+                                        batch_window, flush_batch
+                                    )
+                                )
+                            continue
+
+                        message_key = None
+                        if dedup_store is not None:
+                            try:
+                                message_key = (
+                                    dedup_key(body)
+                                    if dedup_key
+                                    else message['MessageId']
+                                )
+                            except Exception:
+                                # Sin llave el mensaje se ejecuta sin
+                                # deduplicar
+                                logger.exception(
+                                    'Could not compute dedup key of %s',
+                                    message['MessageId'],
+                                )
+                        if message_key in inflight_keys:
+                            # El original sigue en ejecución y aún puede
+                            # pedir un reintento, así que el mensaje se deja
+                            # en el queue hasta que termine su visibilidad
+                            continue
+                        if (
+                            dedup_store is not None
+                            and message_key
+                            and not await dedup_store.add(message_key)
+                        ):
+                            if metrics:
+                                metrics.record_task(TaskOutcome.duplicate, 0)
+                            await sqs.delete_message(
+                                QueueUrl=queue_url,
+                                ReceiptHandle=message['ReceiptHandle'],
+                            )
+                            if on_delete:
+                                await on_delete()
+                            continue
+
+                        # `SentTimestamp` está en milisegundos
+                        sent_timestamp = (
+                            int(attributes['SentTimestamp']) / 1000
+                            if 'SentTimestamp' in attributes
+                            else None
+                        )
+                        dead_letter = (
+                            partial(
+                                send_dead_letter,
+                                dead_letter_sink,
+                                queue_url,
+                                message,
+                                message_receive_count,
+                                body=body,
+                            )
+                            if dead_letter_sink
+                            else None
+                        )
+                        if await refuse(message):
+                            if dedup_store is not None and message_key:
+                                await dedup_store.discard(message_key)
+                            continue
+                        group_id = (
+                            attributes.get('MessageGroupId')
+                            if fifo_scheduling
+                            else None
+                        )
+                        if group_id is not None:
+                            # El mensaje que bloqueaba su grupo volvió a
+                            # recibirse, así que ya puede ejecutarse en orden
+                            message_groups.unblock(
+                                group_id, message['MessageId']
+                            )
+                            on_delete = partial(
+                                group_message_deleted,
+                                group_id,
+                                message['MessageId'],
+                                on_delete,
+                            )
+                        track_bytes(size)
+                        bg_task = dispatch(
                             run_task(
                                 task_with_validators,
                                 body,
@@ -134,19 +803,44 @@ def task(
                                 message['ReceiptHandle'],
                                 message_receive_count,
                                 max_retries,
+                                metrics,
+                                sent_timestamp,
+                                dead_letter,
+                                dedup_store,
+                                message_key,
+                                timeout,
+                                timeout_backoff,
+                                on_delete,
                             ),
-                        ),
-                        name='fast-agave-task',
+                            [message['ReceiptHandle']],
+                            size,
+                            group_id,
+                            partial(dedup_store.discard, message_key)
+                            if dedup_store is not None and message_key
+                            else None,
+                            message['MessageId'],
+                        )
+                        if message_key:
+                            inflight_keys.add(message_key)
+                            bg_task.add_done_callback(
+                                partial(release_key, message_key)
+                            )
+
+                    flush_batch()
+                    # Espera a que terminen los tasks pendientes de este
+                    # consumidor. De esta forma los tasks podrán borrar el
+                    # mensaje del queue usando la misma instancia del cliente
+                    # de SQS. `shield` evita que una cancelación en este punto
+                    # cancele también a los tasks
+                    await asyncio.shield(asyncio.gather(*in_flight))
+                except asyncio.CancelledError:
+                    if batch_timer:
+                        batch_timer.cancel()
+                    await release_messages(
+                        sqs, queue_url, (m['ReceiptHandle'] for m in batch)
                     )
-                    BACKGROUND_TASKS.add(bg_task)
-                    bg_task.add_done_callback(BACKGROUND_TASKS.discard)
-
-                # Espera a que terminen todos los tasks pendientes creados por
-                # `asyncio.create_task`. De esta forma los tasks
-                # podrán borrar el mensaje del queue usando la misma instancia
-                # del cliente de SQS
-                running_tasks = await get_running_fast_agave_tasks()
-                await asyncio.gather(*running_tasks)
+                    await drain_tasks(in_flight, sqs, queue_url, drain_timeout)
+                    raise
 
         return start_task
 
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import os
+import signal
+import sys
+import time
+from dataclasses import dataclass, field
+from importlib import import_module
+from multiprocessing import Process
+from multiprocessing.connection import wait
+from typing import Callable, List, Optional
+
+from .backoff import BackoffPolicy
+from .client_registry import close_sqs_clients
+
+logger = logging.getLogger(__name__)
+
+SHUTDOWN_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+
+def load_tasks(target: str) -> List[Callable]:
+    """
+    Importa los tasks de `target` con el formato `modulo:task_a,task_b`.
+    El módulo se busca también en el directorio actual, que no está en
+    `sys.path` cuando se ejecuta el script `fast-agave`
+    """
+    module_name, _, names = target.partition(':')
+    if not module_name or not names:
+        raise ValueError(f'Invalid target {target!r}, use module:task,...')
+    cwd = os.getcwd()
+    if cwd not in sys.path:
+        sys.path.insert(0, cwd)
+    module = import_module(module_name)
+    tasks = []
+    for name in names.split(','):
+        task_func = getattr(module, name.strip(), None)
+        if not callable(task_func):
+            raise ValueError(f'{module_name} has no task {name!r}')
+        tasks.append(task_func)
+    return tasks
+
+
+async def run_tasks(tasks: List[Callable]) -> None:
+    """
+    Ejecuta los consumidores hasta recibir SIGINT o SIGTERM. Al recibir la
+    señal los consumidores se cancelan, lo que libera los mensajes
+    pendientes y espera a los tasks en ejecución (ver `task`). Si algún
+    consumidor termina con un error se cancelan los demás y se propaga.
+    """
+    loop = asyncio.get_running_loop()
+    consumers = [asyncio.create_task(task_func()) for task_func in tasks]
+    stopping = False
+
+    def shutdown() -> None:
+        # Una segunda señal (p. ej. Ctrl+C y el SIGTERM del supervisor)
+        # interrumpiría a `drain_tasks`, que ya corre por la primera
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        for consumer in consumers:
+            consumer.cancel()
+
+    for sig in SHUTDOWN_SIGNALS:
+        loop.add_signal_handler(sig, shutdown)
+    try:
+        done, _ = await asyncio.wait(
+            consumers, return_when=asyncio.FIRST_EXCEPTION
+        )
+        shutdown()
+        await asyncio.gather(*consumers, return_exceptions=True)
+        for consumer in done:
+            if not consumer.cancelled() and consumer.exception():
+                raise consumer.exception()  # type: ignore
+    finally:
+        for sig in SHUTDOWN_SIGNALS:
+            loop.remove_signal_handler(sig)
+        await close_sqs_clients()
+
+
+def run_worker(target: str) -> None:
+    # Con `fork` el proceso hereda los handlers del supervisor
+    for sig in SHUTDOWN_SIGNALS:
+        signal.signal(sig, signal.SIG_DFL)
+    asyncio.run(run_tasks(load_tasks(target)))
+
+
+@dataclass
+class Supervisor:
+    """
+    Mantiene `processes` procesos ejecutando `run_worker(target)`. Los
+    procesos que terminan sin que se haya pedido el apagado se reinician
+    con `restart_backoff`; el número de intento se reinicia cuando el
+    proceso duró más de `restart_backoff.cap` segundos. SIGINT y SIGTERM se
+    reenvían a los procesos como SIGTERM y se espera a que terminen.
+    """
+
+    target: str
+    processes: int = 1
+    restart_backoff: BackoffPolicy = BackoffPolicy()
+    worker: Callable[[str], None] = run_worker
+    stopping: bool = field(default=False, init=False)
+    _workers: List[Optional[Process]] = field(default_factory=list, init=False)
+    _started_at: List[float] = field(default_factory=list, init=False)
+    _restarts: List[int] = field(default_factory=list, init=False)
+    _restart_at: List[float] = field(default_factory=list, init=False)
+
+    def start(self, slot: int) -> None:
+        process = Process(
+            target=self.worker,
+            args=(self.target,),
+            name=f'fast-agave-worker-{slot}',
+        )
+        process.start()
+        self._workers[slot] = process
+        self._started_at[slot] = time.monotonic()
+        if self.stopping:
+            # La señal llegó antes de registrar el proceso en `_workers`
+            process.terminate()
+
+    def stop(self, *_) -> None:
+        self.stopping = True
+        for process in self._workers:
+            if process and process.is_alive():
+                process.terminate()
+
+    def run(self) -> None:
+        self._workers = [None] * self.processes
+        self._started_at = [0.0] * self.processes
+        self._restarts = [0] * self.processes
+        self._restart_at = [0.0] * self.processes
+        handlers = {
+            sig: signal.signal(sig, self.stop) for sig in SHUTDOWN_SIGNALS
+        }
+        for slot in range(self.processes):
+            # Una señal durante el arranque no debe dejar procesos sin
+            # terminar
+            if self.stopping:
+                break
+            self.start(slot)
+
+        while not self.stopping:
+            sentinels = [p.sentinel for p in self._workers if p]
+            wait(sentinels, timeout=1)
+            now = time.monotonic()
+            for slot, process in enumerate(self._workers):
+                if self.stopping:
+                    break
+                if process and not process.is_alive():
+                    self._schedule_restart(slot, process, now)
+                elif not process and now >= self._restart_at[slot]:
+                    self.start(slot)
+
+        for process in self._workers:
+            if process:
+                process.join()
+        for sig, handler in handlers.items():
+            signal.signal(sig, handler)
+
+    def _schedule_restart(
+        self, slot: int, process: Process, now: float
+    ) -> None:
+        process.join()
+        if now - self._started_at[slot] > self.restart_backoff.cap:
+            self._restarts[slot] = 0
+        delay = self.restart_backoff.delay(self._restarts[slot])
+        self._restarts[slot] += 1
+        self._restart_at[slot] = now + delay
+        self._workers[slot] = None
+        logger.warning(
+            '%s exited with code %s, restarting in %.1fs',
+            process.name,
+            process.exitcode,
+            delay,
+        )
@@ -30,6 +30,10 @@ setup(
         'mongoengine-plus>=0.0.2,<1.0.0',
         'starlette-context>=0.3.2,<0.4.0',
     ],
+    extras_require=dict(orjson=['orjson>=3.6.0,<4.0.0']),
+    entry_points=dict(
+        console_scripts=['fast-agave = fast_agave.cli:main'],
+    ),
     classifiers=[
         'Programming Language :: Python :: 3.8',
         'License :: OSI Approved :: MIT License',
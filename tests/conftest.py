@@ -233,4 +233,7 @@ async def sqs_client():
         )
         sqs.queue_url = resp['QueueUrl']
         yield sqs
-        await sqs.purge_queue(QueueUrl=resp['QueueUrl'])
+        # `purge_queue` no libera los grupos FIFO con mensajes en vuelo, así
+        # que un mensaje invisible podía bloquear su grupo en la siguiente
+        # prueba
+        await sqs.delete_queue(QueueUrl=resp['QueueUrl'])
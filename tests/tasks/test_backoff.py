@@ -0,0 +1,64 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from botocore.exceptions import (
+    ClientError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+from fast_agave.tasks.backoff import BackoffPolicy, RetryPolicy
+
+
+def test_backoff_without_jitter() -> None:
+    policy = BackoffPolicy(base=0.5, cap=3, jitter=False)
+    assert [policy.delay(i) for i in range(5)] == [0.5, 1, 2, 3, 3]
+    assert policy.delay(10_000) == 3
+
+
+def test_backoff_full_jitter() -> None:
+    policy = BackoffPolicy(base=1, cap=10)
+    with patch('random.uniform', return_value=0.7) as uniform:
+        assert policy.delay(2) == 0.7
+    uniform.assert_called_once_with(0, 4)
+
+
+@pytest.mark.asyncio
+async def test_retry_policy() -> None:
+    policy = RetryPolicy(
+        max_attempts=3, backoff=BackoffPolicy(base=1, jitter=False)
+    )
+    throttled = ClientError(
+        dict(Error=dict(Code='ThrottlingException')), 'SendMessage'
+    )
+    invalid = ClientError(
+        dict(Error=dict(Code='InvalidParameterValue')), 'SendMessage'
+    )
+    assert policy.is_retryable(throttled)
+    assert policy.is_retryable(ConnectionError())
+    # Las excepciones que lanza aiobotocore al fallar la conexión
+    assert policy.is_retryable(
+        EndpointConnectionError(endpoint_url='http://sqs')
+    )
+    assert policy.is_retryable(ConnectTimeoutError(endpoint_url='http://sqs'))
+    assert policy.is_retryable(ReadTimeoutError(endpoint_url='http://sqs'))
+    assert not policy.is_retryable(invalid)
+    assert not policy.is_retryable('InvalidMessageContents')
+
+    func = AsyncMock(side_effect=[throttled, throttled, 'ok'])
+    with patch('asyncio.sleep') as sleep:
+        assert await policy.run(func) == 'ok'
+    assert [c.args[0] for c in sleep.call_args_list] == [1, 2]
+
+    # Se agotan los intentos
+    func = AsyncMock(side_effect=throttled)
+    with patch('asyncio.sleep'), pytest.raises(ClientError):
+        await policy.run(func)
+    assert func.await_count == 3
+
+    # Los errores que no son temporales no se reintentan
+    func = AsyncMock(side_effect=invalid)
+    with pytest.raises(ClientError):
+        await policy.run(func)
+    assert func.await_count == 1
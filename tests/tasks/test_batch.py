@@ -0,0 +1,186 @@
+import json
+from typing import List
+from unittest.mock import AsyncMock
+
+import pytest
+from pydantic import BaseModel
+
+from fast_agave.exc import RetryTask
+from fast_agave.tasks.backoff import BackoffPolicy, RetryPolicy
+from fast_agave.tasks.batch import (
+    BatchResult,
+    change_messages_visibility,
+    delete_messages,
+    run_batch_task,
+)
+from fast_agave.tasks.dead_letter import FailureReason, InMemorySink
+from fast_agave.tasks.metrics import InMemoryMetrics, TaskOutcome
+from fast_agave.tasks.parsers import batch_item_type, build_parser
+
+QUEUE_URL = 'http://queue'
+
+
+class User(BaseModel):
+    id: str
+
+
+def make_message(i: int, receive_count: int = 1) -> dict:
+    return dict(
+        MessageId=str(i),
+        ReceiptHandle=f'handle-{i}',
+        Body=json.dumps(dict(id=str(i))),
+        Attributes=dict(ApproximateReceiveCount=str(receive_count)),
+    )
+
+
+def deleted_handles(sqs: AsyncMock) -> List[str]:
+    return [
+        entry['ReceiptHandle']
+        for c in sqs.delete_message_batch.await_args_list
+        for entry in c.kwargs['Entries']
+    ]
+
+
+async def run(task_func, messages, **kwargs) -> AsyncMock:
+    sqs = AsyncMock()
+    sqs.delete_message_batch.return_value = {}
+    sqs.change_message_visibility_batch.return_value = {}
+    await run_batch_task(
+        task_func,
+        build_parser(batch_item_type(task_func)),
+        messages,
+        [json.loads(m['Body']) for m in messages],
+        sqs,
+        QUEUE_URL,
+        max_retries=1,
+        **kwargs,
+    )
+    return sqs
+
+
+def test_batch_item_type() -> None:
+    async def users_task(users: List[User]) -> None:
+        ...  # pragma: no cover
+
+    async def untyped_task(users) -> None:
+        ...  # pragma: no cover
+
+    assert batch_item_type(users_task) is User
+    assert build_parser(batch_item_type(untyped_task))(dict(a=1)) == dict(a=1)
+
+
+@pytest.mark.asyncio
+async def test_run_batch_task() -> None:
+    received = []
+
+    async def users_task(users: List[User]) -> None:
+        received.extend(users)
+
+    sqs = await run(users_task, [make_message(i) for i in range(12)])
+    assert [u.id for u in received] == [str(i) for i in range(12)]
+    # Se borran en batches de a lo más 10 mensajes
+    assert sqs.delete_message_batch.await_count == 2
+    assert deleted_handles(sqs) == [f'handle-{i}' for i in range(12)]
+
+
+@pytest.mark.asyncio
+async def test_run_batch_task_partial_retry() -> None:
+    async def users_task(users: List[User]) -> BatchResult:
+        return BatchResult(retry=[0, 1], countdown=30)
+
+    metrics = InMemoryMetrics()
+    sink = InMemorySink()
+    messages = [make_message(0), make_message(1, 2), make_message(2)]
+    sqs = await run(
+        users_task, messages, metrics=metrics, dead_letter_sink=sink
+    )
+
+    # El mensaje 1 ya agotó sus reintentos
+    assert deleted_handles(sqs) == ['handle-1', 'handle-2']
+    assert [d.reason for d in sink.dead_letters] == [FailureReason.max_retries]
+    visibility = sqs.change_message_visibility_batch.await_args.kwargs
+    assert visibility['Entries'] == [
+        dict(Id='0', ReceiptHandle='handle-0', VisibilityTimeout=30)
+    ]
+    assert metrics.outcomes[TaskOutcome.ok] == 1
+    assert metrics.outcomes[TaskOutcome.retry] == 1
+    assert metrics.outcomes[TaskOutcome.error] == 1
+
+
+@pytest.mark.asyncio
+async def test_run_batch_task_retry_all() -> None:
+    async def users_task(users: List[User]) -> None:
+        raise RetryTask
+
+    sqs = await run(users_task, [make_message(0), make_message(1)])
+    assert deleted_handles(sqs) == []
+    sqs.change_message_visibility_batch.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_run_batch_task_invalid_item() -> None:
+    received = []
+
+    async def users_task(users: List[User]) -> None:
+        received.extend(users)
+
+    invalid = make_message(1)
+    invalid['Body'] = json.dumps(dict(name='no id'))
+    sink = InMemorySink()
+    sqs = await run(
+        users_task, [make_message(0), invalid], dead_letter_sink=sink
+    )
+    assert [u.id for u in received] == ['0']
+    assert [d.message_id for d in sink.dead_letters] == ['1']
+    assert sorted(deleted_handles(sqs)) == ['handle-0', 'handle-1']
+
+
+@pytest.mark.asyncio
+async def test_run_batch_task_error() -> None:
+    async def users_task(users: List[User]) -> None:
+        raise ValueError
+
+    sink = InMemorySink()
+    with pytest.raises(ValueError):
+        await run(
+            users_task,
+            [make_message(0), make_message(1)],
+            dead_letter_sink=sink,
+        )
+    assert [d.reason for d in sink.dead_letters] == [FailureReason.error] * 2
+
+
+@pytest.mark.asyncio
+async def test_delete_messages_failed_entries(caplog) -> None:
+    sqs = AsyncMock()
+    sqs.delete_message_batch.side_effect = [
+        dict(
+            Successful=[dict(Id='0')],
+            Failed=[
+                dict(Id='1', Code='InternalError', SenderFault=False),
+                dict(Id='2', Code='ReceiptHandleIsInvalid', SenderFault=True),
+            ],
+        ),
+        dict(Successful=[dict(Id='1')]),
+    ]
+    policy = RetryPolicy(backoff=BackoffPolicy(base=0, jitter=False))
+    await delete_messages(sqs, 'queue', ['h0', 'h1', 'h2'], policy)
+
+    # Solo se reintenta la entrada que falló del lado de SQS
+    retry = sqs.delete_message_batch.call_args_list[1].kwargs['Entries']
+    assert retry == [dict(Id='1', ReceiptHandle='h1')]
+    assert 'ReceiptHandleIsInvalid' in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_change_messages_visibility_retries_exhausted(caplog) -> None:
+    sqs = AsyncMock()
+    sqs.change_message_visibility_batch.return_value = dict(
+        Failed=[dict(Id='0', Code='InternalError', SenderFault=False)]
+    )
+    policy = RetryPolicy(
+        max_attempts=2, backoff=BackoffPolicy(base=0, jitter=False)
+    )
+    await change_messages_visibility(sqs, 'queue', ['h0'], 0, policy)
+    assert sqs.change_message_visibility_batch.await_count == 2
+    assert 'InternalError' in caplog.text
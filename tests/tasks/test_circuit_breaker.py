@@ -0,0 +1,46 @@
+from unittest.mock import patch
+
+import pytest
+
+from fast_agave.tasks.circuit_breaker import CircuitBreaker, CircuitState
+
+
+def test_circuit_breaker() -> None:
+    breaker = CircuitBreaker(
+        failure_rate=0.5, window=4, min_calls=4, reset_timeout=10
+    )
+    with patch('time.monotonic', return_value=0):
+        for healthy in (True, True, False):
+            assert not breaker.record(healthy)
+        assert breaker.state is CircuitState.closed
+        assert breaker.record(False)
+        assert breaker.state is CircuitState.open
+        assert breaker.retry_after == 10
+        assert not breaker.allow()
+
+    with patch('time.monotonic', return_value=10):
+        assert breaker.state is CircuitState.half_open
+        assert breaker.allow()
+        # Solo se permite un task de prueba a la vez
+        assert not breaker.allow()
+        assert breaker.record(False)
+        assert breaker.state is CircuitState.open
+
+    with patch('time.monotonic', return_value=20):
+        assert breaker.allow()
+        assert not breaker.record(True)
+        assert breaker.state is CircuitState.closed
+        assert breaker.allow()
+
+
+def test_circuit_breaker_ignores_results_while_open() -> None:
+    breaker = CircuitBreaker(window=2, min_calls=2)
+    breaker.record(False)
+    assert breaker.record(False)
+    assert not breaker.record(True)
+    assert breaker.state is CircuitState.open
+
+
+def test_circuit_breaker_invalid_failure_rate() -> None:
+    with pytest.raises(ValueError):
+        CircuitBreaker(failure_rate=0)
@@ -0,0 +1,48 @@
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+
+from fast_agave.tasks.claim_check import ClaimCheck, LocalBlobStore
+
+
+@pytest.mark.asyncio
+async def test_local_blob_store(tmp_path) -> None:
+    store = LocalBlobStore(str(tmp_path / 'blobs'))
+    await store.put('key', b'data')
+    assert await store.get('key') == b'data'
+    await store.delete('key')
+    with pytest.raises(FileNotFoundError):
+        await store.get('key')
+    # Borrar una llave que no existe no falla
+    await store.delete('key')
+
+
+@pytest.mark.asyncio
+async def test_claim_check_offload(tmp_path) -> None:
+    store = LocalBlobStore(str(tmp_path))
+    claim_check = ClaimCheck(store, threshold=100)
+
+    small = json.dumps(dict(data='x'))
+    assert await claim_check.offload(small) == small
+    assert claim_check.blob_key(json.loads(small)) is None
+
+    big = json.dumps(dict(data='x' * 1000))
+    pointer = await claim_check.offload(big)
+    assert len(pointer) < 100
+    key = claim_check.blob_key(json.loads(pointer))
+    assert key
+    # El blob se guarda comprimido
+    assert len(await store.get(key)) < len(big)
+    assert await claim_check.fetch(key) == big.encode()
+
+    await claim_check.release(key)
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_claim_check_release_error() -> None:
+    store = AsyncMock()
+    store.delete.side_effect = ConnectionError
+    await ClaimCheck(store).release('key')
+    store.delete.assert_awaited_once_with('key')
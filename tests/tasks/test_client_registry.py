@@ -0,0 +1,97 @@
+from typing import Dict
+from unittest.mock import AsyncMock
+
+import pytest
+
+from fast_agave.tasks import client_registry
+from fast_agave.tasks.client_registry import (
+    acquire_sqs_client,
+    close_sqs_clients,
+    release_sqs_client,
+    sqs_client,
+)
+from fast_agave.tasks.sqs_client import SqsClient
+from fast_agave.tasks.sqs_tasks import task
+
+CORE_QUEUE_REGION = 'us-east-1'
+
+
+@pytest.mark.asyncio
+async def test_shared_client(aws_endpoint_urls) -> None:
+    first = await acquire_sqs_client(CORE_QUEUE_REGION)
+    second = await acquire_sqs_client(CORE_QUEUE_REGION)
+    assert first is second
+    assert len(client_registry._clients) == 1
+
+    async with sqs_client(CORE_QUEUE_REGION, aws_endpoint_urls['sqs']) as sqs:
+        assert sqs is not first
+        assert len(client_registry._clients) == 2
+    assert len(client_registry._clients) == 1
+
+    await release_sqs_client(CORE_QUEUE_REGION)
+    assert len(client_registry._clients) == 1
+    await release_sqs_client(CORE_QUEUE_REGION)
+    assert len(client_registry._clients) == 0
+    # Liberar un cliente que ya no existe no hace nada
+    await release_sqs_client(CORE_QUEUE_REGION)
+
+
+@pytest.mark.asyncio
+async def test_close_sqs_clients() -> None:
+    await acquire_sqs_client(CORE_QUEUE_REGION)
+    await acquire_sqs_client(CORE_QUEUE_REGION)
+    await close_sqs_clients()
+    assert len(client_registry._clients) == 0
+
+
+@pytest.mark.asyncio
+async def test_producer_and_consumer_share_client(sqs_client) -> None:
+    async_mock_function = AsyncMock()
+
+    async def my_task(data: Dict) -> None:
+        shared = next(iter(client_registry._clients.values()))
+        await async_mock_function(len(client_registry._clients))
+        await async_mock_function(shared.references)
+
+    async with SqsClient(sqs_client.queue_url, CORE_QUEUE_REGION) as queue:
+        await queue.send_message(dict(hola='mundo'))
+        await task(
+            queue_url=sqs_client.queue_url,
+            region_name=CORE_QUEUE_REGION,
+            wait_time_seconds=1,
+            visibility_timeout=1,
+        )(my_task)()
+
+    assert [c[0][0] for c in async_mock_function.call_args_list] == [1, 2]
+    assert len(client_registry._clients) == 0
+
+
+@pytest.mark.asyncio
+async def test_close_twice_keeps_other_references() -> None:
+    other = SqsClient('queue', CORE_QUEUE_REGION)
+    await other.start()
+    queue = SqsClient('queue', CORE_QUEUE_REGION)
+    await queue.start()
+    await queue.close()
+    await queue.close()
+
+    shared = client_registry._clients[
+        client_registry._key(CORE_QUEUE_REGION, None)
+    ]
+    assert shared.references == 1
+    await other.close()
+    assert len(client_registry._clients) == 0
+
+
+@pytest.mark.asyncio
+async def test_release_after_close_sqs_clients() -> None:
+    stale = await acquire_sqs_client(CORE_QUEUE_REGION)
+    await close_sqs_clients()
+    current = await acquire_sqs_client(CORE_QUEUE_REGION)
+    assert current is not stale
+
+    # La referencia anterior ya no existe y no afecta al cliente nuevo
+    await release_sqs_client(CORE_QUEUE_REGION, client=stale)
+    assert len(client_registry._clients) == 1
+    await release_sqs_client(CORE_QUEUE_REGION, client=current)
+    assert len(client_registry._clients) == 0
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from fast_agave.tasks.concurrency import (
+    AdaptiveConcurrency,
+    ConcurrencyLimiter,
+)
+
+
+def test_adaptive_concurrency_increase() -> None:
+    adaptive = AdaptiveConcurrency(max_limit=3, latency_target=1)
+    assert adaptive.limit == 1
+    # El límite sube en uno por cada ventana sana de `limit` tasks
+    for _ in range(1 + 2 + 3):
+        adaptive.record(0.1, True)
+    assert adaptive.limit == 3
+
+
+def test_adaptive_concurrency_decrease() -> None:
+    adaptive = AdaptiveConcurrency(
+        min_limit=2, initial_limit=8, latency_target=1
+    )
+    for _ in range(8):
+        adaptive.record(2, True)
+    assert adaptive.limit == 4
+
+    adaptive.record(0.1, True)
+    adaptive.record(0.1, False)
+    adaptive.record(0.1, True)
+    adaptive.record(0.1, True)
+    assert adaptive.limit == 2
+    # No baja del mínimo
+    for _ in range(2):
+        adaptive.record(0.1, False)
+    assert adaptive.limit == 2
+
+
+def test_adaptive_concurrency_invalid() -> None:
+    with pytest.raises(ValueError):
+        AdaptiveConcurrency(min_limit=5, max_limit=2)
+    with pytest.raises(ValueError):
+        AdaptiveConcurrency(decrease_factor=1)
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limiter() -> None:
+    adaptive = AdaptiveConcurrency(initial_limit=2, latency_target=1)
+    limiter = ConcurrencyLimiter(5, adaptive)
+    await limiter.acquire()
+    await limiter.acquire()
+    assert limiter.locked()
+
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    assert not waiter.done()
+
+    # Dos tasks lentos: el límite baja a 1 y el waiter sigue esperando
+    for _ in range(2):
+        limiter.record(5, True)
+        limiter.release()
+    assert limiter.limit == 1
+    await asyncio.sleep(0)
+    assert waiter.done()
+    assert limiter.in_flight == 1
+
+    cancelled = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+    limiter.release()
+    assert limiter.in_flight == 0
+    assert not limiter.locked()
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+from fast_agave.tasks.dead_letter import (
+    DeadLetter,
+    FailureReason,
+    FileSink,
+    InMemorySink,
+    QueueSink,
+    send_dead_letter,
+)
+
+CORE_QUEUE_REGION = 'us-east-1'
+
+
+def dead_letter() -> DeadLetter:
+    return DeadLetter(
+        queue_url='http://127.0.0.1:4000/123456789012/core.fifo',
+        message_id='abc123',
+        body='not json',
+        reason=FailureReason.invalid_json,
+        receive_count=1,
+    )
+
+
+@pytest.mark.asyncio
+async def test_send_dead_letter() -> None:
+    sink = InMemorySink()
+    message = dict(MessageId='abc123', Body='{}')
+    try:
+        raise ValueError('something went wrong :(')
+    except ValueError:
+        await send_dead_letter(sink, 'queue', message, 3, FailureReason.error)
+    await send_dead_letter(sink, 'queue', message, 1, FailureReason.error)
+
+    first, second = sink.dead_letters
+    assert first.message_id == 'abc123'
+    assert first.receive_count == 3
+    assert first.traceback
+    assert 'ValueError: something went wrong :(' in first.traceback
+    assert second.traceback is None
+
+    # Sin el body original se serializa el body decodificado
+    await send_dead_letter(
+        sink, 'queue', dict(MessageId='abc123'), 1, FailureReason.error, {}
+    )
+    assert sink.dead_letters[-1].body == '{}'
+
+
+@pytest.mark.asyncio
+async def test_file_sink(tmp_path) -> None:
+    path = tmp_path / 'dead_letters.jsonl'
+    sink = FileSink(str(path))
+    await sink.send(dead_letter())
+    await sink.send(dead_letter())
+
+    lines = path.read_text().splitlines()
+    assert len(lines) == 2
+    record = json.loads(lines[0])
+    assert record['reason'] == 'invalid_json'
+    assert record['body'] == 'not json'
+
+
+@pytest.mark.asyncio
+async def test_queue_sink(sqs_client) -> None:
+    sink = QueueSink(sqs_client.queue_url, CORE_QUEUE_REGION)
+    await sink.send(dead_letter())
+
+    resp = await sqs_client.receive_message()
+    record = json.loads(resp['Messages'][0]['Body'])
+    assert record['message_id'] == 'abc123'
+    assert record['receive_count'] == 1
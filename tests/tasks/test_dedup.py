@@ -0,0 +1,40 @@
+from unittest.mock import patch
+
+import pytest
+
+from fast_agave.tasks.dedup import InMemoryDedupStore
+
+
+@pytest.mark.asyncio
+async def test_in_memory_dedup_store() -> None:
+    store = InMemoryDedupStore()
+    assert await store.add('a')
+    assert not await store.add('a')
+    await store.discard('a')
+    assert await store.add('a')
+    await store.discard('unknown')
+
+
+@pytest.mark.asyncio
+async def test_in_memory_dedup_store_max_size() -> None:
+    store = InMemoryDedupStore(max_size=2)
+    for key in ('a', 'b', 'c'):
+        assert await store.add(key)
+    assert len(store) == 2
+    # `a` fue descartada por ser la más antigua
+    assert await store.add('a')
+    assert not await store.add('c')
+
+
+@pytest.mark.asyncio
+async def test_in_memory_dedup_store_ttl() -> None:
+    store = InMemoryDedupStore(ttl=10)
+    with patch('time.monotonic', return_value=100):
+        assert await store.add('a')
+    with patch('time.monotonic', return_value=105):
+        assert await store.add('b')
+        assert not await store.add('a')
+    with patch('time.monotonic', return_value=111):
+        assert await store.add('a')
+        assert not await store.add('b')
+    assert len(store) == 2
@@ -0,0 +1,59 @@
+from unittest.mock import patch
+
+import pytest
+
+from fast_agave.tasks.grouping import (
+    content_deduplication_id,
+    field_group_id,
+    hashed_group_id,
+    random_group_id,
+    tenant_group_id,
+)
+
+
+def test_random_group_id() -> None:
+    assert random_group_id({}) != random_group_id({})
+
+
+def test_field_group_id() -> None:
+    group_id = field_group_id('account_id')
+    assert group_id(dict(account_id='AC01', amount=10)) == 'AC01'
+    assert group_id(dict(account_id=123)) == '123'
+    # Sin el campo cada mensaje tiene su propio grupo
+    assert group_id(dict(amount=10)) != group_id(dict(amount=10))
+    assert group_id('not a dict') != group_id('not a dict')
+
+
+def test_tenant_group_id() -> None:
+    group_id = tenant_group_id()
+    assert group_id(dict(platform_id='PL01')) == 'PL01'
+
+    context = dict(platform_id='PL02')
+    with patch('fast_agave.tasks.grouping.context') as mock_context:
+        mock_context.exists.return_value = True
+        mock_context.get.side_effect = context.get
+        mock_context.__getitem__.side_effect = context.__getitem__
+        assert group_id(dict(platform_id='PL01')) == 'PL02'
+
+
+def test_hashed_group_id() -> None:
+    group_id = hashed_group_id(4)
+    groups = {group_id(dict(number=i)) for i in range(100)}
+    assert groups == {'0', '1', '2', '3'}
+    # El hash es estable y no depende del orden de las llaves
+    assert group_id(dict(a=1, b=2)) == group_id(dict(b=2, a=1))
+    assert group_id('body') == group_id('body')
+
+    by_account = hashed_group_id(4, field_group_id('account_id'))
+    assert by_account(dict(account_id='AC01', n=1)) == by_account(
+        dict(account_id='AC01', n=2)
+    )
+
+    with pytest.raises(ValueError):
+        hashed_group_id(0)
+
+
+def test_content_deduplication_id() -> None:
+    assert content_deduplication_id('{}') == content_deduplication_id('{}')
+    assert content_deduplication_id('{}') != content_deduplication_id('[]')
+    assert len(content_deduplication_id('{}')) == 64
@@ -0,0 +1,39 @@
+from fast_agave.tasks.metrics import Histogram, InMemoryMetrics, TaskOutcome
+
+
+def test_histogram() -> None:
+    histogram = Histogram(buckets=(1, 2, 5))
+    assert histogram.mean == 0
+    assert histogram.percentile(50) == 0
+
+    for value in (0.5, 1.5, 1.5, 4, 10):
+        histogram.observe(value)
+
+    assert histogram.counts == [1, 2, 1, 1]
+    assert histogram.count == 5
+    assert histogram.mean == 3.5
+    assert histogram.max == 10
+    assert histogram.percentile(20) == 1
+    assert histogram.percentile(50) == 2
+    assert histogram.percentile(80) == 5
+    assert histogram.percentile(99) == 10
+
+
+def test_in_memory_metrics() -> None:
+    metrics = InMemoryMetrics()
+    metrics.record_batch(1)
+    metrics.record_lag(0.2)
+    metrics.record_task(TaskOutcome.ok, 0.1)
+    metrics.record_task(TaskOutcome.dropped, 0)
+    metrics.record_in_flight(3)
+    metrics.record_in_flight(1)
+    metrics.record_concurrency_limit(4)
+
+    assert metrics.batch_size.count == 1
+    assert metrics.lag.count == 1
+    assert metrics.duration.count == 1
+    assert metrics.outcomes[TaskOutcome.ok] == 1
+    assert metrics.outcomes[TaskOutcome.dropped] == 1
+    assert metrics.in_flight == 1
+    assert metrics.max_in_flight == 3
+    assert metrics.concurrency_limit == 4
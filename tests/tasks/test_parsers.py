@@ -0,0 +1,104 @@
+from typing import Any, Dict, List, Literal, Union
+
+import pytest
+from pydantic import BaseModel, ValidationError
+
+from fast_agave.tasks.parsers import (
+    build_parser,
+    identity,
+    task_argument_type,
+    validated_task,
+)
+
+
+class User(BaseModel):
+    id: str
+    name: str
+
+
+class Company(BaseModel):
+    id: str
+    legal_name: str
+
+
+class UserCreated(BaseModel):
+    type: Literal['user.created']
+    user_id: str
+
+
+class CardBlocked(BaseModel):
+    type: Literal['card.blocked', 'card.stolen']
+    card_id: str
+
+
+def test_task_argument_type() -> None:
+    async def typed(data: User, retries: int = 0) -> None:
+        ...  # pragma: no cover
+
+    async def untyped(data) -> None:
+        ...  # pragma: no cover
+
+    async def no_args() -> None:
+        ...  # pragma: no cover
+
+    assert task_argument_type(typed) is User
+    assert task_argument_type(untyped) is Any
+    assert task_argument_type(no_args) is Any
+
+
+def test_build_parser() -> None:
+    assert build_parser(Any) is identity
+    assert build_parser(User)(dict(id='US01', name='Frida')) == User(
+        id='US01', name='Frida'
+    )
+    assert build_parser(Dict)(dict(a=1)) == dict(a=1)
+    assert build_parser(List[int])(['1', 2]) == [1, 2]
+    with pytest.raises(ValidationError):
+        build_parser(Dict)([1, 2])
+
+
+def test_union_parser() -> None:
+    parse = build_parser(Union[User, Company])
+    company = parse(dict(id='CO01', legal_name='Agave'))
+    assert type(company) is Company
+    with pytest.raises(ValidationError):
+        parse(dict(id='XX01'))
+
+
+def test_discriminated_union_parser() -> None:
+    parse = build_parser(Union[UserCreated, CardBlocked])
+    card = parse(dict(type='card.stolen', card_id='CA01'))
+    assert type(card) is CardBlocked
+    user = parse(dict(type='user.created', user_id='US01'))
+    assert type(user) is UserCreated
+
+    with pytest.raises(ValidationError):
+        parse(dict(type='user.created', card_id='CA01'))
+    with pytest.raises(ValidationError):
+        parse(dict(type='unknown'))
+    with pytest.raises(ValidationError):
+        parse(['not', 'a', 'dict'])
+
+
+def test_union_with_repeated_literals_is_not_discriminated() -> None:
+    class OtherUser(BaseModel):
+        type: Literal['user.created']
+        name: str
+
+    parse = build_parser(Union[UserCreated, OtherUser])
+    other = parse(dict(type='user.created', name='Frida'))
+    assert type(other) is OtherUser
+
+
+@pytest.mark.asyncio
+async def test_validated_task() -> None:
+    async def untyped(data):
+        return data
+
+    async def typed(data: User):
+        return data
+
+    assert validated_task(untyped) is untyped
+    assert await validated_task(typed)(dict(id='US01', name='Frida')) == User(
+        id='US01', name='Frida'
+    )
@@ -0,0 +1,119 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+from fast_agave.exc import SendMessageError
+from fast_agave.tasks.backoff import BackoffPolicy, RetryPolicy
+from fast_agave.tasks.producer import BatchProducer
+
+
+def message(body: str = '{}') -> dict:
+    return dict(MessageBody=body, MessageGroupId='1')
+
+
+@pytest.mark.asyncio
+async def test_batch_producer_limits() -> None:
+    sqs = AsyncMock()
+    sqs.send_message_batch.side_effect = lambda QueueUrl, Entries: dict(
+        Successful=[dict(Id=e['Id']) for e in Entries]
+    )
+    producer = BatchProducer(sqs, 'queue', linger=0.01)
+
+    await asyncio.gather(*(producer.send(message()) for _ in range(12)))
+    # Un batch de 10 mensajes y otro con los 2 restantes
+    sizes = [
+        len(c.kwargs['Entries']) for c in sqs.send_message_batch.call_args_list
+    ]
+    assert sizes == [10, 2]
+
+    sqs.send_message_batch.reset_mock()
+    big = 'x' * 150 * 1024
+    await asyncio.gather(
+        producer.send(message(big)), producer.send(message(big))
+    )
+    # Juntos pasan de 256 KB
+    assert sqs.send_message_batch.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_batch_producer_partial_failure() -> None:
+    sqs = AsyncMock()
+    sqs.send_message_batch.side_effect = [
+        dict(
+            Successful=[dict(Id='0')],
+            Failed=[
+                dict(Id='1', Code='InternalError', SenderFault=False),
+                dict(Id='2', Code='InvalidMessage', SenderFault=True),
+            ],
+        ),
+        dict(Successful=[dict(Id='1')]),
+    ]
+    producer = BatchProducer(sqs, 'queue')
+    results = await asyncio.gather(
+        *(producer.send(message(str(i))) for i in range(3)),
+        return_exceptions=True,
+    )
+
+    assert results[:2] == [None, None]
+    assert isinstance(results[2], SendMessageError)
+    assert results[2].code == 'InvalidMessage'
+    # Solo se reintenta la entrada que falló del lado de SQS
+    retry = sqs.send_message_batch.call_args_list[1].kwargs['Entries']
+    assert retry == [dict(Id='1', MessageBody='1', MessageGroupId='1')]
+
+
+@pytest.mark.asyncio
+async def test_batch_producer_retries_exhausted() -> None:
+    sqs = AsyncMock()
+    sqs.send_message_batch.return_value = dict(
+        Failed=[dict(Id='0', Code='InternalError', SenderFault=False)]
+    )
+    policy = RetryPolicy(
+        max_attempts=3, backoff=BackoffPolicy(base=1, jitter=False)
+    )
+    producer = BatchProducer(sqs, 'queue', retry_policy=policy)
+    with patch('asyncio.sleep') as sleep, pytest.raises(SendMessageError):
+        await producer.send(message())
+    assert sqs.send_message_batch.await_count == 3
+    assert [c.args[0] for c in sleep.call_args_list] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_batch_producer_non_retryable_code() -> None:
+    sqs = AsyncMock()
+    sqs.send_message_batch.return_value = dict(
+        Failed=[dict(Id='0', Code='KMS.DisabledException', SenderFault=False)]
+    )
+    producer = BatchProducer(sqs, 'queue')
+    with pytest.raises(SendMessageError):
+        await producer.send(message())
+    assert sqs.send_message_batch.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_producer_retries_throttling() -> None:
+    throttled = ClientError(
+        dict(Error=dict(Code='RequestThrottled')), 'SendMessageBatch'
+    )
+    sqs = AsyncMock()
+    sqs.send_message_batch.side_effect = [
+        throttled,
+        dict(Successful=[dict(Id='0')]),
+    ]
+    producer = BatchProducer(sqs, 'queue')
+    with patch('asyncio.sleep') as sleep:
+        await producer.send(message())
+    assert sqs.send_message_batch.await_count == 2
+    sleep.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_batch_producer_error() -> None:
+    sqs = AsyncMock()
+    sqs.send_message_batch.side_effect = ValueError
+    producer = BatchProducer(sqs, 'queue')
+    with pytest.raises(ValueError):
+        await producer.send(message())
+    assert sqs.send_message_batch.await_count == 1
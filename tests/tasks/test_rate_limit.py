@@ -0,0 +1,36 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from fast_agave.tasks.rate_limit import TokenBucket
+
+
+def test_token_bucket_defaults() -> None:
+    assert TokenBucket(0.5).capacity == 1
+    assert TokenBucket(20).capacity == 20
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket() -> None:
+    with patch('time.monotonic', return_value=100):
+        bucket = TokenBucket(rate=2, capacity=4)
+        assert await bucket.take(3) == 3
+        assert await bucket.take(3) == 1
+        bucket.put(1)
+        assert bucket.tokens == 1
+        bucket.put(10)
+        assert bucket.tokens == 4
+        assert await bucket.take(4) == 4
+
+    with patch('time.monotonic', return_value=101):
+        # Se recargaron 2 tokens en un segundo
+        assert bucket.tokens == 2
+        assert await bucket.take(3) == 2
+
+    with patch('time.monotonic', side_effect=[101.25, 101.5]), patch(
+        'asyncio.sleep', new_callable=AsyncMock
+    ) as sleep:
+        assert await bucket.take() == 1
+    sleep.assert_called_once_with(0.25)
@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+from fast_agave.tasks.registry import TaskRegistry
+
+
+@pytest.mark.asyncio
+async def test_task_registry() -> None:
+    registry = TaskRegistry()
+    assert await registry.wait() == set()
+
+    fast = asyncio.create_task(asyncio.sleep(0.01))
+    slow = asyncio.create_task(asyncio.sleep(10))
+    registry.add(fast, ['a'])
+    registry.add(slow, ['b', 'c'])
+    registry.mark_started(slow)
+    assert len(registry) == 2
+    assert slow in registry
+    assert registry.running == [slow]
+    assert registry.unstarted == [fast]
+    assert registry.receipt_handles([fast, slow]) == ['a', 'b', 'c']
+
+    pending = await registry.wait(0.1)
+    # Los tasks que terminan se eliminan solos del registro
+    assert pending == {slow}
+    assert list(registry) == [slow]
+
+    slow.cancel()
+    await registry.wait()
+    assert len(registry) == 0
+    assert registry.running == []
@@ -0,0 +1,116 @@
+import json
+from typing import Dict
+from unittest.mock import AsyncMock
+
+import pytest
+from pydantic import BaseModel
+
+from fast_agave.exc import NoTaskHandlerError
+from fast_agave.tasks.router import TaskRouter
+from fast_agave.tasks.sqs_tasks import task
+
+CORE_QUEUE_REGION = 'us-east-1'
+
+
+class User(BaseModel):
+    id: str
+    name: str
+
+
+class Company(BaseModel):
+    id: str
+    legal_name: str
+
+
+@pytest.mark.asyncio
+async def test_dispatch_by_discriminator() -> None:
+    router = TaskRouter(discriminator='type')
+    users, companies = AsyncMock(), AsyncMock()
+
+    @router.handler('user')
+    async def user_handler(data: User) -> None:
+        await users(data)
+
+    @router.handler('company')
+    async def company_handler(data: Company) -> None:
+        await companies(data)
+
+    await router.dispatch(dict(type='user', id='US01', name='Frida'))
+    await router.dispatch(dict(type='company', id='CO01', legal_name='Agave'))
+
+    users.assert_called_once_with(User(id='US01', name='Frida'))
+    companies.assert_called_once_with(Company(id='CO01', legal_name='Agave'))
+
+    with pytest.raises(NoTaskHandlerError):
+        await router.dispatch(dict(type='unknown', id='XX01'))
+
+
+@pytest.mark.asyncio
+async def test_dispatch_by_model() -> None:
+    router = TaskRouter()
+    users, companies, fallback = AsyncMock(), AsyncMock(), AsyncMock()
+
+    @router.handler()
+    async def user_handler(data: User) -> None:
+        await users(data)
+
+    @router.handler()
+    async def company_handler(data: Company) -> None:
+        await companies(data)
+
+    await router.dispatch(dict(id='CO01', legal_name='Agave'))
+    companies.assert_called_once_with(Company(id='CO01', legal_name='Agave'))
+    users.assert_not_called()
+
+    with pytest.raises(NoTaskHandlerError):
+        await router.dispatch(dict(id='XX01'))
+
+    @router.handler()
+    async def fallback_handler(data) -> None:
+        await fallback(data)
+
+    await router.dispatch(dict(id='XX01'))
+    fallback.assert_called_once_with(dict(id='XX01'))
+
+
+def test_handler_requires_discriminator() -> None:
+    router = TaskRouter()
+    with pytest.raises(ValueError):
+
+        @router.handler('user')
+        async def user_handler(data: User) -> None:
+            ...  # pragma: no cover
+
+
+@pytest.mark.asyncio
+async def test_router_task(sqs_client) -> None:
+    router = TaskRouter(discriminator='type')
+    users, others = AsyncMock(), AsyncMock()
+
+    @router.handler('user')
+    async def user_handler(data: User) -> None:
+        await users(data)
+
+    @router.handler()
+    async def other_handler(data: Dict) -> None:
+        await others(data)
+
+    await sqs_client.send_message(
+        MessageBody=json.dumps(dict(type='user', id='US01', name='Frida')),
+        MessageGroupId='1',
+    )
+    await sqs_client.send_message(
+        MessageBody=json.dumps(dict(type='other', id='XX01')),
+        MessageGroupId='2',
+    )
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=1,
+    )(router.dispatch)()
+
+    users.assert_called_once_with(User(id='US01', name='Frida'))
+    others.assert_called_once_with(dict(type='other', id='XX01'))
+    resp = await sqs_client.receive_message()
+    assert 'Messages' not in resp
@@ -0,0 +1,50 @@
+import asyncio
+from typing import List, Optional, Tuple
+
+import pytest
+
+from fast_agave.tasks.scheduler import MessageGroupScheduler
+
+
+@pytest.mark.asyncio
+async def test_message_group_scheduler() -> None:
+    scheduler = MessageGroupScheduler()
+    events: List[Tuple[str, Optional[str], int]] = []
+
+    async def run(group_id: Optional[str], number: int) -> None:
+        async with scheduler.hold(group_id):
+            events.append(('start', group_id, number))
+            await asyncio.sleep(0.01)
+            events.append(('end', group_id, number))
+
+    await asyncio.gather(
+        run('a', 1), run('a', 2), run('b', 1), run(None, 1), run('a', 3)
+    )
+
+    group_a = [e for e in events if e[1] == 'a']
+    assert group_a == [
+        ('start', 'a', 1),
+        ('end', 'a', 1),
+        ('start', 'a', 2),
+        ('end', 'a', 2),
+        ('start', 'a', 3),
+        ('end', 'a', 3),
+    ]
+    # Los otros grupos no esperan al grupo `a`
+    assert events.index(('start', 'b', 1)) < events.index(('end', 'a', 1))
+    assert events.index(('start', None, 1)) < events.index(('end', 'a', 1))
+    assert len(scheduler) == 0
+
+
+def test_blocked_groups() -> None:
+    scheduler = MessageGroupScheduler()
+    scheduler.block('a', 'message-1')
+    scheduler.block(None, 'message-2')
+    assert scheduler.blocked('a')
+    assert not scheduler.blocked(None)
+
+    # Solo el mensaje que bloqueó el grupo lo desbloquea
+    scheduler.unblock('a', 'message-3')
+    assert scheduler.blocked('a')
+    scheduler.unblock('a', 'message-1')
+    assert not scheduler.blocked('a')
@@ -1,9 +1,21 @@
 import base64
+import datetime as dt
 import json
+from typing import Dict, List, Tuple
 
 import pytest
 
-from fast_agave.tasks.sqs_celery_client import SqsCeleryClient
+from fast_agave.tasks.claim_check import (
+    POINTER_KEY,
+    ClaimCheck,
+    LocalBlobStore,
+)
+from fast_agave.tasks.sqs_celery_client import (
+    CeleryTask,
+    SqsCeleryClient,
+    _build_celery_message,
+    resolve_task_arguments,
+)
 
 CORE_QUEUE_REGION = 'us-east-1'
 
@@ -39,7 +51,7 @@ async def test_send_background_task(sqs_client) -> None:
     queue = SqsCeleryClient(sqs_client.queue_url, CORE_QUEUE_REGION)
     await queue.start()
 
-    assert len(queue.background_tasks) == 0
+    assert queue.pending_messages == 0
 
     task = queue.send_background_task('some.task', args=args, kwargs=kwargs)
     await task
@@ -57,4 +69,102 @@ async def test_send_background_task(sqs_client) -> None:
     assert message['headers']['lang'] == 'py'
     assert message['headers']['task'] == 'some.task'
     await queue.close()
-    assert len(queue.background_tasks) == 0
+    assert queue.pending_messages == 0
+
+
+def decode(encoded: str) -> Tuple[Dict, List]:
+    message = json.loads(base64.b64decode(encoded.encode('utf-8')).decode())
+    body = json.loads(base64.b64decode(message.pop('body').encode()).decode())
+    return message, body
+
+
+def test_build_celery_message() -> None:
+    message, body = decode(
+        _build_celery_message('some."task"%s', (10, 'foo'), dict(a=1))
+    )
+    task_id = message['headers']['id']
+    assert message == dict(
+        properties=dict(
+            correlation_id=task_id,
+            content_type='application/json',
+            content_encoding='utf-8',
+            body_encoding='base64',
+            delivery_info=dict(exchange='', routing_key='celery'),
+        ),
+        headers=dict(
+            lang='py',
+            task='some."task"%s',
+            id=task_id,
+            root_id=task_id,
+            parent_id=None,
+            group=None,
+        ),
+        **{'content-encoding': 'utf-8', 'content-type': 'application/json'},
+    )
+    assert body == [
+        [10, 'foo'],
+        dict(a=1),
+        dict(callbacks=None, errbacks=None, chain=None, chord=None),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_send_tasks(sqs_client) -> None:
+    async with SqsCeleryClient(
+        sqs_client.queue_url, CORE_QUEUE_REGION
+    ) as queue:
+        await queue.send_tasks(
+            CeleryTask('some.task', args=[i]) for i in range(12)
+        )
+
+    received: List[int] = []
+    for _ in range(2):
+        sqs_message = await sqs_client.receive_message(MaxNumberOfMessages=10)
+        received.extend(
+            decode(m['Body'])[1][0][0] for m in sqs_message['Messages']
+        )
+    assert sorted(received) == list(range(12))
+
+
+@pytest.mark.asyncio
+async def test_claim_check(sqs_client, tmp_path) -> None:
+    claim_check = ClaimCheck(LocalBlobStore(str(tmp_path)), threshold=100)
+    big = dict(data='x' * 1000)
+    async with SqsCeleryClient(
+        sqs_client.queue_url, CORE_QUEUE_REGION, claim_check=claim_check
+    ) as queue:
+        await queue.send_task('some.task', args=[1], kwargs=big)
+        await queue.send_background_task('some.task', kwargs=big)
+        await queue.send_task('some.task', args=[2])
+
+    sqs_message = await sqs_client.receive_message(MaxNumberOfMessages=10)
+    bodies = [decode(m['Body'])[1] for m in sqs_message['Messages']]
+    assert len(bodies) == 3
+    assert len(list(tmp_path.iterdir())) == 2
+
+    # Los tasks grandes solo llevan el apuntador
+    pointers = [body for body in bodies if POINTER_KEY in body[1]]
+    assert len(pointers) == 2
+    assert all(args == [] for args, _, _ in pointers)
+
+    resolved = [
+        await resolve_task_arguments(claim_check, args, kwargs)
+        for args, kwargs, _ in bodies
+    ]
+    expected = [([], big), ([1], big), ([2], {})]
+    assert sorted(resolved, key=str) == sorted(expected, key=str)
+
+
+@pytest.mark.parametrize(
+    'kwargs',
+    [{1: 'a'}, dict(big=2**70)],
+)
+def test_build_celery_message_json_fallback(kwargs: Dict) -> None:
+    _, body = decode(_build_celery_message('some.task', (), kwargs))
+    assert body[1] == json.loads(json.dumps(kwargs))
+
+
+def test_build_celery_message_unserializable() -> None:
+    # Igual que con `json`, con o sin orjson
+    with pytest.raises(TypeError):
+        _build_celery_message('some.task', (dt.datetime.now(),), {})
@@ -1,8 +1,12 @@
+import asyncio
 import json
+from unittest.mock import AsyncMock, patch
 
 import pytest
+from botocore.exceptions import ClientError
 
-from fast_agave.tasks.sqs_client import SqsClient
+from fast_agave.tasks.grouping import content_deduplication_id, field_group_id
+from fast_agave.tasks.sqs_client import OverflowPolicy, SqsClient
 
 CORE_QUEUE_REGION = 'us-east-1'
 
@@ -37,3 +41,164 @@ async def test_send_message_async(sqs_client) -> None:
     message = json.loads(sqs_message['Messages'][0]['Body'])
 
     assert message == data1
+
+
+@pytest.mark.asyncio
+async def test_send_message_batch(sqs_client) -> None:
+    async with SqsClient(
+        sqs_client.queue_url, CORE_QUEUE_REGION, batch_messages=True
+    ) as sqs:
+        await asyncio.gather(
+            *(sqs.send_message(dict(number=i)) for i in range(3))
+        )
+        # Los mensajes pendientes se envían al cerrar el cliente
+        sqs.send_message_async(dict(number=3))
+
+    sqs_message = await sqs_client.receive_message(MaxNumberOfMessages=10)
+    numbers = [
+        json.loads(m['Body'])['number'] for m in sqs_message['Messages']
+    ]
+    assert sorted(numbers) == [0, 1, 2, 3]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    'policy', [OverflowPolicy.wait, OverflowPolicy.drop, OverflowPolicy.error]
+)
+async def test_send_message_async_overflow(sqs_client, policy) -> None:
+    unblock = asyncio.Event()
+    sent = []
+
+    async def send_message(data, message_group_id=None) -> None:
+        await unblock.wait()
+        sent.append(data)
+
+    sqs = SqsClient(
+        sqs_client.queue_url,
+        CORE_QUEUE_REGION,
+        max_pending_messages=1,
+        sender_workers=1,
+        overflow_policy=policy,
+    )
+    await sqs.start()
+    with patch.object(sqs, 'send_message', send_message):
+        first = sqs.send_message_async('1')
+        await asyncio.sleep(0)
+        # El worker está enviando el primero y el segundo llena la cola
+        second = sqs.send_message_async('2')
+        assert sqs.pending_messages == 1
+
+        if policy is OverflowPolicy.wait:
+            # Solo `enqueue_message` puede esperar a que haya lugar
+            with pytest.raises(asyncio.QueueFull):
+                sqs.send_message_async('3')
+            third = asyncio.create_task(sqs.enqueue_message('3'))
+            await asyncio.sleep(0)
+            assert not third.done()
+            unblock.set()
+            await (await third)
+        elif policy is OverflowPolicy.drop:
+            assert sqs.send_message_async('3').cancelled()
+            assert sqs.dropped_messages == 1
+        else:
+            with pytest.raises(asyncio.QueueFull):
+                await sqs.enqueue_message('3')
+
+        unblock.set()
+        await asyncio.gather(first, second)
+        await sqs.close()
+
+    assert sent == (
+        ['1', '2', '3'] if policy is OverflowPolicy.wait else ['1', '2']
+    )
+
+
+@pytest.mark.asyncio
+async def test_send_message_async_error(sqs_client) -> None:
+    errors = []
+    sqs = SqsClient(
+        sqs_client.queue_url,
+        CORE_QUEUE_REGION,
+        on_send_error=lambda data, exc: errors.append((data, exc)),
+    )
+    await sqs.start()
+    error = ConnectionError()
+    with patch.object(sqs, 'send_message', AsyncMock(side_effect=error)):
+        future = sqs.send_message_async(dict(hola='mundo'))
+        await sqs.flush()
+        with pytest.raises(ConnectionError):
+            await future
+    await sqs.close()
+    assert errors == [(dict(hola='mundo'), error)]
+
+
+@pytest.mark.asyncio
+async def test_send_message_retries(sqs_client) -> None:
+    throttled = ClientError(
+        dict(Error=dict(Code='ThrottlingException')), 'SendMessage'
+    )
+    async with SqsClient(sqs_client.queue_url, CORE_QUEUE_REGION) as sqs:
+        send = sqs._sqs.send_message
+        calls = []
+
+        async def flaky(**kwargs):
+            calls.append(kwargs)
+            if len(calls) < 3:
+                raise throttled
+            # El tercer intento llega a SQS
+            return await send(**kwargs)
+
+        with patch.object(sqs._sqs, 'send_message', flaky), patch(
+            'asyncio.sleep'
+        ) as sleep:
+            await sqs.send_message(dict(hola='mundo'))
+
+    assert len(calls) == 3
+    assert sleep.await_count == 2
+    sqs_message = await sqs_client.receive_message()
+    message = json.loads(sqs_message['Messages'][0]['Body'])
+    assert message == dict(hola='mundo')
+
+
+@pytest.mark.asyncio
+async def test_send_message_group_and_deduplication(sqs_client) -> None:
+    async with SqsClient(
+        sqs_client.queue_url,
+        CORE_QUEUE_REGION,
+        group_id=field_group_id('account_id'),
+        deduplication_id=content_deduplication_id,
+    ) as sqs:
+        await sqs.send_message(dict(account_id='AC01', amount=10))
+        await sqs.send_message(dict(account_id='AC01', amount=20))
+        await sqs.send_message_async(dict(account_id='AC02', amount=10))
+
+    sqs_message = await sqs_client.receive_message(
+        MaxNumberOfMessages=10,
+        AttributeNames=['MessageGroupId', 'MessageDeduplicationId'],
+    )
+    received = sorted(
+        (
+            m['Attributes']['MessageGroupId'],
+            m['Body'],
+            m['Attributes']['MessageDeduplicationId'],
+        )
+        for m in sqs_message['Messages']
+    )
+    assert [(group, json.loads(body)) for group, body, _ in received] == [
+        ('AC01', dict(account_id='AC01', amount=10)),
+        ('AC01', dict(account_id='AC01', amount=20)),
+        ('AC02', dict(account_id='AC02', amount=10)),
+    ]
+    # El id depende solo del body, así que un reintento tendría el mismo
+    for _, body, deduplication_id in received:
+        assert deduplication_id == content_deduplication_id(body)
+
+
+@pytest.mark.asyncio
+async def test_background_tasks_deprecated(sqs_client) -> None:
+    async with SqsClient(sqs_client.queue_url, CORE_QUEUE_REGION) as sqs:
+        future = sqs.send_message_async(dict(hola='mundo'))
+        with pytest.warns(DeprecationWarning):
+            assert sqs.background_tasks == {future}
+        await asyncio.gather(*sqs.background_tasks)
+        assert not sqs._pending
@@ -2,20 +2,31 @@ import asyncio
 import datetime as dt
 import json
 import uuid
-from typing import Dict, Union
+import zlib
+from typing import Dict, List, Optional, Union
 from unittest.mock import AsyncMock, call, patch
 
 import aiobotocore.client
 import pytest
 from aiobotocore.httpsession import HTTPClientError
+from botocore.exceptions import ClientError, EndpointConnectionError
 from pydantic import BaseModel
 
 from fast_agave.exc import RetryTask
-from fast_agave.tasks.sqs_tasks import (
-    BACKGROUND_TASKS,
-    get_running_fast_agave_tasks,
-    task,
+from fast_agave.tasks.backoff import BackoffPolicy
+from fast_agave.tasks.circuit_breaker import CircuitBreaker, CircuitState
+from fast_agave.tasks.claim_check import (
+    POINTER_KEY,
+    ClaimCheck,
+    LocalBlobStore,
 )
+from fast_agave.tasks.concurrency import AdaptiveConcurrency
+from fast_agave.tasks.dead_letter import FailureReason, InMemorySink
+from fast_agave.tasks.dedup import InMemoryDedupStore
+from fast_agave.tasks.metrics import InMemoryMetrics, TaskOutcome
+from fast_agave.tasks.registry import TaskRegistry
+from fast_agave.tasks.sqs_client import SqsClient
+from fast_agave.tasks.sqs_tasks import message_consumer, run_task, task
 
 CORE_QUEUE_REGION = 'us-east-1'
 
@@ -34,6 +45,7 @@ async def test_execute_tasks(sqs_client) -> None:
     )
 
     async_mock_function = AsyncMock()
+    registry = TaskRegistry()
 
     async def my_task(data: Dict) -> None:
         await async_mock_function(data)
@@ -43,13 +55,13 @@ async def test_execute_tasks(sqs_client) -> None:
         region_name=CORE_QUEUE_REGION,
         wait_time_seconds=1,
         visibility_timeout=1,
-    )(my_task)()
+    )(my_task)(registry=registry)
     async_mock_function.assert_called_with(test_message)
     assert async_mock_function.call_count == 1
 
     resp = await sqs_client.receive_message()
     assert 'Messages' not in resp
-    assert len(BACKGROUND_TASKS) == 0
+    assert len(registry) == 0
 
 
 @pytest.mark.asyncio
@@ -59,6 +71,7 @@ async def test_execute_tasks_with_validator(sqs_client) -> None:
         name: str
 
     async_mock_function = AsyncMock(return_value=None)
+    registry = TaskRegistry()
 
     async def my_task(data: Validator) -> None:
         await async_mock_function(data)
@@ -85,13 +98,13 @@ async def test_execute_tasks_with_validator(sqs_client) -> None:
         MessageBody=test_message.json(),
         MessageGroupId='1234',
     )
-    await task(**task_params)(my_task)()
+    await task(**task_params)(my_task)(registry=registry)
     async_mock_function.assert_called_with(test_message)
     assert async_mock_function.call_count == 1
 
     resp = await sqs_client.receive_message()
     assert 'Messages' not in resp
-    assert len(BACKGROUND_TASKS) == 0
+    assert len(registry) == 0
 
 
 @pytest.mark.asyncio
@@ -106,6 +119,7 @@ async def test_execute_tasks_with_union_validator(sqs_client) -> None:
         rfc: str
 
     async_mock_function = AsyncMock(return_value=None)
+    registry = TaskRegistry()
 
     async def my_task(data: Union[User, Company]) -> None:
         await async_mock_function(data)
@@ -122,13 +136,13 @@ async def test_execute_tasks_with_union_validator(sqs_client) -> None:
         MessageBody=json.dumps(test_message),
         MessageGroupId='4321',
     )
-    await task(**task_params)(my_task)()
+    await task(**task_params)(my_task)(registry=registry)
     async_mock_function.assert_called_with(test_message)
     assert async_mock_function.call_count == 1
 
     resp = await sqs_client.receive_message()
     assert 'Messages' not in resp
-    assert len(BACKGROUND_TASKS) == 0
+    assert len(registry) == 0
 
     async_mock_function.reset_mock()
     test_message = dict(id='ID123', legal_name='FastAgave', rfc='FA')
@@ -143,7 +157,7 @@ async def test_execute_tasks_with_union_validator(sqs_client) -> None:
 
     resp = await sqs_client.receive_message()
     assert 'Messages' not in resp
-    assert len(BACKGROUND_TASKS) == 0
+    assert len(registry) == 0
 
 
 @pytest.mark.asyncio
@@ -152,6 +166,7 @@ async def test_not_execute_tasks(sqs_client) -> None:
     Este caso es cuando el queue está vacío. No hay nada que ejecutar
     """
     async_mock_function = AsyncMock()
+    registry = TaskRegistry()
 
     async def my_task(data: Dict) -> None:
         await async_mock_function(data)
@@ -162,11 +177,11 @@ async def test_not_execute_tasks(sqs_client) -> None:
         region_name=CORE_QUEUE_REGION,
         wait_time_seconds=1,
         visibility_timeout=1,
-    )(my_task)()
+    )(my_task)(registry=registry)
     async_mock_function.assert_not_called()
     resp = await sqs_client.receive_message()
     assert 'Messages' not in resp
-    assert len(BACKGROUND_TASKS) == 0
+    assert len(registry) == 0
 
 
 @pytest.mark.asyncio
@@ -276,6 +291,7 @@ async def test_retry_tasks_custom_max_retries(sqs_client) -> None:
     )
 
     async_mock_function = AsyncMock(side_effect=RetryTask)
+    registry = TaskRegistry()
 
     async def my_task(data: Dict) -> None:
         await async_mock_function(data)
@@ -286,7 +302,7 @@ async def test_retry_tasks_custom_max_retries(sqs_client) -> None:
         wait_time_seconds=1,
         visibility_timeout=1,
         max_retries=3,
-    )(my_task)()
+    )(my_task)(registry=registry)
 
     expected_calls = [call(test_message)] * 4
     async_mock_function.assert_has_calls(expected_calls)
@@ -294,7 +310,7 @@ async def test_retry_tasks_custom_max_retries(sqs_client) -> None:
 
     resp = await sqs_client.receive_message()
     assert 'Messages' not in resp
-    assert len(BACKGROUND_TASKS) == 0
+    assert len(registry) == 0
 
 
 @pytest.mark.asyncio
@@ -316,6 +332,8 @@ async def test_does_not_retry_on_unhandled_exceptions(sqs_client) -> None:
         side_effect=Exception('something went wrong :(')
     )
 
+    registry = TaskRegistry()
+
     async def my_task(data: Dict) -> None:
         await async_mock_function(data)
 
@@ -325,14 +343,14 @@ async def test_does_not_retry_on_unhandled_exceptions(sqs_client) -> None:
         wait_time_seconds=1,
         visibility_timeout=1,
         max_retries=3,
-    )(my_task)()
+    )(my_task)(registry=registry)
 
     async_mock_function.assert_called_with(test_message)
     assert async_mock_function.call_count == 1
 
     resp = await sqs_client.receive_message()
     assert 'Messages' not in resp
-    assert len(BACKGROUND_TASKS) == 0
+    assert len(registry) == 0
 
 
 @pytest.mark.asyncio
@@ -389,11 +407,11 @@ async def test_concurrency_controller(
         )
 
     async_mock_function = AsyncMock()
+    registry = TaskRegistry()
 
     async def task_counter(data: Dict) -> None:
         await asyncio.sleep(1)
-        running_tasks = len(await get_running_fast_agave_tasks())
-        await async_mock_function(running_tasks)
+        await async_mock_function(len(registry.running))
 
     await task(
         queue_url=sqs_client.queue_url,
@@ -402,7 +420,1077 @@ async def test_concurrency_controller(
         visibility_timeout=1,
         max_retries=3,
         max_concurrent_tasks=2,
-    )(task_counter)()
+    )(task_counter)(registry=registry)
 
     running_tasks = [call[0] for call, _ in async_mock_function.call_args_list]
     assert max(running_tasks) == 2
+
+
+@pytest.mark.asyncio
+async def test_shutdown_releases_unstarted_messages(sqs_client) -> None:
+    """
+    Al cancelar el consumidor el task en ejecución termina y borra su
+    mensaje, mientras que el mensaje recibido que no alcanzó a ejecutarse
+    se regresa al queue con visibility timeout 0
+    """
+    for i in range(2):
+        await sqs_client.send_message(
+            MessageBody=json.dumps(dict(id=i)),
+            MessageGroupId=str(i),
+        )
+
+    async_mock_function = AsyncMock()
+    registry = TaskRegistry()
+
+    async def slow_task(data: Dict) -> None:
+        await asyncio.sleep(1)
+        await async_mock_function(data)
+
+    consumer = asyncio.create_task(
+        task(
+            queue_url=sqs_client.queue_url,
+            region_name=CORE_QUEUE_REGION,
+            wait_time_seconds=1,
+            visibility_timeout=30,
+            max_concurrent_tasks=1,
+        )(slow_task)(registry=registry)
+    )
+    await asyncio.sleep(0.5)
+    consumer.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await consumer
+
+    async_mock_function.assert_called_once_with(dict(id=0))
+    resp = await sqs_client.receive_message()
+    assert json.loads(resp['Messages'][0]['Body']) == dict(id=1)
+    assert len(registry) == 0
+
+
+@pytest.mark.asyncio
+async def test_shutdown_drain_timeout(sqs_client) -> None:
+    """
+    Si el task no termina antes de `drain_timeout` se cancela y su mensaje
+    se libera para que otro worker lo procese
+    """
+    test_message = dict(id='abc123', name='fast-agave')
+    await sqs_client.send_message(
+        MessageBody=json.dumps(test_message),
+        MessageGroupId='1234',
+    )
+
+    async_mock_function = AsyncMock()
+    registry = TaskRegistry()
+
+    async def hung_task(data: Dict) -> None:
+        await async_mock_function(data)
+        await asyncio.sleep(60)
+
+    consumer = asyncio.create_task(
+        task(
+            queue_url=sqs_client.queue_url,
+            region_name=CORE_QUEUE_REGION,
+            wait_time_seconds=1,
+            visibility_timeout=30,
+            drain_timeout=0.5,
+        )(hung_task)(registry=registry)
+    )
+    await asyncio.sleep(0.5)
+    consumer.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await consumer
+
+    async_mock_function.assert_called_once_with(test_message)
+    resp = await sqs_client.receive_message()
+    assert json.loads(resp['Messages'][0]['Body']) == test_message
+    assert resp['Messages'][0]['Attributes']['ApproximateReceiveCount'] == '2'
+    assert len(registry) == 0
+
+
+@pytest.mark.asyncio
+async def test_task_metrics(sqs_client) -> None:
+    await sqs_client.send_message(
+        MessageBody=json.dumps(dict(id='ok')), MessageGroupId='1'
+    )
+    await sqs_client.send_message(
+        MessageBody=json.dumps(dict(id='retry')), MessageGroupId='2'
+    )
+    await sqs_client.send_message(MessageBody='not json', MessageGroupId='3')
+
+    async def my_task(data: Dict) -> None:
+        if data['id'] == 'retry':
+            raise RetryTask
+
+    metrics = InMemoryMetrics()
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=1,
+        metrics=metrics,
+        # Los 3 mensajes llegan en la primera recepción para que el reintento
+        # ocurra dentro de las iteraciones del consumidor
+        max_number_of_messages=10,
+    )(my_task)()
+
+    assert metrics.outcomes[TaskOutcome.ok] == 1
+    assert metrics.outcomes[TaskOutcome.retry] == 1
+    # Se agotaron los reintentos y el mensaje se borró
+    assert metrics.outcomes[TaskOutcome.error] == 1
+    assert metrics.outcomes[TaskOutcome.dropped] >= 1
+    assert metrics.duration.count == 3
+    assert metrics.lag.count == 3
+    assert metrics.batch_size.count == 5
+    assert metrics.max_in_flight >= 1
+    assert metrics.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_message_consumer_backoff() -> None:
+    """
+    Los errores de conexión y las recepciones vacías consecutivas esperan
+    cada vez más. Los contadores se reinician al recibir una respuesta
+    """
+    message = dict(Body='{}')
+    sqs = AsyncMock()
+    sqs.receive_message.side_effect = [
+        HTTPClientError(error='[Errno 104] Connection reset by peer'),
+        HTTPClientError(error='[Errno 104] Connection reset by peer'),
+        dict(),
+        dict(),
+        dict(Messages=[message]),
+    ]
+    can_read = asyncio.Event()
+    can_read.set()
+
+    with patch('asyncio.sleep') as sleep:
+        messages = [
+            m
+            async for m in message_consumer(
+                'queue_url',
+                1,
+                1,
+                can_read,
+                sqs,
+                receive_backoff=BackoffPolicy(base=1, jitter=False),
+                idle_backoff=BackoffPolicy(base=5, jitter=False),
+            )
+        ]
+
+    assert messages == [message]
+    assert [c[0][0] for c in sleep.call_args_list] == [1, 2, 5, 10]
+
+
+@pytest.mark.asyncio
+async def test_message_consumer_retryable_errors() -> None:
+    """
+    Los errores al conectar y los `ClientError` temporales también esperan
+    con backoff en lugar de detener al consumidor
+    """
+    message = dict(Body='{}')
+    sqs = AsyncMock()
+    sqs.receive_message.side_effect = [
+        EndpointConnectionError(endpoint_url='http://localhost:4000'),
+        ClientError(
+            dict(Error=dict(Code='ThrottlingException')), 'ReceiveMessage'
+        ),
+        ClientError(dict(Error=dict(Code='InternalError')), 'ReceiveMessage'),
+        dict(Messages=[message]),
+        dict(Messages=[message]),
+    ]
+    can_read = asyncio.Event()
+    can_read.set()
+
+    with patch('asyncio.sleep') as sleep:
+        messages = [
+            m
+            async for m in message_consumer(
+                'queue_url',
+                1,
+                1,
+                can_read,
+                sqs,
+                receive_backoff=BackoffPolicy(base=1, jitter=False),
+            )
+        ]
+
+    assert messages == [message, message]
+    assert [c[0][0] for c in sleep.call_args_list] == [1, 2, 4]
+
+
+@pytest.mark.asyncio
+async def test_message_consumer_non_retryable_error() -> None:
+    sqs = AsyncMock()
+    sqs.receive_message.side_effect = ClientError(
+        dict(Error=dict(Code='AWS.SimpleQueueService.NonExistentQueue')),
+        'ReceiveMessage',
+    )
+    can_read = asyncio.Event()
+    can_read.set()
+
+    with pytest.raises(ClientError):
+        async for _ in message_consumer('queue_url', 1, 1, can_read, sqs):
+            pass
+    sqs.receive_message.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_dead_letter_sink(sqs_client) -> None:
+    """
+    Los mensajes inválidos, los que fallan y los que agotan sus reintentos
+    se envían al sink y se borran del queue
+    """
+    await sqs_client.send_message(MessageBody='not json', MessageGroupId='1')
+    await sqs_client.send_message(
+        MessageBody=json.dumps(dict(id='error')), MessageGroupId='2'
+    )
+    await sqs_client.send_message(
+        MessageBody=json.dumps(dict(id='retry')), MessageGroupId='3'
+    )
+
+    registry = TaskRegistry()
+
+    async def my_task(data: Dict) -> None:
+        if data['id'] == 'retry':
+            raise RetryTask
+        raise ValueError('something went wrong :(')
+
+    sink = InMemorySink()
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=1,
+        dead_letter_sink=sink,
+    )(my_task)(registry=registry)
+
+    dead_letters = {d.reason: d for d in sink.dead_letters}
+    assert len(sink.dead_letters) == 3
+    assert dead_letters[FailureReason.invalid_json].body == 'not json'
+    error = dead_letters[FailureReason.error]
+    assert error.traceback and 'ValueError' in error.traceback
+    assert dead_letters[FailureReason.max_retries].receive_count == 2
+    resp = await sqs_client.receive_message()
+    assert 'Messages' not in resp
+    assert len(registry) == 0
+
+
+@pytest.mark.asyncio
+async def test_dead_letter_sink_failure(sqs_client) -> None:
+    """
+    Si el sink falla el mensaje no se borra para no perderlo. Se vuelve a
+    recibir y se envía al sink en el siguiente intento
+    """
+    await sqs_client.send_message(
+        MessageBody=json.dumps(dict(id='error')), MessageGroupId='1'
+    )
+
+    async def my_task(data: Dict) -> None:
+        raise ValueError('something went wrong :(')
+
+    sink = AsyncMock()
+    sink.send.side_effect = [ConnectionError, None]
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=1,
+        max_concurrent_tasks=1,
+        dead_letter_sink=sink,
+    )(my_task)()
+
+    assert sink.send.call_count == 2
+    assert sink.send.call_args[0][0].receive_count == 2
+    resp = await sqs_client.receive_message()
+    assert 'Messages' not in resp
+
+
+@pytest.mark.asyncio
+async def test_dead_letter_sink_failure_invalid_json(sqs_client) -> None:
+    """
+    Si el sink falla con un mensaje inválido el consumidor sigue y el
+    mensaje se queda en el queue hasta el siguiente intento
+    """
+    await sqs_client.send_message(MessageBody='not json', MessageGroupId='1')
+
+    async def my_task(data: Dict) -> None:
+        pass  # pragma: no cover
+
+    sink = AsyncMock()
+    sink.send.side_effect = [ConnectionError, None]
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=1,
+        dead_letter_sink=sink,
+    )(my_task)()
+
+    assert sink.send.call_count == 2
+    assert sink.send.call_args[0][0].reason is FailureReason.invalid_json
+    resp = await sqs_client.receive_message()
+    assert 'Messages' not in resp
+
+
+@pytest.mark.asyncio
+async def test_dedup_key(sqs_client) -> None:
+    """
+    Los mensajes con la misma llave se ejecutan una sola vez y los
+    duplicados se borran del queue
+    """
+    for group in ('1', '2'):
+        await sqs_client.send_message(
+            MessageBody=json.dumps(dict(id='abc123', name='fast-agave')),
+            MessageGroupId=group,
+        )
+    await sqs_client.send_message(
+        MessageBody=json.dumps(dict(id='def456', name='fast-agave')),
+        MessageGroupId='3',
+    )
+
+    async_mock_function = AsyncMock()
+
+    async def my_task(data: Dict) -> None:
+        await async_mock_function(data['id'])
+
+    metrics = InMemoryMetrics()
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=1,
+        metrics=metrics,
+        dedup_key=lambda data: data['id'],
+    )(my_task)()
+
+    assert sorted(c[0][0] for c in async_mock_function.call_args_list) == [
+        'abc123',
+        'def456',
+    ]
+    assert metrics.outcomes[TaskOutcome.duplicate] == 1
+    resp = await sqs_client.receive_message()
+    assert 'Messages' not in resp
+
+
+@pytest.mark.asyncio
+async def test_dedup_retries_are_not_duplicates(sqs_client) -> None:
+    """
+    Cuando el task pide un reintento la llave (por default el MessageId) se
+    libera y el mensaje vuelve a ejecutarse
+    """
+    await sqs_client.send_message(
+        MessageBody=json.dumps(dict(id='abc123')), MessageGroupId='1'
+    )
+
+    async_mock_function = AsyncMock(side_effect=RetryTask)
+
+    async def my_task(data: Dict) -> None:
+        await async_mock_function(data)
+
+    store = InMemoryDedupStore()
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=1,
+        dedup_store=store,
+    )(my_task)()
+
+    assert async_mock_function.call_count == 2
+    # El último intento borró el mensaje, así que su llave se conserva
+    assert len(store) == 1
+    resp = await sqs_client.receive_message()
+    assert 'Messages' not in resp
+
+
+@pytest.mark.asyncio
+async def test_dedup_redelivery_while_running(sqs_client) -> None:
+    """
+    Si el mensaje vuelve a recibirse mientras el original sigue en ejecución
+    no se borra, así que un reintento del original no lo pierde
+    """
+    await sqs_client.send_message(
+        MessageBody=json.dumps(dict(id='abc123')), MessageGroupId='1'
+    )
+
+    async_mock_function = AsyncMock()
+
+    async def my_task(data: Dict) -> None:
+        await async_mock_function(data)
+        if async_mock_function.call_count == 1:
+            # Más que el visibility timeout
+            await asyncio.sleep(1.5)
+            raise RetryTask
+
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=1,
+        max_retries=5,
+        dedup_store=InMemoryDedupStore(),
+    )(my_task)()
+
+    assert async_mock_function.call_count == 2
+    resp = await sqs_client.receive_message()
+    assert 'Messages' not in resp
+
+
+@pytest.mark.asyncio
+async def test_dedup_releases_key_of_unstarted_tasks(sqs_client) -> None:
+    """
+    Los mensajes que se liberan sin haber empezado también liberan su llave
+    """
+    for i in range(2):
+        await sqs_client.send_message(
+            MessageBody=json.dumps(dict(id=i)), MessageGroupId=str(i)
+        )
+
+    async def slow_task(data: Dict) -> None:
+        await asyncio.sleep(1)
+
+    store = InMemoryDedupStore()
+    consumer = asyncio.create_task(
+        task(
+            queue_url=sqs_client.queue_url,
+            region_name=CORE_QUEUE_REGION,
+            wait_time_seconds=1,
+            visibility_timeout=30,
+            max_concurrent_tasks=1,
+            max_number_of_messages=2,
+            dedup_store=store,
+        )(slow_task)()
+    )
+    await asyncio.sleep(0.5)
+    consumer.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await consumer
+
+    # Solo queda la llave del mensaje que terminó y se borró
+    assert len(store) == 1
+    resp = await sqs_client.receive_message()
+    assert json.loads(resp['Messages'][0]['Body']) == dict(id=1)
+
+
+@pytest.mark.asyncio
+async def test_dedup_key_error(sqs_client) -> None:
+    """Si `dedup_key` falla el mensaje se ejecuta sin deduplicar"""
+    await sqs_client.send_message(
+        MessageBody=json.dumps(dict(name='fast-agave')), MessageGroupId='1'
+    )
+
+    async_mock_function = AsyncMock()
+
+    async def my_task(data: Dict) -> None:
+        await async_mock_function(data)
+
+    store = InMemoryDedupStore()
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=1,
+        dedup_store=store,
+        dedup_key=lambda data: data['id'],
+    )(my_task)()
+
+    async_mock_function.assert_called_once_with(dict(name='fast-agave'))
+    assert len(store) == 0
+
+
+@pytest.mark.asyncio
+async def test_fifo_scheduling(sqs_client) -> None:
+    """
+    Los mensajes de un mismo grupo se ejecutan uno a la vez y en orden,
+    mientras que los de grupos distintos se ejecutan en paralelo
+    """
+    for i in range(3):
+        await sqs_client.send_message(
+            MessageBody=json.dumps(dict(group='a', number=i)),
+            MessageGroupId='a',
+        )
+    await sqs_client.send_message(
+        MessageBody=json.dumps(dict(group='b', number=0)),
+        MessageGroupId='b',
+    )
+
+    events = []
+
+    async def my_task(data: Dict) -> None:
+        events.append(('start', data['group'], data['number']))
+        await asyncio.sleep(0.2)
+        events.append(('end', data['group'], data['number']))
+
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=5,
+        max_number_of_messages=10,
+        fifo_scheduling=True,
+    )(my_task)()
+
+    group_a = [e for e in events if e[1] == 'a']
+    assert group_a == [
+        (event, 'a', i) for i in range(3) for event in ('start', 'end')
+    ]
+    assert events.index(('start', 'b', 0)) < events.index(('end', 'a', 0))
+    resp = await sqs_client.receive_message()
+    assert 'Messages' not in resp
+
+
+@pytest.mark.asyncio
+async def test_fifo_scheduling_retry(sqs_client) -> None:
+    """
+    Si un mensaje pide un reintento, los siguientes de su grupo regresan al
+    queue sin ejecutarse para no adelantarse a él
+    """
+    for i in range(3):
+        await sqs_client.send_message(
+            MessageBody=json.dumps(dict(number=i)), MessageGroupId='a'
+        )
+
+    numbers: List[int] = []
+
+    async def my_task(data: Dict) -> None:
+        numbers.append(data['number'])
+        if numbers == [0]:
+            raise RetryTask
+
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=1,
+        max_retries=3,
+        max_number_of_messages=10,
+        fifo_scheduling=True,
+    )(my_task)()
+
+    assert numbers == [0, 0, 1, 2]
+    resp = await sqs_client.receive_message()
+    assert 'Messages' not in resp
+
+
+@pytest.mark.asyncio
+async def test_fifo_scheduling_retry_across_polls(sqs_client) -> None:
+    """
+    El grupo sigue bloqueado aunque el consumidor reciba mensajes otra vez
+    mientras el primer mensaje se ejecuta
+    """
+    for i in range(2):
+        await sqs_client.send_message(
+            MessageBody=json.dumps(dict(number=i)), MessageGroupId='a'
+        )
+
+    numbers: List[int] = []
+
+    async def my_task(data: Dict) -> None:
+        numbers.append(data['number'])
+        if numbers == [0]:
+            # Más que `wait_time_seconds`, así que hay otro receive
+            await asyncio.sleep(1.2)
+            raise RetryTask
+
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=2,
+        max_retries=3,
+        max_number_of_messages=10,
+        fifo_scheduling=True,
+    )(my_task)()
+
+    assert numbers == [0, 0, 1]
+    resp = await sqs_client.receive_message()
+    assert 'Messages' not in resp
+
+
+@pytest.mark.asyncio
+async def test_rate_limit(sqs_client) -> None:
+    """
+    Con `rate_limit=2` y una ráfaga inicial de 2 mensajes, 5 mensajes
+    tardan al menos 1.5 segundos en ejecutarse
+    """
+    for i in range(5):
+        await sqs_client.send_message(
+            MessageBody=json.dumps(dict(number=i)), MessageGroupId=str(i)
+        )
+
+    start_times = []
+
+    async def my_task(data: Dict) -> None:
+        start_times.append(dt.datetime.now())
+
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=5,
+        max_number_of_messages=10,
+        rate_limit=2,
+    )(my_task)()
+
+    assert len(start_times) == 5
+    assert start_times[-1] - start_times[0] >= dt.timedelta(seconds=1.4)
+    resp = await sqs_client.receive_message()
+    assert 'Messages' not in resp
+
+
+@pytest.mark.asyncio
+async def test_batch_size(sqs_client) -> None:
+    """
+    En modo batch el task recibe listas de a lo más `batch_size` mensajes y
+    el último batch incompleto se envía al pasar `batch_window`
+    """
+    for i in range(5):
+        await sqs_client.send_message(
+            MessageBody=json.dumps(dict(number=i)), MessageGroupId=str(i)
+        )
+
+    batches = []
+
+    async def my_task(numbers: List[Dict]) -> None:
+        batches.append([n['number'] for n in numbers])
+
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=5,
+        batch_size=2,
+        batch_window=0.1,
+    )(my_task)()
+
+    assert sorted(n for b in batches for n in b) == list(range(5))
+    assert all(len(b) <= 2 for b in batches)
+    resp = await sqs_client.receive_message()
+    assert 'Messages' not in resp
+
+
+def test_batch_size_with_fifo_scheduling() -> None:
+    with pytest.raises(ValueError):
+        task(queue_url='queue', batch_size=2, fifo_scheduling=True)
+
+
+@pytest.mark.asyncio
+async def test_adaptive_concurrency(sqs_client) -> None:
+    """
+    Con tasks sanos el límite de concurrencia sube desde `initial_limit`
+    """
+    for i in range(5):
+        await sqs_client.send_message(
+            MessageBody=json.dumps(dict(number=i)), MessageGroupId=str(i)
+        )
+
+    async def my_task(data: Dict) -> None:
+        await asyncio.sleep(0.01)
+
+    adaptive = AdaptiveConcurrency(max_limit=10)
+    metrics = InMemoryMetrics()
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=5,
+        metrics=metrics,
+        adaptive_concurrency=adaptive,
+    )(my_task)()
+
+    assert metrics.outcomes[TaskOutcome.ok] == 5
+    assert adaptive.limit > 1
+    assert metrics.concurrency_limit == adaptive.limit
+
+
+@pytest.mark.asyncio
+async def test_timeout(sqs_client) -> None:
+    """
+    El task que excede `timeout` se cancela y su mensaje se libera de
+    inmediato. Al agotar los reintentos se envía a `dead_letter_sink`
+    """
+    await sqs_client.send_message(
+        MessageBody=json.dumps(dict(id='abc123')), MessageGroupId='1234'
+    )
+
+    cancelled = 0
+
+    async def my_task(data: Dict) -> None:
+        nonlocal cancelled
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled += 1
+            raise
+
+    sink = InMemorySink()
+    metrics = InMemoryMetrics()
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=30,
+        max_retries=1,
+        metrics=metrics,
+        dead_letter_sink=sink,
+        timeout=0.1,
+    )(my_task)()
+
+    assert cancelled == 2
+    assert metrics.outcomes[TaskOutcome.timeout] == 2
+    assert [d.reason for d in sink.dead_letters] == [FailureReason.timeout]
+    resp = await sqs_client.receive_message()
+    assert 'Messages' not in resp
+
+
+@pytest.mark.asyncio
+async def test_timeout_backoff() -> None:
+    sqs = AsyncMock()
+
+    async def my_task(data: Dict) -> None:
+        await asyncio.sleep(10)
+
+    outcome = await run_task(
+        my_task,
+        dict(id='abc123'),
+        sqs,
+        'queue',
+        'handle',
+        message_receive_count=1,
+        max_retries=3,
+        timeout=0.01,
+        timeout_backoff=BackoffPolicy(base=5, jitter=False),
+    )
+    assert outcome is TaskOutcome.timeout
+    sqs.change_message_visibility.assert_awaited_once_with(
+        QueueUrl='queue', ReceiptHandle='handle', VisibilityTimeout=5
+    )
+    sqs.delete_message.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('timeout', [None, 10])
+async def test_task_raises_timeout_error(timeout: Optional[float]) -> None:
+    """
+    El `TimeoutError` que lanza el propio task es un error, no un timeout
+    """
+    sqs = AsyncMock()
+
+    async def my_task(data: Dict) -> None:
+        raise asyncio.TimeoutError
+
+    metrics = InMemoryMetrics()
+    with pytest.raises(asyncio.TimeoutError):
+        await run_task(
+            my_task,
+            dict(id='abc123'),
+            sqs,
+            'queue',
+            'handle',
+            message_receive_count=1,
+            max_retries=3,
+            metrics=metrics,
+            timeout=timeout,
+        )
+    assert metrics.outcomes[TaskOutcome.error] == 1
+    assert metrics.outcomes[TaskOutcome.timeout] == 0
+    sqs.change_message_visibility.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker(sqs_client) -> None:
+    """
+    Al abrirse el circuito los mensajes que no han empezado regresan al
+    queue sin gastar sus reintentos y se dejan de recibir mensajes
+    """
+    for i in range(5):
+        await sqs_client.send_message(
+            MessageBody=json.dumps(dict(number=i)), MessageGroupId=str(i)
+        )
+
+    calls = 0
+
+    async def my_task(data: Dict) -> None:
+        nonlocal calls
+        calls += 1
+        raise RetryTask
+
+    breaker = CircuitBreaker(window=2, min_calls=2, reset_timeout=60)
+    task_ = task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=30,
+        max_retries=10,
+        max_concurrent_tasks=1,
+        max_number_of_messages=5,
+        circuit_breaker=breaker,
+    )(my_task)
+    consumer = asyncio.create_task(task_())
+    await asyncio.sleep(2)
+    assert calls == 2
+    assert breaker.state is CircuitState.open
+    consumer.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await consumer
+
+    # Los 3 mensajes que no se ejecutaron están visibles de nuevo
+    resp = await sqs_client.receive_message(MaxNumberOfMessages=10)
+    assert len(resp['Messages']) == 3
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_half_open_invalid_json(sqs_client) -> None:
+    """
+    Un mensaje descartado en medio abierto no gasta el task de prueba, así
+    que el siguiente mensaje se ejecuta y cierra el circuito
+    """
+    await sqs_client.send_message(
+        MessageBody='{"invalid":', MessageGroupId='1'
+    )
+    await sqs_client.send_message(
+        MessageBody=json.dumps(dict(number=1)), MessageGroupId='2'
+    )
+
+    breaker = CircuitBreaker(window=1, min_calls=1, reset_timeout=0.1)
+    breaker.record(False)
+    await asyncio.sleep(0.1)
+    assert breaker.state is CircuitState.half_open
+
+    async_mock_function = AsyncMock(return_value=None)
+
+    async def my_task(data: Dict) -> None:
+        await async_mock_function(data)
+
+    task_ = task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=30,
+        circuit_breaker=breaker,
+    )(my_task)
+    await asyncio.wait_for(task_(), timeout=10)
+    async_mock_function.assert_called_once_with(dict(number=1))
+    assert breaker.state is CircuitState.closed
+
+
+@pytest.mark.asyncio
+async def test_max_inflight_bytes(sqs_client) -> None:
+    """
+    Con un presupuesto menor al tamaño de un mensaje no se reciben más
+    mensajes hasta que termina el task en vuelo
+    """
+    for i in range(3):
+        await sqs_client.send_message(
+            MessageBody=json.dumps(dict(number=i, data='x' * 100)),
+            MessageGroupId=str(i),
+        )
+
+    running = 0
+    max_running = 0
+
+    async def my_task(data: Dict) -> None:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(running, max_running)
+        await asyncio.sleep(0.1)
+        running -= 1
+
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=5,
+        max_concurrent_tasks=5,
+        max_inflight_bytes=50,
+    )(my_task)()
+
+    assert max_running == 1
+    resp = await sqs_client.receive_message()
+    assert 'Messages' not in resp
+
+
+@pytest.mark.asyncio
+async def test_max_inflight_bytes_counts_bytes(sqs_client) -> None:
+    """El tamaño del body se mide en bytes de UTF-8, no en caracteres"""
+    for i in range(2):
+        await sqs_client.send_message(
+            MessageBody=json.dumps(
+                dict(number=i, data='ñ' * 30), ensure_ascii=False
+            ),
+            MessageGroupId=str(i),
+        )
+
+    running = 0
+    max_running = 0
+
+    async def my_task(data: Dict) -> None:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(running, max_running)
+        await asyncio.sleep(0.1)
+        running -= 1
+
+    # Cada body tiene 55 caracteres y 85 bytes
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=5,
+        max_concurrent_tasks=5,
+        max_inflight_bytes=70,
+    )(my_task)()
+
+    assert max_running == 1
+
+
+@pytest.mark.asyncio
+async def test_claim_check(sqs_client, tmp_path) -> None:
+    claim_check = ClaimCheck(LocalBlobStore(str(tmp_path)), threshold=100)
+    big = dict(data='x' * 1000)
+    async with SqsClient(
+        sqs_client.queue_url, CORE_QUEUE_REGION, claim_check=claim_check
+    ) as sqs:
+        await sqs.send_message(big)
+        await sqs.send_message(dict(data='small'))
+    assert len(list(tmp_path.iterdir())) == 1
+
+    received = []
+
+    async def my_task(data: Dict) -> None:
+        received.append(data)
+
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=1,
+        max_number_of_messages=10,
+        claim_check=claim_check,
+    )(my_task)()
+
+    assert sorted(received, key=lambda d: len(d['data'])) == [
+        dict(data='small'),
+        big,
+    ]
+    # El blob se borra junto con el mensaje
+    assert list(tmp_path.iterdir()) == []
+    resp = await sqs_client.receive_message()
+    assert 'Messages' not in resp
+
+
+@pytest.mark.asyncio
+async def test_claim_check_send_errors(sqs_client, tmp_path) -> None:
+    """Si el mensaje no se envía su blob se borra"""
+    store = LocalBlobStore(str(tmp_path))
+    claim_check = ClaimCheck(store, threshold=100)
+    big = dict(data='x' * 1000)
+    invalid = ClientError(
+        dict(Error=dict(Code='InvalidParameterValue')), 'SendMessage'
+    )
+    async with SqsClient(
+        sqs_client.queue_url, CORE_QUEUE_REGION, claim_check=claim_check
+    ) as sqs:
+        with patch.object(
+            sqs._sqs, 'send_message', AsyncMock(side_effect=invalid)
+        ):
+            with pytest.raises(ClientError):
+                await sqs.send_message(big)
+        assert list(tmp_path.iterdir()) == []
+
+        # Si falla uno de los blobs no se envía ningún mensaje
+        put = store.put
+        puts = 0
+
+        async def flaky_put(key: str, data: bytes) -> None:
+            nonlocal puts
+            puts += 1
+            if puts == 2:
+                raise ConnectionError
+            await put(key, data)
+
+        with patch.object(store, 'put', flaky_put):
+            with pytest.raises(ConnectionError):
+                await sqs.send_messages([big, big])
+        assert puts == 2
+    assert list(tmp_path.iterdir()) == []
+    resp = await sqs_client.receive_message()
+    assert 'Messages' not in resp
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('blob', [None, b'not json'])
+async def test_claim_check_unreadable_blob(
+    sqs_client, tmp_path, blob: Optional[bytes]
+) -> None:
+    store = LocalBlobStore(str(tmp_path))
+    claim_check = ClaimCheck(store, threshold=100)
+    if blob:
+        await store.put('key', zlib.compress(blob))
+    await sqs_client.send_message(
+        MessageBody=json.dumps({POINTER_KEY: 'key'}),
+        MessageGroupId='1234',
+    )
+    async_mock_function = AsyncMock()
+    metrics = InMemoryMetrics()
+
+    async def my_task(data: Dict) -> None:
+        await async_mock_function(data)
+
+    await task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=1,
+        max_retries=10,
+        metrics=metrics,
+        claim_check=claim_check,
+    )(my_task)()
+
+    async_mock_function.assert_not_called()
+    assert metrics.outcomes[TaskOutcome.error] >= 1
+    # El mensaje no se borra para reintentarse
+    await asyncio.sleep(1)
+    resp = await sqs_client.receive_message()
+    assert 'Messages' in resp
+
+
+@pytest.mark.asyncio
+async def test_claim_check_duplicate(sqs_client, tmp_path) -> None:
+    """
+    Un duplicado cuyo blob ya se borró con el original se envía a
+    `dead_letter_sink` al agotar sus reintentos
+    """
+    claim_check = ClaimCheck(LocalBlobStore(str(tmp_path)), threshold=100)
+    big = dict(data='x' * 1000)
+    async with SqsClient(
+        sqs_client.queue_url, CORE_QUEUE_REGION, claim_check=claim_check
+    ) as sqs:
+        await sqs.send_message(big)
+    pointer = await sqs_client.receive_message(VisibilityTimeout=0)
+    duplicate = pointer['Messages'][0]['Body']
+
+    async_mock_function = AsyncMock()
+
+    async def my_task(data: Dict) -> None:
+        await async_mock_function(data)
+
+    sink = InMemorySink()
+    consumer = task(
+        queue_url=sqs_client.queue_url,
+        region_name=CORE_QUEUE_REGION,
+        wait_time_seconds=1,
+        visibility_timeout=1,
+        dead_letter_sink=sink,
+        claim_check=claim_check,
+    )(my_task)
+    await consumer()
+    async_mock_function.assert_called_once_with(big)
+    assert list(tmp_path.iterdir()) == []
+
+    await sqs_client.send_message(MessageBody=duplicate, MessageGroupId='1')
+    await consumer()
+    async_mock_function.assert_called_once()
+    assert [d.reason for d in sink.dead_letters] == [FailureReason.claim_check]
+    assert sink.dead_letters[0].body == duplicate
+    resp = await sqs_client.receive_message()
+    assert 'Messages' not in resp
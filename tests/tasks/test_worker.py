@@ -0,0 +1,132 @@
+import asyncio
+import os
+import signal
+import sys
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from fast_agave.cli import main
+from fast_agave.tasks.backoff import BackoffPolicy
+from fast_agave.tasks.worker import Supervisor, load_tasks, run_tasks
+
+
+async def consumer() -> None:
+    await asyncio.sleep(10)
+
+
+def crashing_worker(target: str) -> None:
+    sys.exit(1)
+
+
+def test_load_tasks() -> None:
+    tasks = load_tasks('tests.tasks.test_worker:consumer, crashing_worker')
+    assert tasks == [consumer, crashing_worker]
+
+    with pytest.raises(ValueError):
+        load_tasks('tests.tasks.test_worker')
+    with pytest.raises(ValueError):
+        load_tasks('tests.tasks.test_worker:unknown')
+    with pytest.raises(ImportError):
+        load_tasks('unknown_module:task')
+
+
+def test_load_tasks_from_cwd(tmp_path, monkeypatch) -> None:
+    # Como con el script `fast-agave`, el directorio actual no está en
+    # `sys.path`
+    (tmp_path / 'cwd_tasks.py').write_text('async def t():\n    pass\n')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(
+        sys, 'path', [p for p in sys.path if p not in ('', str(tmp_path))]
+    )
+    monkeypatch.delitem(sys.modules, 'cwd_tasks', raising=False)
+
+    (task_func,) = load_tasks('cwd_tasks:t')
+    assert task_func.__module__ == 'cwd_tasks'
+    assert sys.path[0] == str(tmp_path)
+
+
+@pytest.mark.asyncio
+async def test_run_tasks_shutdown_signal() -> None:
+    loop = asyncio.get_running_loop()
+    loop.call_later(0.1, os.kill, os.getpid(), signal.SIGTERM)
+    # Ambos consumidores se cancelan al recibir la señal
+    await asyncio.wait_for(run_tasks([consumer, consumer]), 2)
+
+
+@pytest.mark.asyncio
+async def test_run_tasks_second_signal() -> None:
+    drained = []
+
+    async def draining_consumer() -> None:
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            # Simula `drain_tasks`: la segunda señal no debe interrumpirlo
+            await asyncio.sleep(0.3)
+            drained.append(True)
+            raise
+
+    loop = asyncio.get_running_loop()
+    loop.call_later(0.1, os.kill, os.getpid(), signal.SIGINT)
+    loop.call_later(0.2, os.kill, os.getpid(), signal.SIGTERM)
+    await asyncio.wait_for(run_tasks([draining_consumer]), 2)
+    assert drained == [True]
+
+
+@pytest.mark.asyncio
+async def test_run_tasks_error() -> None:
+    async def failing_consumer() -> None:
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        await asyncio.wait_for(run_tasks([consumer, failing_consumer]), 2)
+
+
+def test_supervisor_restarts_workers() -> None:
+    supervisor = Supervisor(
+        'tests.tasks.test_worker:consumer',
+        processes=2,
+        restart_backoff=BackoffPolicy(base=0.01, cap=0.05, jitter=False),
+        worker=crashing_worker,
+    )
+    timer = threading.Timer(2, supervisor.stop)
+    timer.start()
+    with patch.object(supervisor, 'start', wraps=supervisor.start) as start:
+        supervisor.run()
+    timer.join()
+    # Los 2 procesos iniciales más al menos un reinicio de cada uno
+    assert start.call_count >= 4
+    assert signal.getsignal(signal.SIGTERM) is not supervisor.stop
+
+
+def test_supervisor_stop_during_startup() -> None:
+    supervisor = Supervisor('tests.tasks.test_worker:consumer', processes=3)
+    start = supervisor.start
+
+    def start_and_stop(slot: int) -> None:
+        start(slot)
+        supervisor.stop()
+
+    with patch.object(supervisor, 'start', side_effect=start_and_stop):
+        supervisor.run()
+    started = [p for p in supervisor._workers if p]
+    assert len(started) == 1
+    assert not started[0].is_alive()
+
+
+def test_cli() -> None:
+    with patch('fast_agave.cli.Supervisor') as supervisor:
+        main(
+            ['worker', 'tests.tasks.test_worker:consumer', '--processes', '3']
+        )
+    supervisor.assert_called_once_with('tests.tasks.test_worker:consumer', 3)
+    supervisor.return_value.run.assert_called_once()
+
+    with pytest.raises(SystemExit):
+        main(['worker', 'tests.tasks.test_worker:unknown'])
+    with pytest.raises(SystemExit):
+        main(
+            ['worker', 'tests.tasks.test_worker:consumer', '--processes', '0']
+        )